@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - CATÁLOGO DE PRODUCTOS
+# Carga la colección `productos` una vez, indexa las palabras clave de cada
+# producto activo y atiende las búsquedas desde memoria.
+# ==========================================================
+import os
+import time
+import threading
+from logging import getLogger
+from bot_storage import get_storage
+from bot_intents import KeywordMatcher
+from bot_districts import fold_text
+from bot_metrics import metrics
+
+logger = getLogger(__name__)
+
+CATALOG_TTL_SECONDS = float(os.environ.get('CATALOG_TTL_SECONDS', '300'))
+# Producto histórico: si no tiene `palabras_clave` en Firestore usa las KEYWORDS_GIRASOL de index.py.
+DEFAULT_PRODUCT_ID = "collar-girasol-radiant-01"
+
+
+class ProductCatalog:
+    def __init__(self, ttl=CATALOG_TTL_SECONDS):
+        self.ttl = ttl
+        self.products = {}       # product_id -> dict (incluye inactivos, para sesiones ya abiertas)
+        self.keyword_index = []  # [(palabra_clave, product_id)]
+        self.matcher = KeywordMatcher([])
+        self.default_keywords = ()
+        self.version = None
+        self.loaded_at = None
+        self._lock = threading.Lock()
+        self.stats = {"cargas": 0, "verificaciones_version": 0}
+
+    def _read_version(self, storage):
+        # `configuracion/catalogo.version` es opcional: si existe, al vencer el TTL solo se
+        # recarga la colección cuando cambió la versión.
+        self.stats["verificaciones_version"] += 1
+        return storage.catalog_version()
+
+    def _build_index(self, products):
+        index = []
+        for product_id, data in products.items():
+            if not data.get('activo'):
+                continue
+            keywords = data.get('palabras_clave') or (self.default_keywords if product_id == DEFAULT_PRODUCT_ID else [])
+            index.extend((kw, product_id) for kw in keywords if kw)
+        return index
+
+    def _set_index(self, index):
+        self.keyword_index, self.matcher = index, KeywordMatcher(index)
+
+    def _load(self, storage):
+        products = storage.list_products()
+        self.products = products
+        self._set_index(self._build_index(products))
+        self.stats["cargas"] += 1
+        logger.info(f"[Catálogo] {len(products)} productos cargados, {len(self.keyword_index)} palabras clave indexadas.")
+
+    def refresh(self, default_keywords=(), force=False):
+        if default_keywords and tuple(default_keywords) != self.default_keywords:
+            with self._lock:
+                self.default_keywords = tuple(default_keywords)
+                self._set_index(self._build_index(self.products))
+        now = time.monotonic()
+        if not force and self.loaded_at is not None and now - self.loaded_at < self.ttl:
+            return
+        with self._lock:
+            if not force and self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl:
+                return
+            storage = get_storage()
+            if not storage: return
+            try:
+                version = self._read_version(storage)
+                if force or self.loaded_at is None or version is None or version != self.version:
+                    self._load(storage)
+                self.version, self.loaded_at = version, time.monotonic()
+            except Exception as e:
+                # Con datos previos seguimos sirviendo la versión anterior.
+                logger.error(f"[Catálogo] Error recargando productos: {e}")
+                if self.loaded_at is not None:
+                    self.loaded_at = time.monotonic()
+
+    def match(self, text, default_keywords=()):
+        self.refresh(default_keywords)
+        for product_id in self.matcher.labels(fold_text(text)):
+            return product_id, self.products[product_id]
+        return None, None
+
+    def get(self, product_id, default_keywords=()):
+        self.refresh(default_keywords)
+        return self.products.get(product_id)
+
+    def invalidate(self):
+        self.loaded_at = None
+
+
+catalog = ProductCatalog()
+metrics.add_stats('bot_catalogo', lambda: catalog.stats)
+
+def find_product(text, default_keywords=()):
+    return catalog.match(text, default_keywords)
+
+def get_product(product_id):
+    return catalog.get(product_id)
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - AGRUPACIÓN DE MENSAJES POR TURNO
+# Mientras se atiende un mensaje entrante, lo que se envía a cada destinatario
+# se acumula y al final del turno se manda el mínimo de requests:
+#   - textos seguidos se unen en uno (hasta el límite de WhatsApp),
+#   - las preguntas Sí/No y oferta/continuar pasan a mensajes con botones,
+#   - una imagen seguida de texto va como imagen con pie de foto (o de
+#     encabezado del mensaje con botones).
+# Los mensajes marcados con coalesce=False (p. ej. el comando para copiar
+# del admin) se envían tal cual.
+# ==========================================================
+import os
+import re
+import threading
+from collections import OrderedDict
+from logging import getLogger
+from bot_metrics import metrics
+
+logger = getLogger(__name__)
+
+OUTBOUND_COALESCE = os.environ.get('OUTBOUND_COALESCE', '1') != '0'
+TEXT_LIMIT = 4096
+CAPTION_LIMIT = 1024
+BUTTON_BODY_LIMIT = 1024
+SAVINGS_TRACKED = 5000
+
+# (patrón sobre el texto, quitar la coincidencia del cuerpo, botones (id, título))
+BUTTON_PROMPTS = (
+    (re.compile(r'\s*\(S[íi]/No\)\s*$'), True, (("si", "Sí"), ("no", "No"))),
+    (re.compile(r'Escribe \*oferta\*.*\n.*Escribe \*continuar\*', re.DOTALL), False,
+     (("oferta", "Oferta"), ("continuar", "Continuar"))),
+)
+
+
+class _Item:
+    __slots__ = ('kind', 'text', 'link', 'payload', 'delay', 'callbacks', 'coalesce', 'count')
+
+    def __init__(self, payload, delay, on_done, coalesce):
+        self.kind = payload.get('type') if payload.get('type') in ('text', 'image') else 'other'
+        self.text = payload.get('text', {}).get('body') if self.kind == 'text' else None
+        self.link = payload.get('image', {}).get('link') if self.kind == 'image' and not payload['image'].get('caption') else None
+        if self.kind == 'image' and self.link is None:
+            self.kind = 'other'
+        self.payload = payload
+        self.delay = delay
+        self.callbacks = [on_done] if on_done else []
+        self.coalesce = coalesce
+        self.count = 1
+
+    def absorb(self, other):
+        self.callbacks += other.callbacks
+        self.count += other.count
+
+
+def _buttons_for(text):
+    for pattern, strip, buttons in BUTTON_PROMPTS:
+        if match := pattern.search(text):
+            body = (text[:match.start()] + text[match.end():]).strip() if strip else text
+            if body and len(body) <= BUTTON_BODY_LIMIT:
+                return body, buttons
+    return None
+
+
+def coalesce_messages(items):
+    # Textos contiguos -> uno solo.
+    merged = []
+    for item in items:
+        prev = merged[-1] if merged else None
+        if (prev and prev.coalesce and item.coalesce and prev.kind == item.kind == 'text'
+                and len(prev.text) + 2 + len(item.text) <= TEXT_LIMIT):
+            prev.text = f"{prev.text}\n\n{item.text}"
+            prev.absorb(item)
+            continue
+        merged.append(item)
+
+    # Preguntas con respuesta fija -> botones; imagen previa -> encabezado o pie de foto.
+    result = []
+    for item in merged:
+        prev = result[-1] if result else None
+        image = prev if prev and prev.kind == 'image' and prev.coalesce and item.coalesce else None
+        if item.kind == 'text' and item.coalesce and (buttons := _buttons_for(item.text)):
+            body, choices = buttons
+            interactive = {"type": "button", "body": {"text": body}, "action": {"buttons": [
+                {"type": "reply", "reply": {"id": bid, "title": title}} for bid, title in choices]}}
+            if image:
+                interactive["header"] = {"type": "image", "image": {"link": image.link}}
+                image.absorb(item)
+                image.kind, image.payload = 'built', {"type": "interactive", "interactive": interactive}
+                continue
+            item.kind, item.payload = 'built', {"type": "interactive", "interactive": interactive}
+        elif item.kind == 'text' and image and len(item.text) <= CAPTION_LIMIT:
+            image.absorb(item)
+            image.kind, image.payload = 'built', {"type": "image", "image": {"link": image.link, "caption": item.text}}
+            continue
+        result.append(item)
+
+    for item in result:
+        if item.kind == 'text':
+            item.payload = {"type": "text", "text": {"body": item.text}}
+    return result
+
+
+class MessageCoalescer:
+    def __init__(self, enabled=OUTBOUND_COALESCE):
+        self.enabled = enabled
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._saved_by_customer = OrderedDict()  # wa_id -> envíos ahorrados en la conversación
+        self._sales = set()
+        self.stats = {"mensajes": 0, "envios": 0, "ahorrados": 0, "ventas": 0, "ahorrados_en_ventas": 0}
+
+    def collect(self, schedule_fn):
+        return _TurnOutbox(self, schedule_fn)
+
+    def add(self, to_number, payload, delay=0, on_done=None, coalesce=True):
+        # Devuelve False si no hay un turno activo en este hilo (el llamador envía directo).
+        if not self.enabled or (outbox := getattr(self._local, 'outbox', None)) is None:
+            return False
+        outbox.pending.setdefault(to_number, []).append(_Item(payload, delay, on_done, coalesce))
+        return True
+
+    def sale_completed(self, wa_id):
+        # Al cerrar el turno de la venta se reportan los envíos ahorrados en toda la conversación.
+        with self._lock:
+            self._sales.add(wa_id)
+
+    def _record(self, to_number, original, sent):
+        saved = original - sent
+        with self._lock:
+            self.stats["mensajes"] += original
+            self.stats["envios"] += sent
+            self.stats["ahorrados"] += saved
+            total = self._saved_by_customer.pop(to_number, 0) + saved
+            if to_number in self._sales:
+                self._sales.discard(to_number)
+                self.stats["ventas"] += 1
+                self.stats["ahorrados_en_ventas"] += total
+                metrics.observe('bot_envios_ahorrados_por_venta', total, buckets=(0, 2, 4, 6, 8, 10, 15, 20))
+                logger.info(f"[Agrupación] Venta de {to_number}: {total} envíos ahorrados en la conversación.")
+            elif total:
+                self._saved_by_customer[to_number] = total
+                while len(self._saved_by_customer) > SAVINGS_TRACKED:
+                    self._saved_by_customer.popitem(last=False)
+
+
+class _TurnOutbox:
+    def __init__(self, coalescer, schedule_fn):
+        self.coalescer = coalescer
+        self.schedule_fn = schedule_fn
+        self.pending = {}  # to_number -> [_Item] en orden
+        self.outer = None
+
+    def __enter__(self):
+        local = self.coalescer._local
+        self.outer, local.outbox = getattr(local, 'outbox', None), self
+        return self
+
+    def __exit__(self, *exc):
+        self.coalescer._local.outbox = self.outer
+        self.flush()
+        return False
+
+    def flush(self):
+        pending, self.pending = self.pending, {}
+        for to_number, items in pending.items():
+            messages = coalesce_messages(items)
+            for message in messages:
+                callbacks = message.callbacks
+                on_done = (lambda ok, cbs=callbacks: [cb(ok) for cb in cbs]) if len(callbacks) > 1 else \
+                    (callbacks[0] if callbacks else None)
+                try:
+                    self.schedule_fn(to_number, message.payload, message.delay, on_done)
+                except Exception as e:
+                    logger.error(f"[Agrupación] Error encolando mensaje para {to_number}: {e}")
+            self.coalescer._record(to_number, len(items), len(messages))
+
+
+coalescer = MessageCoalescer()
+metrics.add_stats('bot_agrupacion', lambda: coalescer.stats)
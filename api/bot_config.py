@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - CONFIGURACIÓN EN CALIENTE
+# `configuracion/reglas_envio` y `configuracion/respuestas_faq` se vuelven a
+# leer (un solo get_all) cuando vence el TTL, o llegan por snapshot listener.
+# Cada cambio construye un ConfigSnapshot inmutable y precompilado que se
+# intercambia de forma atómica; los handlers nunca reprocesan la config.
+# ==========================================================
+import os
+import time
+import threading
+from types import MappingProxyType
+from logging import getLogger
+from bot_storage import get_storage
+from bot_districts import get_district_resolver
+from bot_intents import get_intent_classifier
+
+logger = getLogger(__name__)
+
+CONFIG_TTL_SECONDS = float(os.environ.get('CONFIG_TTL_SECONDS', '60'))
+# En servidores de larga vida se puede escuchar los cambios en vez de sondear.
+CONFIG_LISTEN = os.environ.get('CONFIG_LISTEN', '0') == '1'
+CONFIG_DOCS = ('reglas_envio', 'respuestas_faq')
+
+
+class ConfigSnapshot:
+    __slots__ = ('business_rules', 'faq_responses', 'faq_keyword_map', 'cancel_words', 'versions',
+                 'district_resolver', 'adelanto_shalom', 'adelanto_lima_delivery', 'yape_numero',
+                 '_classifiers', '__weakref__')
+
+    def __init__(self, business_rules, faq_responses, faq_keyword_map, cancel_words, versions=(None, None)):
+        self.business_rules = MappingProxyType(dict(business_rules))
+        self.faq_responses = MappingProxyType(dict(faq_responses))
+        self.faq_keyword_map = faq_keyword_map
+        self.cancel_words = cancel_words
+        self.versions = versions
+        self.district_resolver = get_district_resolver(self.business_rules)
+        self.adelanto_shalom = float(business_rules.get('adelanto_shalom', 20))
+        self.adelanto_lima_delivery = float(business_rules.get('adelanto_lima_delivery', 10))
+        self.yape_numero = business_rules.get('yape_numero', 'No configurado')
+        self._classifiers = {}
+
+    def classifier(self, product_keywords=()):
+        # El catálogo cambia por su cuenta: un clasificador por versión del índice de productos.
+        key = id(product_keywords)
+        if (cached := self._classifiers.get(key)) and cached[0] is product_keywords:
+            return cached[1]
+        classifier = get_intent_classifier(self.faq_keyword_map, self.cancel_words, product_keywords)
+        self._classifiers = {key: (product_keywords, classifier)}
+        return classifier
+
+
+class ConfigService:
+    def __init__(self, faq_keyword_map, cancel_words, ttl=CONFIG_TTL_SECONDS, listen=CONFIG_LISTEN):
+        self.faq_keyword_map = faq_keyword_map
+        self.cancel_words = cancel_words
+        self.ttl = ttl
+        self.listen = listen
+        self.snapshot = ConfigSnapshot({}, {}, faq_keyword_map, cancel_words)
+        self.checked_at = None
+        self._lock = threading.Lock()
+        self._watches = []
+        self.stats = {"lecturas": 0, "recargas": 0}
+
+    @staticmethod
+    def _version(doc):
+        if not doc.exists:
+            return None
+        return getattr(doc, 'update_time', None) or repr(sorted(doc.to_dict().items()))
+
+    def _apply(self, docs):
+        versions = tuple(self._version(doc) for doc in docs)
+        if versions == self.snapshot.versions:
+            return False
+        rules_doc, faq_doc = docs
+        if not rules_doc.exists:
+            logger.error("❌ Documento de reglas de envío no encontrado.")
+        if not faq_doc.exists:
+            logger.error("❌ Documento de respuestas_faq no encontrado.")
+        # Se construye todo antes del intercambio: los lectores ven la versión vieja o la nueva completa.
+        self.snapshot = ConfigSnapshot(rules_doc.to_dict() if rules_doc.exists else {},
+                                       faq_doc.to_dict() if faq_doc.exists else {},
+                                       self.faq_keyword_map, self.cancel_words, versions)
+        self.stats["recargas"] += 1
+        logger.info("✅ Reglas del negocio y respuestas FAQ cargadas.")
+        return True
+
+    def refresh(self, force=False):
+        with self._lock:
+            if not force and self.checked_at is not None and time.monotonic() - self.checked_at < self.ttl:
+                return self.snapshot
+            storage = get_storage()
+            if not storage: return self.snapshot
+            try:
+                docs = storage.get_config(CONFIG_DOCS)
+                self.stats["lecturas"] += 1
+                self._apply(docs)
+                # Los listeners son de Firestore; con otro almacén solo se sondea.
+                if self.listen and not self._watches and storage.name == 'firestore':
+                    self._start_listeners(storage)
+            except Exception as e:
+                # Se sigue sirviendo la última configuración buena.
+                logger.error(f"❌ Error recargando configuración: {e}")
+            self.checked_at = time.monotonic()
+            return self.snapshot
+
+    def _start_listeners(self, storage):
+        latest = {}
+
+        def on_change(doc_snapshots, changes, read_time):
+            for doc in doc_snapshots:
+                latest[doc.id] = doc
+            if all(name in latest for name in CONFIG_DOCS):
+                with self._lock:
+                    self._apply([latest[name] for name in CONFIG_DOCS])
+                    self.checked_at = time.monotonic()
+
+        self._watches = [ref.on_snapshot(on_change) for ref in storage.config_refs(CONFIG_DOCS)]
+        # Con listener activo el TTL solo actúa como red de seguridad.
+        self.ttl = max(self.ttl, 3600)
+
+    def get(self):
+        if self.checked_at is None or time.monotonic() - self.checked_at >= self.ttl:
+            return self.refresh()
+        return self.snapshot
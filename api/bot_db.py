@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - CONEXIÓN PEREZOSA A FIRESTORE
+# firebase_admin se importa e inicializa en el primer acceso a la base,
+# no al importar index.py: GET / y la verificación del webhook no lo pagan.
+# ==========================================================
+import os
+import json
+import threading
+from logging import getLogger
+from bot_startup import startup_profile
+
+logger = getLogger(__name__)
+
+# firestore | sqlite | memory (ver bot_storage); fuera de Firestore no se inicializa Firebase.
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'firestore')
+
+_db = None
+_initialized = False
+_lock = threading.Lock()
+_ready_callbacks = []
+
+def _initialize():
+    global _db
+    if STORAGE_BACKEND != 'firestore':
+        logger.info(f"Almacenamiento '{STORAGE_BACKEND}': Firestore deshabilitado.")
+        return
+    try:
+        service_account_info_str = os.environ.get('FIREBASE_SERVICE_ACCOUNT_JSON')
+        if not service_account_info_str:
+            logger.error("❌ Variable de entorno FIREBASE_SERVICE_ACCOUNT_JSON no configurada.")
+            return
+        with startup_profile.measure('import:firebase_admin'):
+            import firebase_admin
+            from firebase_admin import credentials, firestore
+        with startup_profile.measure('init:firebase'):
+            cred = credentials.Certificate(json.loads(service_account_info_str))
+            if not firebase_admin._apps:
+                firebase_admin.initialize_app(cred)
+            _db = firestore.client()
+        logger.info("✅ Conexión con Firebase establecida.")
+    except Exception as e:
+        logger.error(f"❌❌❌ ERROR DETALLADO EN INICIALIZACIÓN DE FIREBASE: {e} ❌❌❌")
+
+def get_db():
+    global _initialized
+    if _initialized:
+        return _db
+    with _lock:
+        if not _initialized:
+            _initialize()
+            _initialized = True
+            if _db is not None:
+                # Configuración y catálogo se precargan en paralelo con el resto del primer request.
+                for name, callback in _ready_callbacks:
+                    threading.Thread(target=callback, name=f"precarga-{name}", daemon=True).start()
+    return _db
+
+def on_db_ready(name, callback):
+    _ready_callbacks.append((name, callback))
+
+def override_db(db):
+    # Para benchmarks y pruebas locales con un Firestore falso.
+    global _db, _initialized
+    with _lock:
+        _db, _initialized = db, True
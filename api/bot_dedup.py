@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - IDEMPOTENCIA DEL WEBHOOK
+# Meta reintenta las entregas lentas con el mismo message['id'].
+# Un LRU en memoria corta los repetidos de esta instancia sin tocar la red,
+# y la colección `webhook_mensajes` (con política TTL de Firestore sobre
+# `expira_en`) los detecta entre instancias.
+# ==========================================================
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from logging import getLogger
+from bot_storage import get_storage
+from bot_metrics import metrics
+
+logger = getLogger(__name__)
+
+DEDUP_CACHE_SIZE = int(os.environ.get('DEDUP_CACHE_SIZE', '5000'))
+DEDUP_TTL_HOURS = float(os.environ.get('DEDUP_TTL_HOURS', '24'))
+DEDUP_SHARED_STORE = os.environ.get('DEDUP_SHARED_STORE', '1') != '0'
+
+
+class MessageDeduplicator:
+    def __init__(self, max_size=DEDUP_CACHE_SIZE, ttl_hours=DEDUP_TTL_HOURS, shared=DEDUP_SHARED_STORE):
+        self.max_size = max_size
+        self.ttl = timedelta(hours=ttl_hours)
+        self.shared = shared
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"recibidos": 0, "duplicados_memoria": 0, "duplicados_compartidos": 0}
+
+    def _remember(self, message_id):
+        # Devuelve False si ya estaba.
+        with self._lock:
+            self.stats["recibidos"] += 1
+            if message_id in self._seen:
+                self._seen.move_to_end(message_id)
+                self.stats["duplicados_memoria"] += 1
+                return False
+            self._seen[message_id] = True
+            if len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+            return True
+
+    def _claim_shared(self, message_id):
+        storage = get_storage()
+        if not storage: return True
+        try:
+            # Reserva atómica entre instancias (create() en Firestore, INSERT en SQLite).
+            if storage.claim_message(message_id, datetime.now(timezone.utc) + self.ttl):
+                return True
+            with self._lock:
+                self.stats["duplicados_compartidos"] += 1
+            return False
+        except Exception as e:
+            # Ante un error del almacén preferimos procesar (como antes) a perder un mensaje.
+            logger.error(f"[Dedup] Error registrando {message_id}: {e}")
+            return True
+
+    def claim(self, message_id):
+        if not message_id:
+            return True
+        if not self._remember(message_id):
+            logger.info(f"[Dedup] Reentrega ignorada (memoria): {message_id}")
+            return False
+        if self.shared and not self._claim_shared(message_id):
+            logger.info(f"[Dedup] Reentrega ignorada (compartida): {message_id}")
+            return False
+        return True
+
+    def release(self, message_id):
+        # Deshace la reserva de un mensaje que no se llegó a procesar: su reentrega entra.
+        if not message_id:
+            return
+        with self._lock:
+            self._seen.pop(message_id, None)
+        storage = get_storage()
+        if self.shared and storage:
+            try:
+                storage.release_message(message_id)
+            except Exception as e:
+                logger.error(f"[Dedup] Error liberando {message_id}: {e}")
+
+    def absorbed(self):
+        with self._lock:
+            return self.stats["duplicados_memoria"] + self.stats["duplicados_compartidos"]
+
+
+deduplicator = MessageDeduplicator()
+metrics.add_stats('bot_dedup', lambda: deduplicator.stats)
+
+def is_new_message(message_id):
+    return deduplicator.claim(message_id)
+
+def release_message(message_id):
+    deduplicator.release(message_id)
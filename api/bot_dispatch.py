@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - DESPACHO CONCURRENTE DEL WEBHOOK
+# Un POST de Meta puede traer mensajes de varios clientes. Se agrupan por
+# wa_id: clientes distintos se procesan en paralelo en un pool acotado y los
+# mensajes de un mismo cliente siempre en orden, uno tras otro.
+# Antes de eso, un filtro sobre los bytes crudos descarta los callbacks de
+# estado (sent/delivered/read), que son la mayoría, sin parsear el JSON.
+# ==========================================================
+import os
+import re
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+try:
+    import orjson  # opcional: parser más rápido para los payloads que sí se procesan
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# `"messages": [` fuera de un string (dentro de un texto las comillas van escapadas).
+# Los callbacks de estado traen "field": "messages" pero solo la lista "statuses".
+_MESSAGES_RE = re.compile(rb'"messages"\s*:\s*\[')
+_OBJECT_MARKER = b'"whatsapp_business_account"'
+_LEADING_SPACE_RE = re.compile(rb'[ \t\r\n]*')
+
+# WEBHOOK_WORKERS=1 restaura el recorrido en serie dentro del request.
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', '8'))
+
+
+class WebhookDispatcher:
+    def __init__(self, handler, workers=WEBHOOK_WORKERS):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # Un candado por cliente, vivo mientras tenga mensajes en curso: dos POST
+        # concurrentes con mensajes del mismo cliente tampoco se intercalan.
+        self._user_locks = {}   # wa_id -> [lock, referencias]
+        self._locks_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"lotes": 0, "mensajes": 0, "clientes_max_por_lote": 0,
+                      "payloads": 0, "aceptados": 0, "rechazados_estado": 0, "rechazados_otros": 0}
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="webhook")
+        return self._executor
+
+    def _acquire(self, wa_id):
+        with self._locks_lock:
+            slot = self._user_locks.setdefault(wa_id, [threading.RLock(), 0])
+            slot[1] += 1
+        slot[0].acquire()
+        return slot
+
+    def _release(self, wa_id, slot):
+        slot[0].release()
+        with self._locks_lock:
+            slot[1] -= 1
+            if slot[1] == 0:
+                self._user_locks.pop(wa_id, None)
+
+    def _run_user(self, wa_id, items):
+        # Devuelve cuántos mensajes dejó el handler para la reentrega (los que devolvió False).
+        slot = self._acquire(wa_id)
+        pending = 0
+        try:
+            for message, contacts in items:
+                try:
+                    if self.handler(message, contacts) is False:
+                        pending += 1
+                except Exception as e:
+                    # Un mensaje fallido no detiene los siguientes del mismo cliente.
+                    logger.error(f"[Despacho] Error procesando mensaje de {wa_id}: {e}")
+        finally:
+            self._release(wa_id, slot)
+        return pending
+
+    def run_exclusive(self, wa_id, fn):
+        # Para trabajo diferido de un cliente (p. ej. su comprobante): no se intercala con sus mensajes.
+        slot = self._acquire(wa_id)
+        try:
+            return fn()
+        finally:
+            self._release(wa_id, slot)
+
+    @staticmethod
+    def group_by_user(payload):
+        # {wa_id: [(message, names), ...]} en el orden en que llegaron; names = {wa_id: nombre}
+        # se arma una vez por cambio en lugar de buscar en `contacts` por cada mensaje.
+        groups = {}
+        for entry in payload.get('entry', []):
+            for change in entry.get('changes', []):
+                if change.get('field') == 'messages' and (value := change.get('value', {})):
+                    if not (messages := value.get('messages')):
+                        continue
+                    names = {c.get('wa_id'): name for c in value.get('contacts') or []
+                             if (name := c.get('profile', {}).get('name'))}
+                    for message in messages:
+                        groups.setdefault(message.get('from'), []).append((message, names))
+        return groups
+
+    @staticmethod
+    def looks_like_object(body):
+        # Solo el primer y el último byte no blanco: un cuerpo vacío o cortado no pasa por un 200.
+        start, end = _LEADING_SPACE_RE.match(body).end(), len(body)
+        while end > start and body[end - 1] in b' \t\r\n':
+            end -= 1
+        return body[start:start + 1] == b'{' and body[end - 1:end] == b'}'
+
+    @staticmethod
+    def prefilter(body):
+        # 'mensajes', 'estado' (solo statuses) u 'otro' (otro objeto o campo), sin parsear el JSON.
+        if _OBJECT_MARKER not in body:
+            return 'otro'
+        for match in _MESSAGES_RE.finditer(body):
+            if body[match.start() - 1:match.start()] != b'\\':
+                return 'mensajes'
+        return 'estado' if b'"statuses"' in body else 'otro'
+
+    def acceptance(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["tasa_aceptacion"] = stats["aceptados"] / stats["payloads"] if stats["payloads"] else 0.0
+        return stats
+
+    def dispatch_raw(self, body):
+        # Cuerpo crudo del POST de Meta. Lanza ValueError si no es un objeto JSON: vacío o sin
+        # llaves de apertura y cierre siempre; los demás errores de sintaxis, solo si el cuerpo
+        # trae mensajes (los otros no se parsean). Como dispatch(), devuelve los mensajes que
+        # quedaron para la reentrega.
+        if not self.looks_like_object(body):
+            raise ValueError("el cuerpo no es un objeto JSON")
+        kind = self.prefilter(body)
+        with self._stats_lock:
+            self.stats["payloads"] += 1
+            if kind != 'mensajes':
+                self.stats["rechazados_estado" if kind == 'estado' else "rechazados_otros"] += 1
+        if kind != 'mensajes':
+            return 0
+        payload = _loads(body)
+        if not isinstance(payload, dict) or payload.get('object') != 'whatsapp_business_account':
+            with self._stats_lock:
+                self.stats["rechazados_otros"] += 1
+            return 0
+        with self._stats_lock:
+            self.stats["aceptados"] += 1
+        return self.dispatch(payload)
+
+    def dispatch(self, payload):
+        groups = self.group_by_user(payload)
+        if not groups:
+            return 0
+        with self._stats_lock:
+            self.stats["lotes"] += 1
+            self.stats["mensajes"] += sum(len(items) for items in groups.values())
+            self.stats["clientes_max_por_lote"] = max(self.stats["clientes_max_por_lote"], len(groups))
+        if self.workers == 1 or len(groups) == 1:
+            return sum(self._run_user(wa_id, items) for wa_id, items in groups.items())
+        # Se espera a todos antes de responder: en Vercel el proceso se congela tras la respuesta.
+        executor = self._get_executor()
+        futures = [executor.submit(self._run_user, wa_id, items) for wa_id, items in groups.items()]
+        wait(futures)
+        return sum(f.result() for f in futures)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - RESOLUCIÓN DE DISTRITOS DE LIMA
+# Se construye una vez a partir de BUSINESS_RULES: nombres normalizados,
+# abreviaturas en un solo patrón compilado y búsquedas exactas/prefijo en memoria.
+# Como la búsqueda anterior por subcadena, una palabra que solo aparece en un
+# distrito lo identifica ("lima" -> Cercado de Lima).
+# ==========================================================
+import re
+import bisect
+import threading
+import unicodedata
+
+_FILLER_RE = re.compile(r'\b(?:soy de|vivo en|estoy en|es en|de)\b', re.IGNORECASE)
+_NON_WORD_RE = re.compile(r'[^\w\s]+')
+_SPACES_RE = re.compile(r'\s+')
+_COMBINING_RE = re.compile(r'[\u0300-\u036f]+')
+MIN_PREFIX_LEN = 3
+
+
+def fold_text(text):
+    # Minúsculas y sin tildes; el caso ASCII (la mayoría de mensajes) no pasa por unicodedata.
+    text = text.lower()
+    if not text.isascii():
+        text = _COMBINING_RE.sub('', unicodedata.normalize('NFD', text))
+    return text
+
+def normalize_text(text):
+    return _SPACES_RE.sub(' ', _NON_WORD_RE.sub(' ', fold_text(text))).strip()
+
+def _alternation(words):
+    # Las más largas primero para que "san juan de lurigancho" gane a "san juan".
+    return '|'.join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+class DistrictResolver:
+    def __init__(self, BUSINESS_RULES):
+        self.by_name = {}  # nombre normalizado -> (Nombre Visible, estado)
+        for status, key in (('CON_COBERTURA', 'distritos_cobertura_delivery'), ('SIN_COBERTURA', 'distritos_lima_total')):
+            for distrito in BUSINESS_RULES.get(key, []):
+                # La cobertura tiene prioridad si un distrito figura en ambas listas.
+                self.by_name.setdefault(normalize_text(distrito), (distrito.title(), status))
+        self.by_name.pop('', None)
+        self.sorted_names = sorted(self.by_name)
+        self.names_re = re.compile(rf'\b(?:{_alternation(self.by_name)})\b') if self.by_name else None
+
+        words = {}  # palabra -> nombres que la contienen; solo se usan las de un único distrito
+        for name in self.by_name:
+            for word in name.split():
+                if len(word) > MIN_PREFIX_LEN:
+                    words.setdefault(word, set()).add(name)
+        self.by_word = {word: names.pop() for word, names in words.items() if len(names) == 1}
+
+        self.abbreviations = {}
+        for abbr, full_name in BUSINESS_RULES.get('abreviaturas_distritos', {}).items():
+            if (norm_abbr := normalize_text(abbr)):
+                self.abbreviations[norm_abbr] = normalize_text(full_name)
+        self.abbr_re = re.compile(rf'\b(?:{_alternation(self.abbreviations)})\b') if self.abbreviations else None
+
+    def _prefix_match(self, normalized):
+        if len(normalized) < MIN_PREFIX_LEN:
+            return None
+        start = bisect.bisect_left(self.sorted_names, normalized)
+        matches = []
+        for name in self.sorted_names[start:]:
+            if not name.startswith(normalized):
+                break
+            matches.append(name)
+            if len(matches) > 1:
+                return None  # ambiguo (p. ej. "san juan"): mejor volver a preguntar
+        return matches[0] if matches else None
+
+    def resolve(self, text):
+        normalized = normalize_text(text)
+        if self.abbr_re and (m := self.abbr_re.search(normalized)):
+            normalized = self.abbreviations[m.group(0)]
+        # Primero contra el texto completo: las muletillas ("de") también aparecen en los nombres.
+        if (hit := self.by_name.get(normalized)):
+            return hit
+        if self.names_re and (m := self.names_re.search(normalized)):
+            return self.by_name[m.group(0)]
+        stripped = normalize_text(_FILLER_RE.sub(' ', normalized))
+        if (hit := self.by_name.get(stripped)):
+            return hit
+        if (name := self._prefix_match(stripped)):
+            return self.by_name[name]
+        names = {self.by_word[word] for word in stripped.split() if word in self.by_word}
+        if len(names) == 1:
+            return self.by_name[names.pop()]
+        return None, 'NO_ENCONTRADO'
+
+
+_cache = (None, None)
+_cache_lock = threading.Lock()
+
+def get_district_resolver(BUSINESS_RULES):
+    # Se reconstruye solo cuando cambia el objeto de reglas.
+    global _cache
+    rules, resolver = _cache
+    if rules is not BUSINESS_RULES:
+        with _cache_lock:
+            rules, resolver = _cache
+            if rules is not BUSINESS_RULES:
+                resolver = DistrictResolver(BUSINESS_RULES)
+                _cache = (BUSINESS_RULES, resolver)
+    return resolver
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - MÁQUINA DE ESTADOS DE LA CONVERSACIÓN
+# Cada estado declara su handler, la pregunta que se repite tras una FAQ,
+# los estados a los que puede pasar y los datos que necesita (p. ej. el
+# producto). El despacho es una búsqueda en un diccionario y solo se cargan
+# los datos que declara el estado actual.
+# ==========================================================
+from logging import getLogger
+from bot_metrics import metrics
+
+logger = getLogger(__name__)
+
+AFFIRMATIVE = ('si', 'sí')
+
+
+class State:
+    __slots__ = ('name', 'handler', 'prompt', 'needs', 'transitions', 'restart_on_product')
+
+    def __init__(self, name, handler, prompt=None, needs=(), transitions=(), restart_on_product=True):
+        self.name = name
+        self.handler = handler
+        self.prompt = prompt
+        self.needs = tuple(needs)
+        self.transitions = frozenset(transitions)
+        # Si el cliente menciona un producto en este estado, se reinicia la venta con él.
+        self.restart_on_product = restart_on_product
+
+
+class Turn:
+    # Lo que ve un handler: el mensaje (normalizado una vez), la sesión y los datos declarados.
+    def __init__(self, machine, state, from_number, text, session, intents=None, **settings):
+        self.machine = machine
+        self.state = state
+        self.from_number = from_number
+        self.text = text
+        self.lower = text.lower()
+        self.session = session
+        self.intents = intents
+        self.data = {}
+        self.__dict__.update(settings)
+
+    @property
+    def says_yes(self):
+        return any(word in self.lower for word in AFFIRMATIVE)
+
+    def goto(self, new_state, **updates):
+        if new_state not in self.state.transitions:
+            logger.warning(f"[Flujo] Transición no declarada: {self.state.name} -> {new_state}")
+        self.session.update(updates, state=new_state)
+        self.machine.save_fn(self.from_number, self.session)
+
+    def update(self, **updates):
+        self.session.update(updates)
+        self.machine.save_fn(self.from_number, self.session)
+
+    def end(self):
+        self.machine.delete_fn(self.from_number)
+
+
+class StateMachine:
+    def __init__(self, save_fn, delete_fn, fallback=None):
+        self.save_fn = save_fn
+        self.delete_fn = delete_fn
+        self.fallback = fallback
+        self.states = {}
+        self.loaders = {}
+
+    def state(self, *names, prompt=None, needs=(), transitions=(), restart_on_product=True):
+        # Decorador: un mismo handler puede atender varios estados equivalentes.
+        def register(handler):
+            for name in names:
+                if name in self.states:
+                    raise ValueError(f"Estado duplicado: {name}")
+                self.states[name] = State(name, handler, prompt, needs, transitions, restart_on_product)
+            return handler
+        return register
+
+    def loader(self, name):
+        # El loader devuelve el dato o None; con None el turno termina (el loader ya respondió).
+        def register(fn):
+            self.loaders[name] = fn
+            return fn
+        return register
+
+    def validate(self):
+        for state in self.states.values():
+            unknown = [t for t in state.transitions if t not in self.states]
+            missing = [n for n in state.needs if n not in self.loaders]
+            if unknown or missing:
+                raise ValueError(f"Estado '{state.name}' mal definido: transiciones {unknown}, datos {missing}")
+        return self
+
+    def get(self, name):
+        return self.states.get(name)
+
+    def prompt(self, name):
+        return state.prompt if (state := self.states.get(name)) else None
+
+    def handle(self, from_number, text, session, intents=None, **settings):
+        state = self.states.get(session.get('state'))
+        if state is None:
+            if self.fallback:
+                self.fallback(from_number, session)
+            return False
+        turn = Turn(self, state, from_number, text, session, intents, **settings)
+        for need in state.needs:
+            if (value := self.loaders[need](turn)) is None:
+                return False
+            turn.data[need] = value
+        with metrics.timed('bot_estado_segundos', estado=state.name):
+            state.handler(turn)
+        return True
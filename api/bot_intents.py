@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - CLASIFICADOR DE INTENCIONES
+# Un solo patrón compilado (con límites de palabra) para cancelación,
+# FAQ y palabras clave de productos. El texto se normaliza una vez
+# (minúsculas, sin tildes) y se recorre en una sola pasada.
+# ==========================================================
+import re
+import threading
+from bot_districts import fold_text, normalize_text
+
+CANCELACION = 'cancelacion'
+FAQ_PREFIX = 'faq:'
+PRODUCT_PREFIX = 'producto:'
+# Palabras cuyo último término tiene al menos estos caracteres aceptan terminaciones
+# ("cancelar" -> "cancelarlo"); las cortas solo admiten plural ("hay", "yape") y las
+# frases cortas exigen coincidencia exacta ("ya no" no casa con "ya nos").
+PREFIX_MIN_LEN = 5
+
+
+class KeywordMatcher:
+    def __init__(self, labelled_keywords):
+        self.labels_by_keyword = {}
+        for keyword, label in labelled_keywords:
+            if (norm := normalize_text(keyword)):
+                self.labels_by_keyword.setdefault(norm, []).append(label)
+        # Una frase larga que contiene otra palabra clave hereda sus etiquetas,
+        # así el match no solapado del regex no pierde intenciones.
+        for keyword, labels in self.labels_by_keyword.items():
+            for other, other_labels in self.labels_by_keyword.items():
+                if other != keyword and re.search(rf'\b{re.escape(other)}\b', keyword):
+                    labels.extend(l for l in other_labels if l not in labels)
+        prefix, plural, exact = [], [], []
+        for keyword in sorted(self.labels_by_keyword, key=len, reverse=True):
+            escaped = r'\W+'.join(re.escape(word) for word in keyword.split(' '))
+            if len(keyword.rsplit(' ', 1)[-1]) >= PREFIX_MIN_LEN:
+                prefix.append(escaped)
+            else:
+                (exact if ' ' in keyword else plural).append(escaped)
+        parts = []
+        if prefix:
+            parts.append(rf'\b(?P<p>{"|".join(prefix)})\w*')
+        if plural:
+            parts.append(rf'\b(?P<s>{"|".join(plural)})(?:es|s)?\b')
+        if exact:
+            parts.append(rf'\b(?P<x>{"|".join(exact)})\b')
+        self.pattern = re.compile('|'.join(parts)) if parts else None
+
+    def labels(self, folded_text):
+        # Recibe texto en minúsculas y sin tildes (fold_text). Devuelve las etiquetas
+        # en orden de aparición, sin repetir.
+        found = []
+        if self.pattern:
+            for m in self.pattern.finditer(folded_text):
+                keyword = m.group(m.lastgroup)
+                labels = self.labels_by_keyword.get(keyword) or self.labels_by_keyword[' '.join(re.findall(r'\w+', keyword))]
+                for label in labels:
+                    if label not in found:
+                        found.append(label)
+        return found
+
+
+class Intents:
+    __slots__ = ('normalized', 'labels', 'cancelacion', 'faq', 'product_ids')
+
+    def __init__(self, normalized, labels, faq_order):
+        self.normalized = normalized
+        self.labels = labels
+        self.cancelacion = CANCELACION in labels
+        # FAQ en el orden de FAQ_KEYWORD_MAP, que es la prioridad histórica.
+        self.faq = [key for key in faq_order if FAQ_PREFIX + key in labels]
+        self.product_ids = [l[len(PRODUCT_PREFIX):] for l in labels if l.startswith(PRODUCT_PREFIX)]
+
+    @property
+    def product_id(self):
+        return self.product_ids[0] if self.product_ids else None
+
+
+class IntentClassifier:
+    def __init__(self, FAQ_KEYWORD_MAP, PALABRAS_CANCELACION=(), product_keywords=()):
+        self.faq_order = list(FAQ_KEYWORD_MAP)
+        keywords = [(kw, CANCELACION) for kw in PALABRAS_CANCELACION]
+        keywords += [(kw, FAQ_PREFIX + key) for key, kws in FAQ_KEYWORD_MAP.items() for kw in kws]
+        keywords += [(kw, PRODUCT_PREFIX + product_id) for kw, product_id in product_keywords]
+        self.matcher = KeywordMatcher(keywords)
+
+    def classify(self, text):
+        folded = fold_text(text)
+        return Intents(folded, self.matcher.labels(folded), self.faq_order)
+
+
+_classifiers = {}
+_classifiers_lock = threading.Lock()
+
+def get_intent_classifier(FAQ_KEYWORD_MAP, PALABRAS_CANCELACION=(), product_keywords=()):
+    # Se compila una vez por combinación de configuraciones (mismos objetos => misma instancia).
+    key = (id(FAQ_KEYWORD_MAP), id(PALABRAS_CANCELACION), id(product_keywords))
+    cached = _classifiers.get(key)
+    if cached and cached[0] is FAQ_KEYWORD_MAP and cached[1] is PALABRAS_CANCELACION and cached[2] is product_keywords:
+        return cached[3]
+    with _classifiers_lock:
+        classifier = IntentClassifier(FAQ_KEYWORD_MAP, PALABRAS_CANCELACION, product_keywords)
+        if len(_classifiers) > 16:
+            _classifiers.clear()
+        _classifiers[key] = (FAQ_KEYWORD_MAP, PALABRAS_CANCELACION, product_keywords, classifier)
+    return classifier
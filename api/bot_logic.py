@@ -3,21 +3,23 @@
 # BOT DAAQUI - LÓGICA DE CONVERSACIÓN
 # Contiene el flujo principal de la venta.
 # ==========================================================
-import time
-from firebase_admin import firestore
 from bot_utils import (
     send_text_message, send_image_message, save_session, delete_session,
-    find_product_by_keywords, normalize_and_check_district, parse_province_district,
-    get_last_question, save_completed_sale_and_customer, guardar_pedido_en_sheet,
-    get_delivery_day_message
+    parse_province_district,
+    save_completed_sale_and_customer, guardar_pedido_en_sheet,
+    get_delivery_day_message, classify_message
 )
+from bot_catalog import get_product
+from bot_config import ConfigSnapshot
+from bot_flow import StateMachine
 
 # ==============================================================================
 # 6. LÓGICA DE LA CONVERSACIÓN - ETAPA 1 (EMBUDO DE VENTAS)
 # ==============================================================================
-def handle_initial_message(from_number, user_name, text, FAQ_KEYWORD_MAP, FAQ_RESPONSES, KEYWORDS_GIRASOL):
-    product_id, product_data = find_product_by_keywords(text, KEYWORDS_GIRASOL)
-    if product_data:
+def handle_initial_message(from_number, user_name, text, FAQ_KEYWORD_MAP, FAQ_RESPONSES, KEYWORDS_GIRASOL, intents=None):
+    intents = intents or classify_message(text, FAQ_KEYWORD_MAP, KEYWORDS_GIRASOL)
+    product_id = intents.product_id
+    if product_id and (product_data := get_product(product_id)):
         nombre_producto = product_data.get('nombre', 'nuestro producto')
         desc_corta = product_data.get('descripcion_corta', 'es simplemente increíble.')
         precio = product_data.get('precio_base', 0)
@@ -25,12 +27,11 @@ def handle_initial_message(from_number, user_name, text, FAQ_KEYWORD_MAP, FAQ_RE
         
         if url_img:
             send_image_message(from_number, url_img)
-            time.sleep(1)
         
         msg = (f"¡Hola {user_name}! 🌞 El *{nombre_producto}* {desc_corta}\n\n"
                f"Por campaña, llévatelo a *S/ {precio:.2f}* (¡incluye envío gratis a todo el Perú! 🚚).\n\n"
                "Cuéntame, ¿es un tesoro para ti o un regalo para alguien especial?")
-        send_text_message(from_number, msg)
+        send_text_message(from_number, msg, delay=1 if url_img else 0)
         
         new_session = {
             "state": "awaiting_occasion_response", "product_id": product_id,
@@ -40,264 +41,288 @@ def handle_initial_message(from_number, user_name, text, FAQ_KEYWORD_MAP, FAQ_RE
         save_session(from_number, new_session)
         return
 
-    text_lower = text.lower()
-    for key, keywords in FAQ_KEYWORD_MAP.items():
-        if any(keyword in text_lower for keyword in keywords):
-            if response_text := FAQ_RESPONSES.get(key):
-                send_text_message(from_number, response_text)
-                return
+    for key in intents.faq:
+        if response_text := FAQ_RESPONSES.get(key):
+            send_text_message(from_number, response_text)
+            return
     
     send_text_message(from_number, f"¡Hola {user_name}! 👋🏽✨ Bienvenida a *Daaqui Joyas*. Si deseas información sobre nuestro *Collar Mágico Girasol Radiant*, solo pregunta por él. 😊")
 
 # ==============================================================================
 # 7. LÓGICA DE LA CONVERSACIÓN - ETAPA 2 (FLUJO DE COMPRA)
 # ==============================================================================
-def handle_sales_flow(from_number, text, session, FAQ_KEYWORD_MAP, FAQ_RESPONSES, KEYWORDS_GIRASOL, BUSINESS_RULES, RUC_EMPRESA, TITULAR_YAPE, ADMIN_WHATSAPP_NUMBER):
-    db = firestore.client()
-    text_lower = text.lower()
-    for key, keywords in FAQ_KEYWORD_MAP.items():
-        if any(keyword in text_lower for keyword in keywords):
-            response_text = FAQ_RESPONSES.get(key)
-            if key == 'precio' and session.get('product_name'):
-                response_text = f"¡Claro! El precio de tu pedido (*{session['product_name']}*) es de *S/ {session['product_price']:.2f}*, con envío gratis. 🚚"
-            elif key == 'stock' and session.get('product_name'):
-                response_text = f"¡Sí, claro! Aún tenemos unidades del *{session['product_name']}*. ✨ ¿Iniciamos tu pedido?"
-            
-            if response_text:
-                send_text_message(from_number, response_text)
-                time.sleep(1)
-                if last_question := get_last_question(session.get('state')):
-                    send_text_message(from_number, f"¡Espero haber aclarado tu duda! 😊 Continuando...\n\n{last_question}")
-                return
+# Cada estado es un handler registrado en la máquina (ver bot_flow): para añadir
+# un paso o un flujo nuevo basta con registrar sus estados.
+def _confused(from_number, session):
+    send_text_message(from_number, "Estoy un poco confundido. Si deseas reiniciar, escribe 'cancelar'.")
 
-    if any(keyword in text.lower() for keyword in KEYWORDS_GIRASOL) and session.get('state') not in ['awaiting_occasion_response', 'awaiting_purchase_decision']:
-        delete_session(from_number)
-        handle_initial_message(from_number, session.get("user_name", "Usuario"), text, FAQ_KEYWORD_MAP, FAQ_RESPONSES, KEYWORDS_GIRASOL)
-        return
+sales_flow = StateMachine(save_session, delete_session, fallback=_confused)
 
-    current_state, product_id = session.get('state'), session.get('product_id')
-    if not product_id or not (product_doc := db.collection('productos').document(product_id).get()).exists:
-        send_text_message(from_number, "Lo siento, este producto ya no está disponible. Por favor, empieza de nuevo.")
-        delete_session(from_number)
-        return
-    product_data = product_doc.to_dict()
+@sales_flow.loader('product')
+def _load_product(turn):
+    # Solo los estados que muestran datos del producto pagan esta lectura.
+    if (product_id := turn.session.get('product_id')) and (product_data := get_product(product_id)) is not None:
+        return product_data
+    send_text_message(turn.from_number, "Lo siento, este producto ya no está disponible. Por favor, empieza de nuevo.")
+    turn.end()
+    return None
 
-    if current_state == 'awaiting_occasion_response':
-        url_imagen_empaque = product_data.get('imagenes', {}).get('empaque')
-        detalles = product_data.get('detalles', {})
-        material = detalles.get('material', 'material de alta calidad')
-        presentacion = detalles.get('empaque', 'viene en una hermosa caja de regalo')
-        if url_imagen_empaque:
-            send_image_message(from_number, url_imagen_empaque)
-            time.sleep(1)
-        mensaje_persuasion_1 = (
-            "¡Maravillosa elección! ✨ El *Collar Mágico Girasol Radiant* es pura energía. Aquí tienes todos los detalles:\n\n"
-            f"💎 *Material:* {material} ¡Hipoalergénico y no se oscurece!\n"
-            f"🔮 *La Magia:* Su piedra central es termocromática, cambia de color con tu temperatura.\n"
-            f"🎁 *Presentación:* {presentacion}"
+def _shalom_agreement_message(distrito, config):
+    adelanto = config.adelanto_shalom
+    return (f"Entendido. ✅ Para *{distrito}*, los envíos son por agencia *Shalom* y requieren un adelanto de *S/ {adelanto:.2f}* como compromiso de recojo. 🤝\n\n"
+            "¿Estás de acuerdo? (Sí/No)")
+
+@sales_flow.state('awaiting_occasion_response', needs=('product',), restart_on_product=False,
+                  transitions=('awaiting_purchase_decision',),
+                  prompt="Cuéntame, ¿es un tesoro para ti o un regalo para alguien especial?")
+def _occasion_response(turn):
+    product_data = turn.data['product']
+    url_imagen_empaque = product_data.get('imagenes', {}).get('empaque')
+    detalles = product_data.get('detalles', {})
+    material = detalles.get('material', 'material de alta calidad')
+    presentacion = detalles.get('empaque', 'viene en una hermosa caja de regalo')
+    if url_imagen_empaque:
+        send_image_message(turn.from_number, url_imagen_empaque)
+    mensaje_persuasion_1 = (
+        "¡Maravillosa elección! ✨ El *Collar Mágico Girasol Radiant* es pura energía. Aquí tienes todos los detalles:\n\n"
+        f"💎 *Material:* {material} ¡Hipoalergénico y no se oscurece!\n"
+        f"🔮 *La Magia:* Su piedra central es termocromática, cambia de color con tu temperatura.\n"
+        f"🎁 *Presentación:* {presentacion}"
+    )
+    send_text_message(turn.from_number, mensaje_persuasion_1, delay=1 if url_imagen_empaque else 0)
+    mensaje_persuasion_2 = (
+        f"Para tu total seguridad, somos Daaqui Joyas, un negocio formal con *RUC {turn.ruc}*. ¡Tu compra es 100% segura! 🇵🇪\n\n"
+        "¿Te gustaría coordinar tu pedido ahora para asegurar el tuyo? (Sí/No)"
+    )
+    send_text_message(turn.from_number, mensaje_persuasion_2, delay=1.5)
+    turn.goto('awaiting_purchase_decision')
+
+@sales_flow.state('awaiting_purchase_decision', needs=('product',), restart_on_product=False,
+                  transitions=('awaiting_upsell_decision',),
+                  prompt="¿Te gustaría coordinar tu pedido ahora para asegurar el tuyo? (Sí/No)")
+def _purchase_decision(turn):
+    if turn.says_yes:
+        url_imagen_upsell = turn.data['product'].get('imagenes', {}).get('upsell')
+        if url_imagen_upsell:
+            send_image_message(turn.from_number, url_imagen_upsell)
+        upsell_message_1 = (
+            "¡Excelente elección! Pero espera... por decidir llevar tu collar, ¡acabas de desbloquear una oferta exclusiva! ✨\n\n"
+            "Añade un segundo Collar Mágico y te incluimos de regalo dos cadenas de diseño italiano.\n\n"
+            "Tu pedido se ampliaría a:\n"
+            "✨ 2 Collares Mágicos\n🎁 2 Cadenas de Regalo\n🎀 2 Cajitas Premium\n"
+            "💎 Todo por un único pago de S/ 99.00"
         )
-        send_text_message(from_number, mensaje_persuasion_1)
-        time.sleep(1.5)
-        mensaje_persuasion_2 = (
-            f"Para tu total seguridad, somos Daaqui Joyas, un negocio formal con *RUC {RUC_EMPRESA}*. ¡Tu compra es 100% segura! 🇵🇪\n\n"
-            "¿Te gustaría coordinar tu pedido ahora para asegurar el tuyo? (Sí/No)"
+        send_text_message(turn.from_number, upsell_message_1, delay=1 if url_imagen_upsell else 0)
+        upsell_message_2 = (
+            "Para continuar, por favor, respóndeme:\n"
+            "👉🏽 Escribe *oferta* para ampliar tu pedido.\n"
+            "👉🏽 Escribe *continuar* para llevar solo un collar."
         )
-        send_text_message(from_number, mensaje_persuasion_2)
-        session['state'] = 'awaiting_purchase_decision'
-        save_session(from_number, session)
-    
-    elif current_state == 'awaiting_purchase_decision':
-        if 'si' in text.lower() or 'sí' in text.lower():
-            url_imagen_upsell = product_data.get('imagenes', {}).get('upsell')
-            if url_imagen_upsell:
-                send_image_message(from_number, url_imagen_upsell)
-                time.sleep(1)
-            upsell_message_1 = (
-                "¡Excelente elección! Pero espera... por decidir llevar tu collar, ¡acabas de desbloquear una oferta exclusiva! ✨\n\n"
-                "Añade un segundo Collar Mágico y te incluimos de regalo dos cadenas de diseño italiano.\n\n"
-                "Tu pedido se ampliaría a:\n"
-                "✨ 2 Collares Mágicos\n🎁 2 Cadenas de Regalo\n🎀 2 Cajitas Premium\n"
-                "💎 Todo por un único pago de S/ 99.00"
-            )
-            send_text_message(from_number, upsell_message_1)
-            time.sleep(1.5)
-            upsell_message_2 = (
-                "Para continuar, por favor, respóndeme:\n"
-                "👉🏽 Escribe *oferta* para ampliar tu pedido.\n"
-                "👉🏽 Escribe *continuar* para llevar solo un collar."
-            )
-            send_text_message(from_number, upsell_message_2)
-            session['state'] = 'awaiting_upsell_decision'
-            save_session(from_number, session)
-        else:
-            delete_session(from_number)
-            send_text_message(from_number, "Entendido. Si cambias de opinión, aquí estaré. ¡Que tengas un buen día! 😊")
+        send_text_message(turn.from_number, upsell_message_2, delay=1.5)
+        turn.goto('awaiting_upsell_decision')
+    else:
+        turn.end()
+        send_text_message(turn.from_number, "Entendido. Si cambias de opinión, aquí estaré. ¡Que tengas un buen día! 😊")
 
-    elif current_state == 'awaiting_upsell_decision':
-        if 'oferta' in text.lower():
-            session.update({"product_name": "Oferta 2x Collares Mágicos + Cadenas", "product_price": 99.00, "is_upsell": True})
-            send_text_message(from_number, "¡Genial! Has elegido la oferta. ✨")
-        else: 
-            session['is_upsell'] = False
-            send_text_message(from_number, "¡Perfecto! Continuamos con tu collar individual. ✨")
-        session['state'] = 'awaiting_location'
-        save_session(from_number, session)
-        time.sleep(1)
-        send_text_message(from_number, "Para empezar a coordinar el envío, por favor, dime: ¿eres de *Lima* o de *provincia*?")
+@sales_flow.state('awaiting_upsell_decision', transitions=('awaiting_location',),
+                  prompt="Para continuar, por favor, respóndeme con una de estas dos palabras:\n👉🏽 Escribe *oferta* para ampliar tu pedido.\n👉🏽 Escribe *continuar* para llevar solo un collar.")
+def _upsell_decision(turn):
+    if 'oferta' in turn.lower:
+        turn.session.update({"product_name": "Oferta 2x Collares Mágicos + Cadenas", "product_price": 99.00, "is_upsell": True})
+        send_text_message(turn.from_number, "¡Genial! Has elegido la oferta. ✨")
+    else:
+        turn.session['is_upsell'] = False
+        send_text_message(turn.from_number, "¡Perfecto! Continuamos con tu collar individual. ✨")
+    turn.goto('awaiting_location')
+    send_text_message(turn.from_number, "Para empezar a coordinar el envío, por favor, dime: ¿eres de *Lima* o de *provincia*?", delay=1)
 
-    elif current_state == 'awaiting_location':
-        if 'lima' in text.lower():
-            session.update({"state": "awaiting_lima_district", "provincia": "Lima"})
-            save_session(from_number, session)
-            send_text_message(from_number, "¡Genial! ✨ Para saber qué tipo de envío te corresponde, por favor, dime: ¿en qué distrito te encuentras? 📍")
-        elif 'provincia' in text.lower():
-            session['state'] = 'awaiting_province_district'
-            save_session(from_number, session)
-            send_text_message(from_number, "¡Entendido! Para continuar, indícame tu *provincia y distrito*. ✍🏽\n\n📝 *Ej: Arequipa, Arequipa*")
-        else:
-            send_text_message(from_number, "No te entendí bien. Por favor, dime si tu envío es para *Lima* o para *provincia*.")
-    
-    elif current_state == 'awaiting_province_district':
-        provincia, distrito = parse_province_district(text)
-        session.update({"state": "awaiting_shalom_agreement", "tipo_envio": "Provincia Shalom", "metodo_pago": "Adelanto y Saldo (Yape/Plin)", "provincia": provincia, "distrito": distrito})
-        save_session(from_number, session)
-        adelanto = BUSINESS_RULES.get('adelanto_shalom', 20)
-        mensaje = (f"Entendido. ✅ Para *{distrito}*, los envíos son por agencia *Shalom* y requieren un adelanto de *S/ {adelanto:.2f}* como compromiso de recojo. 🤝\n\n"
-                   "¿Estás de acuerdo? (Sí/No)")
-        send_text_message(from_number, mensaje)
-        
-    elif current_state == 'awaiting_lima_district':
-        distrito, status = normalize_and_check_district(text, BUSINESS_RULES)
-        if status != 'NO_ENCONTRADO':
-            session['distrito'] = distrito
-            if status == 'CON_COBERTURA':
-                session.update({"state": "awaiting_delivery_details", "tipo_envio": "Lima Contra Entrega", "metodo_pago": "Contra Entrega (Efectivo/Yape/Plin)"})
-                save_session(from_number, session)
-                mensaje = (f"¡Excelente! Tenemos cobertura en *{distrito}*. 🏙️\n\n"
-                           "Para registrar tu pedido, envíame en *un solo mensaje* tu *Nombre Completo, Dirección exacta* y una *Referencia*.\n\n"
-                           "📝 *Ej: Ana Pérez, Jr. Gamarra 123, Depto 501, La Victoria. Al lado de la farmacia.*")
-                send_text_message(from_number, mensaje)
-            elif status == 'SIN_COBERTURA':
-                session.update({"state": "awaiting_shalom_agreement", "tipo_envio": "Lima Shalom", "metodo_pago": "Adelanto y Saldo (Yape/Plin)"})
-                save_session(from_number, session)
-                adelanto = BUSINESS_RULES.get('adelanto_shalom', 20)
-                mensaje = (f"Entendido. ✅ Para *{distrito}*, los envíos son por agencia *Shalom* y requieren un adelanto de *S/ {adelanto:.2f}* como compromiso de recojo. 🤝\n\n"
-                           "¿Estás de acuerdo? (Sí/No)")
-                send_text_message(from_number, mensaje)
-        else:
-            send_text_message(from_number, "No pude reconocer ese distrito. Por favor, intenta escribirlo de nuevo.")
+@sales_flow.state('awaiting_location', transitions=('awaiting_lima_district', 'awaiting_province_district'),
+                  prompt="Para empezar a coordinar el envío, por favor, dime: ¿eres de *Lima* o de *provincia*?")
+def _location(turn):
+    if 'lima' in turn.lower:
+        turn.goto('awaiting_lima_district', provincia="Lima")
+        send_text_message(turn.from_number, "¡Genial! ✨ Para saber qué tipo de envío te corresponde, por favor, dime: ¿en qué distrito te encuentras? 📍")
+    elif 'provincia' in turn.lower:
+        turn.goto('awaiting_province_district')
+        send_text_message(turn.from_number, "¡Entendido! Para continuar, indícame tu *provincia y distrito*. ✍🏽\n\n📝 *Ej: Arequipa, Arequipa*")
+    else:
+        send_text_message(turn.from_number, "No te entendí bien. Por favor, dime si tu envío es para *Lima* o para *provincia*.")
+
+@sales_flow.state('awaiting_province_district', transitions=('awaiting_shalom_agreement',),
+                  prompt="¡Entendido! Para continuar, por favor, indícame tu *provincia y distrito*. ✍🏽\n\n📝 *Ej: Arequipa, Arequipa*")
+def _province_district(turn):
+    provincia, distrito = parse_province_district(turn.text)
+    turn.goto('awaiting_shalom_agreement', tipo_envio="Provincia Shalom", metodo_pago="Adelanto y Saldo (Yape/Plin)",
+              provincia=provincia, distrito=distrito)
+    send_text_message(turn.from_number, _shalom_agreement_message(distrito, turn.config))
+
+@sales_flow.state('awaiting_lima_district', transitions=('awaiting_delivery_details', 'awaiting_shalom_agreement'),
+                  prompt="¡Genial! ✨ Para saber qué tipo de envío te corresponde, por favor, dime: ¿en qué distrito te encuentras? 📍")
+def _lima_district(turn):
+    distrito, status = turn.config.district_resolver.resolve(turn.text)
+    if status == 'CON_COBERTURA':
+        turn.goto('awaiting_delivery_details', distrito=distrito, tipo_envio="Lima Contra Entrega",
+                  metodo_pago="Contra Entrega (Efectivo/Yape/Plin)")
+        mensaje = (f"¡Excelente! Tenemos cobertura en *{distrito}*. 🏙️\n\n"
+                   "Para registrar tu pedido, envíame en *un solo mensaje* tu *Nombre Completo, Dirección exacta* y una *Referencia*.\n\n"
+                   "📝 *Ej: Ana Pérez, Jr. Gamarra 123, Depto 501, La Victoria. Al lado de la farmacia.*")
+        send_text_message(turn.from_number, mensaje)
+    elif status == 'SIN_COBERTURA':
+        turn.goto('awaiting_shalom_agreement', distrito=distrito, tipo_envio="Lima Shalom", metodo_pago="Adelanto y Saldo (Yape/Plin)")
+        send_text_message(turn.from_number, _shalom_agreement_message(distrito, turn.config))
+    else:
+        send_text_message(turn.from_number, "No pude reconocer ese distrito. Por favor, intenta escribirlo de nuevo.")
+
+@sales_flow.state('awaiting_delivery_details', 'awaiting_shalom_details', transitions=('awaiting_final_confirmation',))
+def _delivery_details(turn):
+    turn.goto('awaiting_final_confirmation', detalles_cliente=turn.text)
+    session = turn.session
+    resumen = ("¡Gracias! Revisa que todo esté correcto:\n\n"
+               "*Resumen del Pedido*\n"
+               f"💎 {session.get('product_name', '')}\n"
+               f"💵 Total: S/ {session.get('product_price', 0):.2f}\n"
+               f"🚚 Envío: {session.get('distrito', session.get('provincia', ''))} - ¡Gratis!\n"
+               f"💳 Pago: {session.get('metodo_pago', '')}\n\n"
+               "*Datos de Entrega*\n"
+               f"{session.get('detalles_cliente', '')}\n\n"
+               "¿Confirmas que todo es correcto? (Sí/No)")
+    send_text_message(turn.from_number, resumen)
 
-    elif current_state in ['awaiting_delivery_details', 'awaiting_shalom_details']:
-        session.update({"state": "awaiting_final_confirmation", "detalles_cliente": text})
-        save_session(from_number, session)
-        resumen = ("¡Gracias! Revisa que todo esté correcto:\n\n"
-                   "*Resumen del Pedido*\n"
-                   f"💎 {session.get('product_name', '')}\n"
-                   f"💵 Total: S/ {session.get('product_price', 0):.2f}\n"
-                   f"🚚 Envío: {session.get('distrito', session.get('provincia', ''))} - ¡Gratis!\n"
-                   f"💳 Pago: {session.get('metodo_pago', '')}\n\n"
-                   "*Datos de Entrega*\n"
-                   f"{session.get('detalles_cliente', '')}\n\n"
-                   "¿Confirmas que todo es correcto? (Sí/No)")
-        send_text_message(from_number, resumen)
+@sales_flow.state('awaiting_shalom_agreement', transitions=('awaiting_shalom_experience',),
+                  prompt="¿Estás de acuerdo con el adelanto? (Sí/No)")
+def _shalom_agreement(turn):
+    if turn.says_yes:
+        turn.goto('awaiting_shalom_experience')
+        send_text_message(turn.from_number, "¡Genial! Para hacer el proceso más fácil, cuéntame: ¿alguna vez has recogido un pedido en una agencia Shalom? 🙋🏽‍♀️ (Sí/No)")
+    else:
+        turn.end(); send_text_message(turn.from_number, "Comprendo. Si cambias de opinión, aquí estaré. ¡Gracias! 😊")
 
-    elif current_state == 'awaiting_shalom_agreement':
-        if 'si' in text.lower() or 'sí' in text.lower():
-            session['state'] = 'awaiting_shalom_experience'
-            save_session(from_number, session)
-            send_text_message(from_number, "¡Genial! Para hacer el proceso más fácil, cuéntame: ¿alguna vez has recogido un pedido en una agencia Shalom? 🙋🏽‍♀️ (Sí/No)")
-        else:
-            delete_session(from_number); send_text_message(from_number, "Comprendo. Si cambias de opinión, aquí estaré. ¡Gracias! 😊")
+@sales_flow.state('awaiting_shalom_experience', transitions=('awaiting_shalom_details', 'awaiting_shalom_agency_knowledge'))
+def _shalom_experience(turn):
+    if turn.says_yes:
+        turn.goto('awaiting_shalom_details')
+        mensaje = ("¡Excelente! Entonces ya conoces el proceso. ✅\n\n"
+                   "Para terminar, bríndame en un solo mensaje tu *Nombre Completo, DNI* y la *dirección exacta de la agencia Shalom* donde recogerás. ✍🏽")
+        send_text_message(turn.from_number, mensaje)
+    else:
+        turn.goto('awaiting_shalom_agency_knowledge')
+        mensaje = ("¡No te preocupes! Te explico: Shalom es una empresa de envíos. Te damos un código de seguimiento, y cuando tu pedido llega a la agencia, nos yapeas el saldo restante. Apenas confirmemos, te damos la clave secreta para el recojo. ¡Es 100% seguro! 🔒\n\n"
+                   "¿Conoces la dirección de alguna agencia Shalom cerca a ti? (Sí/No)")
+        send_text_message(turn.from_number, mensaje)
 
-    elif current_state == 'awaiting_shalom_experience':
-        if 'si' in text.lower() or 'sí' in text.lower():
-            session['state'] = 'awaiting_shalom_details'
-            save_session(from_number, session)
-            mensaje = ("¡Excelente! Entonces ya conoces el proceso. ✅\n\n"
-                       "Para terminar, bríndame en un solo mensaje tu *Nombre Completo, DNI* y la *dirección exacta de la agencia Shalom* donde recogerás. ✍🏽")
-            send_text_message(from_number, mensaje)
-        else:
-            session['state'] = 'awaiting_shalom_agency_knowledge'
-            save_session(from_number, session)
-            mensaje = ("¡No te preocupes! Te explico: Shalom es una empresa de envíos. Te damos un código de seguimiento, y cuando tu pedido llega a la agencia, nos yapeas el saldo restante. Apenas confirmemos, te damos la clave secreta para el recojo. ¡Es 100% seguro! 🔒\n\n"
-                       "¿Conoces la dirección de alguna agencia Shalom cerca a ti? (Sí/No)")
-            send_text_message(from_number, mensaje)
-            
-    elif current_state == 'awaiting_shalom_agency_knowledge':
-        if 'si' in text.lower() or 'sí' in text.lower():
-            session['state'] = 'awaiting_shalom_details'
-            save_session(from_number, session)
-            mensaje = ("¡Perfecto! Por favor, bríndame en un solo mensaje tu *Nombre Completo, DNI* y la *dirección de esa agencia Shalom*. ✍🏽")
-            send_text_message(from_number, mensaje)
-        else:
-            delete_session(from_number); send_text_message(from_number, "Entiendo. 😔 Te recomiendo buscar en Google 'Shalom agencias' para encontrar la más cercana. ¡Gracias por tu interés!")
-            
-    elif current_state == 'awaiting_final_confirmation':
-        if 'si' in text.lower() or 'sí' in text.lower():
-            if session.get('tipo_envio') == 'Lima Contra Entrega':
-                adelanto = float(BUSINESS_RULES.get('adelanto_lima_delivery', 10))
-                session.update({'adelanto': adelanto, 'state': 'awaiting_lima_payment_agreement'})
-                save_session(from_number, session)
-                mensaje = (f"¡Perfecto! ✅ Como último paso, solicitamos un adelanto de *S/ {adelanto:.2f}* para confirmar el compromiso de recojo. 🤝 Este monto se descuenta del total, por supuesto.\n\n"
-                           "¿Procedemos? (Sí/No)")
-                send_text_message(from_number, mensaje)
-            else: # Shalom
-                adelanto = float(BUSINESS_RULES.get('adelanto_shalom', 20))
-                session.update({'adelanto': adelanto, 'state': 'awaiting_shalom_payment'})
-                save_session(from_number, session)
-                mensaje = (f"¡Genial! Puedes realizar el adelanto de *S/ {adelanto:.2f}* a nuestra cuenta:\n\n"
-                           f"💳 *YAPE / PLIN:* {BUSINESS_RULES.get('yape_numero', 'No configurado')}\n"
-                           f"👤 *Titular:* {TITULAR_YAPE}\n"
-                           f"🔒 Tu compra es 100% segura (*RUC {RUC_EMPRESA}*).\n\n"
-                           "Una vez realizado, envíame la *captura de pantalla* para validar tu pedido.")
-                send_text_message(from_number, mensaje)
-        else:
-            previous_state = 'awaiting_delivery_details' if session.get('tipo_envio') == 'Lima Contra Entrega' else 'awaiting_shalom_details'
-            session['state'] = previous_state
-            save_session(from_number, session)
-            send_text_message(from_number, "¡Claro, lo corregimos! 😊 Por favor, envíame nuevamente la información de envío completa en un solo mensaje.")
+@sales_flow.state('awaiting_shalom_agency_knowledge', transitions=('awaiting_shalom_details',))
+def _shalom_agency_knowledge(turn):
+    if turn.says_yes:
+        turn.goto('awaiting_shalom_details')
+        mensaje = ("¡Perfecto! Por favor, bríndame en un solo mensaje tu *Nombre Completo, DNI* y la *dirección de esa agencia Shalom*. ✍🏽")
+        send_text_message(turn.from_number, mensaje)
+    else:
+        turn.end(); send_text_message(turn.from_number, "Entiendo. 😔 Te recomiendo buscar en Google 'Shalom agencias' para encontrar la más cercana. ¡Gracias por tu interés!")
 
-    elif current_state == 'awaiting_lima_payment_agreement':
-        if 'si' in text.lower() or 'sí' in text.lower():
-            session['state'] = 'awaiting_lima_payment'
-            save_session(from_number, session)
-            mensaje = (f"¡Genial! Puedes realizar el adelanto de *S/ {session.get('adelanto', 10):.2f}* a:\n\n"
-                       f"💳 *YAPE / PLIN:* {BUSINESS_RULES.get('yape_numero', 'No configurado')}\n"
-                       f"👤 *Titular:* {TITULAR_YAPE}\n\n"
-                       "Una vez realizado, envíame la *captura de pantalla* para validar.")
-            send_text_message(from_number, mensaje)
-        else:
-            delete_session(from_number); send_text_message(from_number, "Entendido. Si cambias de opinión, aquí estaré. ¡Gracias!")
+@sales_flow.state('awaiting_final_confirmation',
+                  transitions=('awaiting_lima_payment_agreement', 'awaiting_shalom_payment', 'awaiting_delivery_details', 'awaiting_shalom_details'))
+def _final_confirmation(turn):
+    is_lima_delivery = turn.session.get('tipo_envio') == 'Lima Contra Entrega'
+    if turn.says_yes:
+        if is_lima_delivery:
+            adelanto = turn.config.adelanto_lima_delivery
+            turn.goto('awaiting_lima_payment_agreement', adelanto=adelanto)
+            mensaje = (f"¡Perfecto! ✅ Como último paso, solicitamos un adelanto de *S/ {adelanto:.2f}* para confirmar el compromiso de recojo. 🤝 Este monto se descuenta del total, por supuesto.\n\n"
+                       "¿Procedemos? (Sí/No)")
+            send_text_message(turn.from_number, mensaje)
+        else: # Shalom
+            adelanto = turn.config.adelanto_shalom
+            turn.goto('awaiting_shalom_payment', adelanto=adelanto)
+            mensaje = (f"¡Genial! Puedes realizar el adelanto de *S/ {adelanto:.2f}* a nuestra cuenta:\n\n"
+                       f"💳 *YAPE / PLIN:* {turn.config.yape_numero}\n"
+                       f"👤 *Titular:* {turn.titular_yape}\n"
+                       f"🔒 Tu compra es 100% segura (*RUC {turn.ruc}*).\n\n"
+                       "Una vez realizado, envíame la *captura de pantalla* para validar tu pedido.")
+            send_text_message(turn.from_number, mensaje)
+    else:
+        turn.goto('awaiting_delivery_details' if is_lima_delivery else 'awaiting_shalom_details')
+        send_text_message(turn.from_number, "¡Claro, lo corregimos! 😊 Por favor, envíame nuevamente la información de envío completa en un solo mensaje.")
 
-    elif current_state in ['awaiting_lima_payment', 'awaiting_shalom_payment']:
-        if text == "COMPROBANTE_RECIBIDO":
-            guardado_exitoso, sale_data = save_completed_sale_and_customer(session)
-            if guardado_exitoso:
-                guardar_pedido_en_sheet(sale_data)
-                if ADMIN_WHATSAPP_NUMBER:
-                    admin_message = (f"🎉 ¡Nueva Venta Confirmada! 🎉\n\n"
-                                     f"Producto: {sale_data.get('producto_nombre')}\n"
-                                     f"Tipo: {sale_data.get('tipo_envio')}\n"
-                                     f"Cliente WA ID: {sale_data.get('cliente_id')}\n"
-                                     f"Detalles:\n{sale_data.get('detalles_cliente')}")
-                    send_text_message(ADMIN_WHATSAPP_NUMBER, admin_message)
-                if session.get('tipo_envio') == 'Lima Contra Entrega':
-                    restante = sale_data.get('saldo_restante', 0)
-                    dia_entrega = get_delivery_day_message(BUSINESS_RULES)
-                    horario = BUSINESS_RULES.get('horario_entrega_lima', 'durante el día')
-                    mensaje_final = (f"¡Adelanto confirmado! ✨ Tu pedido ha sido agendado. Lo recibirás *{dia_entrega}* entre *{horario}*.\n\n"
-                                     f"💵 Pagarás al recibir: *S/ {restante:.2f}*.\n\n"
-                                     "¡Gracias por tu compra! 🎉")
-                    send_text_message(from_number, mensaje_final)
-                else: # Shalom
-                    mensaje_base = "¡Adelanto confirmado! ✨ Agendamos tu envío. Te enviaremos tu código de seguimiento por aquí en las próximas 24h hábiles. "
-                    if session.get('tipo_envio') == 'Lima Shalom': msg_final = mensaje_base + "El tiempo de entrega en agencia es de 1-2 días hábiles."
-                    else: msg_final = mensaje_base + "El tiempo de entrega en agencia es de 3-5 días hábiles."
-                    send_text_message(from_number, msg_final)
-                delete_session(from_number)
-            else:
-                send_text_message(from_number, "¡Uy! Hubo un problema al registrar tu pedido. Un asesor se pondrá en contacto contigo.")
-        else:
-            send_text_message(from_number, "Estoy esperando la *captura de pantalla* de tu pago. 😊")
+@sales_flow.state('awaiting_lima_payment_agreement', transitions=('awaiting_lima_payment',),
+                  prompt="¿Procedemos con la confirmación del adelanto? (Sí/No)")
+def _lima_payment_agreement(turn):
+    if turn.says_yes:
+        turn.goto('awaiting_lima_payment')
+        mensaje = (f"¡Genial! Puedes realizar el adelanto de *S/ {turn.session.get('adelanto', 10):.2f}* a:\n\n"
+                   f"💳 *YAPE / PLIN:* {turn.config.yape_numero}\n"
+                   f"👤 *Titular:* {turn.titular_yape}\n\n"
+                   "Una vez realizado, envíame la *captura de pantalla* para validar.")
+        send_text_message(turn.from_number, mensaje)
     else:
-        send_text_message(from_number, "Estoy un poco confundido. Si deseas reiniciar, escribe 'cancelar'.")
\ No newline at end of file
+        turn.end(); send_text_message(turn.from_number, "Entendido. Si cambias de opinión, aquí estaré. ¡Gracias!")
+
+@sales_flow.state('awaiting_lima_payment', 'awaiting_shalom_payment',
+                  prompt="Una vez realizado, por favor, envíame la *captura de pantalla* para validar tu pedido.")
+def _payment(turn):
+    from_number, session, BUSINESS_RULES = turn.from_number, turn.session, turn.rules
+    if turn.text != "COMPROBANTE_RECIBIDO":
+        send_text_message(from_number, "Estoy esperando la *captura de pantalla* de tu pago. 😊")
+        return
+    guardado_exitoso, sale_data = save_completed_sale_and_customer(session)
+    if not guardado_exitoso:
+        send_text_message(from_number, "¡Uy! Hubo un problema al registrar tu pedido. Un asesor se pondrá en contacto contigo.")
+        return
+    guardar_pedido_en_sheet(sale_data)
+    if turn.admin_number:
+        admin_message = (f"🎉 ¡Nueva Venta Confirmada! 🎉\n\n"
+                         f"Producto: {sale_data.get('producto_nombre')}\n"
+                         f"Tipo: {sale_data.get('tipo_envio')}\n"
+                         f"Cliente WA ID: {sale_data.get('cliente_id')}\n"
+                         f"Detalles:\n{sale_data.get('detalles_cliente')}")
+        send_text_message(turn.admin_number, admin_message)
+    if session.get('tipo_envio') == 'Lima Contra Entrega':
+        restante = sale_data.get('saldo_restante', 0)
+        dia_entrega = get_delivery_day_message(BUSINESS_RULES)
+        horario = BUSINESS_RULES.get('horario_entrega_lima', 'durante el día')
+        mensaje_final = (f"¡Adelanto confirmado! ✨ Tu pedido ha sido agendado. Lo recibirás *{dia_entrega}* entre *{horario}*.\n\n"
+                         f"💵 Pagarás al recibir: *S/ {restante:.2f}*.\n\n"
+                         "¡Gracias por tu compra! 🎉")
+        send_text_message(from_number, mensaje_final)
+    else: # Shalom
+        mensaje_base = "¡Adelanto confirmado! ✨ Agendamos tu envío. Te enviaremos tu código de seguimiento por aquí en las próximas 24h hábiles. "
+        if session.get('tipo_envio') == 'Lima Shalom': msg_final = mensaje_base + "El tiempo de entrega en agencia es de 1-2 días hábiles."
+        else: msg_final = mensaje_base + "El tiempo de entrega en agencia es de 3-5 días hábiles."
+        send_text_message(from_number, msg_final)
+    # La sesión ya se eliminó en el mismo commit que la venta.
+
+sales_flow.validate()
+
+_legacy_config = None
+
+def _config_for(BUSINESS_RULES, FAQ_RESPONSES, FAQ_KEYWORD_MAP):
+    # Llamadores sin ConfigSnapshot: se arma uno por diccionario de reglas, no uno por mensaje.
+    global _legacy_config
+    if _legacy_config is None or _legacy_config[0] is not BUSINESS_RULES:
+        _legacy_config = (BUSINESS_RULES, ConfigSnapshot(BUSINESS_RULES, FAQ_RESPONSES, FAQ_KEYWORD_MAP, ()))
+    return _legacy_config[1]
+
+def handle_sales_flow(from_number, text, session, FAQ_KEYWORD_MAP, FAQ_RESPONSES, KEYWORDS_GIRASOL, BUSINESS_RULES, RUC_EMPRESA, TITULAR_YAPE, ADMIN_WHATSAPP_NUMBER, intents=None, config=None):
+    # `config` (ConfigSnapshot) trae adelantos, Yape y el resolvedor de distritos ya calculados.
+    intents = intents or classify_message(text, FAQ_KEYWORD_MAP, KEYWORDS_GIRASOL)
+    config = config or _config_for(BUSINESS_RULES, FAQ_RESPONSES, FAQ_KEYWORD_MAP)
+    state = sales_flow.get(session.get('state'))
+    for key in intents.faq:
+        response_text = FAQ_RESPONSES.get(key)
+        if key == 'precio' and session.get('product_name'):
+            response_text = f"¡Claro! El precio de tu pedido (*{session['product_name']}*) es de *S/ {session['product_price']:.2f}*, con envío gratis. 🚚"
+        elif key == 'stock' and session.get('product_name'):
+            response_text = f"¡Sí, claro! Aún tenemos unidades del *{session['product_name']}*. ✨ ¿Iniciamos tu pedido?"
+
+        if response_text:
+            send_text_message(from_number, response_text)
+            if state and state.prompt:
+                send_text_message(from_number, f"¡Espero haber aclarado tu duda! 😊 Continuando...\n\n{state.prompt}", delay=1)
+            return
+
+    if intents.product_id and (state is None or state.restart_on_product):
+        delete_session(from_number)
+        handle_initial_message(from_number, session.get("user_name", "Usuario"), text, FAQ_KEYWORD_MAP, FAQ_RESPONSES, KEYWORDS_GIRASOL, intents)
+        return
+
+    sales_flow.handle(from_number, text, session, intents, rules=config.business_rules, config=config,
+                      ruc=RUC_EMPRESA, titular_yape=TITULAR_YAPE, admin_number=ADMIN_WHATSAPP_NUMBER)
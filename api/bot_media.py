@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - COMPROBANTES DE PAGO (MEDIOS)
+# Resuelve el media ID de WhatsApp, descarga el archivo por bloques (memoria
+# acotada) a /tmp y opcionalmente a un bucket, calcula su sha256 y un hash
+# perceptual (dHash, si Pillow está instalado) y lo registra en `comprobantes`
+# para detectar comprobantes reenviados o reutilizados antes de cerrar la
+# venta o avisar al admin. El mismo archivo (sha256) es un repetido; una
+# imagen parecida (dHash) solo se marca para revisión del admin: muchas
+# capturas de Yape comparten plantilla. Corre dentro del request: en Vercel
+# el proceso se congela tras la respuesta y un pool de fondo no terminaría.
+# El registro en `comprobantes` es solo de Firestore: con otro
+# STORAGE_BACKEND no se detectan repetidos ni parecidos.
+# ==========================================================
+import os
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from bot_db import get_db
+from bot_metrics import metrics
+from bot_whatsapp import get_whatsapp_client
+
+logger = getLogger(__name__)
+
+# MEDIA_ASYNC=1 lo procesa en un pool propio, solo para hosts que siguen corriendo tras la respuesta.
+MEDIA_ASYNC = os.environ.get('MEDIA_ASYNC', '0') == '1'
+MEDIA_WORKERS = int(os.environ.get('MEDIA_WORKERS', '2'))
+MEDIA_CHUNK_BYTES = int(os.environ.get('MEDIA_CHUNK_BYTES', str(64 * 1024)))
+MEDIA_MAX_BYTES = int(os.environ.get('MEDIA_MAX_BYTES', str(16 * 1024 * 1024)))
+MEDIA_DIR = os.environ.get('MEDIA_DIR', os.path.join(tempfile.gettempdir(), 'comprobantes'))
+MEDIA_BUCKET = os.environ.get('MEDIA_BUCKET')  # Firebase Storage opcional
+RECEIPTS_COLLECTION = 'comprobantes'
+
+
+class ReceiptResult:
+    __slots__ = ('media_id', 'sha256', 'phash', 'path', 'size', 'mime_type', 'duplicate_of', 'similar_to',
+                 'registered', 'error')
+
+    def __init__(self, media_id):
+        self.media_id = media_id
+        self.sha256 = self.phash = self.path = self.mime_type = None
+        self.size = 0
+        self.duplicate_of = None  # datos del comprobante anterior si es el mismo archivo
+        self.similar_to = None    # datos de un comprobante anterior con el mismo dHash: revisión manual
+        self.registered = False   # hay un documento en `comprobantes` para este envío (ver release)
+        self.error = None
+
+    @property
+    def verified(self):
+        return self.error is None
+
+    def as_dict(self):
+        return {"media_id": self.media_id, "sha256": self.sha256, "phash": self.phash,
+                "archivo": self.path, "bytes": self.size, "mime_type": self.mime_type,
+                "revision_manual": self.similar_to is not None}
+
+
+def perceptual_hash(path):
+    # dHash de 64 bits: detecta la misma captura recomprimida o reescalada. Pillow es opcional.
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(path) as image:
+            pixels = list(image.convert('L').resize((9, 8)).getdata())
+    except Exception as e:
+        logger.warning(f"[Comprobantes] No se pudo calcular el hash perceptual de {path}: {e}")
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+class ReceiptPipeline:
+    def __init__(self, client_fn=get_whatsapp_client, media_dir=MEDIA_DIR, chunk_bytes=MEDIA_CHUNK_BYTES,
+                 max_bytes=MEDIA_MAX_BYTES, workers=MEDIA_WORKERS, async_mode=MEDIA_ASYNC):
+        self.client_fn = client_fn
+        self.media_dir = media_dir
+        self.chunk_bytes = chunk_bytes
+        self.max_bytes = max_bytes
+        self.workers = max(1, workers)
+        self.async_mode = async_mode
+        self._executor = None
+        self._lock = threading.Lock()
+        self.stats = {"descargados": 0, "bytes": 0, "duplicados": 0, "parecidos": 0, "errores": 0}
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def download(self, media_id, wa_id):
+        result = ReceiptResult(media_id)
+        client = self.client_fn()
+        info = client.get_media_info(media_id)
+        result.mime_type = info.get('mime_type')
+        if (declared := info.get('file_size')) and int(declared) > self.max_bytes:
+            raise ValueError(f"archivo de {declared} bytes supera el máximo de {self.max_bytes}")
+        os.makedirs(self.media_dir, exist_ok=True)
+        extension = (result.mime_type or 'application/octet-stream').split('/')[-1].split(';')[0]
+        partial = os.path.join(self.media_dir, f"{wa_id}-{media_id}.part")
+        digest = hashlib.sha256()
+        response = client.open_media(info['url'])
+        try:
+            with open(partial, 'wb') as f:
+                # Nunca más de un bloque en memoria, sea cual sea el tamaño del archivo.
+                for chunk in response.iter_content(chunk_size=self.chunk_bytes):
+                    if not chunk:
+                        continue
+                    result.size += len(chunk)
+                    if result.size > self.max_bytes:
+                        raise ValueError(f"archivo supera el máximo de {self.max_bytes} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+        except Exception:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        finally:
+            response.close()
+        result.sha256 = digest.hexdigest()
+        if info.get('sha256') and info['sha256'] != result.sha256:
+            logger.warning(f"[Comprobantes] sha256 de {media_id} no coincide con el declarado por Meta.")
+        result.path = os.path.join(self.media_dir, f"{result.sha256}.{extension}")
+        os.replace(partial, result.path)
+        self._count("descargados")
+        self._count("bytes", result.size)
+        return result
+
+    def _upload(self, result):
+        if not MEDIA_BUCKET:
+            return
+        try:
+            from firebase_admin import storage
+            with metrics.call('storage', 'subir_comprobante', count=False):
+                storage.bucket(MEDIA_BUCKET).blob(f"{RECEIPTS_COLLECTION}/{os.path.basename(result.path)}").upload_from_filename(
+                    result.path, content_type=result.mime_type)
+        except Exception as e:
+            logger.error(f"[Comprobantes] Error subiendo {result.path} al bucket: {e}")
+
+    def register(self, result, wa_id, context):
+        # Marca result.duplicate_of si el archivo ya se había recibido y result.similar_to si
+        # otro comprobante tiene la misma imagen reducida. Solo con Firestore (ver bot_storage).
+        db = get_db()
+        if not db: return
+        from google.api_core.exceptions import AlreadyExists
+        from firebase_admin import firestore
+        receipts = db.collection(RECEIPTS_COLLECTION)
+        try:
+            # create() sobre el sha256 es atómico: dos instancias no pueden registrar el mismo archivo.
+            with metrics.call('firestore', 'comprobante'):
+                receipts.document(result.sha256).create({
+                    "cliente_id": wa_id, "contexto": context, "media_id": result.media_id,
+                    "phash": result.phash, "bytes": result.size, "mime_type": result.mime_type,
+                    "recibido": firestore.SERVER_TIMESTAMP})
+        except AlreadyExists:
+            with metrics.call('firestore', 'comprobante'):
+                doc = receipts.document(result.sha256).get()
+            previous = doc.to_dict() if doc.exists else {"cliente_id": None}
+            if previous.get('cliente_id') == wa_id and previous.get('contexto') == context:
+                # El mismo cliente reenvía su captura para el mismo pago: no es un reúso.
+                logger.info(f"[Comprobantes] {wa_id} reenvió su comprobante ({result.sha256[:12]}).")
+                result.registered = True
+                return
+            result.duplicate_of = previous
+            return
+        result.registered = True
+        if result.phash:
+            with metrics.call('firestore', 'comprobante_phash'):
+                similar = receipts.where('phash', '==', result.phash).limit(2).get()
+            result.similar_to = next((d.to_dict() for d in similar if d.id != result.sha256), None)
+
+    def release(self, result):
+        # La venta no se guardó: se borra el registro para que el cliente pueda reenviar la captura.
+        db = get_db()
+        if not db or not result.registered: return
+        try:
+            with metrics.call('firestore', 'comprobante'):
+                db.collection(RECEIPTS_COLLECTION).document(result.sha256).delete()
+            result.registered = False
+        except Exception as e:
+            logger.error(f"[Comprobantes] Error liberando el comprobante {result.sha256[:12]}: {e}")
+
+    def process(self, media_id, wa_id, context):
+        try:
+            result = self.download(media_id, wa_id)
+            result.phash = perceptual_hash(result.path)
+            self._upload(result)
+            self.register(result, wa_id, context)
+            if (previous := result.duplicate_of) is not None:
+                self._count("duplicados")
+                logger.warning(f"[Comprobantes] Comprobante repetido de {wa_id} ({result.sha256[:12]}), "
+                               f"ya recibido de {previous.get('cliente_id')} ({previous.get('contexto')}).")
+            elif (similar := result.similar_to) is not None:
+                self._count("parecidos")
+                logger.warning(f"[Comprobantes] Comprobante de {wa_id} parecido a uno de {similar.get('cliente_id')} "
+                               f"({similar.get('contexto')}); queda para revisión del admin.")
+            else:
+                logger.info(f"[Comprobantes] Comprobante de {wa_id} guardado en {result.path} ({result.size} bytes).")
+            return result
+        except Exception as e:
+            self._count("errores")
+            logger.error(f"[Comprobantes] Error procesando el medio {media_id} de {wa_id}: {e}")
+            result = ReceiptResult(media_id)
+            result.error = str(e)
+            return result
+
+    def submit(self, media_id, wa_id, context, on_result):
+        # on_result(ReceiptResult) continúa el flujo (cerrar venta, avisar al admin) cuando termina.
+        def run():
+            result = self.process(media_id, wa_id, context)
+            try:
+                on_result(result)
+            except Exception as e:
+                logger.error(f"[Comprobantes] Error continuando el flujo de {wa_id}: {e}")
+        if not self.async_mode:
+            run()
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="comprobantes")
+        self._executor.submit(run)
+
+
+receipt_pipeline = ReceiptPipeline()
+metrics.add_stats('bot_comprobantes', lambda: receipt_pipeline.stats)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - MÉTRICAS DEL CAMINO CRÍTICO
+# Histogramas de latencia por llamada externa (Firestore, Graph API, Sheets),
+# por estado de la conversación y por turno; llamadas externas por mensaje;
+# errores; y los contadores `stats` de cada módulo. Se exponen en formato
+# Prometheus en /api/metrics. Con METRICS_ENABLED=0 todo es un no-op.
+# ==========================================================
+import os
+import re
+import time
+import threading
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+_INVALID_NAME_RE = re.compile(r'[^a-zA-Z0-9_]')
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL = _NullTimer()
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class _Timer:
+    __slots__ = ('registry', 'name', 'labels', 'service', 'start')
+
+    def __init__(self, registry, name, labels, service=None):
+        self.registry, self.name, self.labels, self.service = registry, name, labels, service
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None:
+            self.registry.inc('bot_llamada_externa_errores_total' if self.service else 'bot_errores_total', **self.labels)
+        if self.service:
+            self.registry.count_call(self.service)
+        return False
+
+
+class _Turn:
+    __slots__ = ('registry', 'kind', 'start', 'outer')
+
+    def __init__(self, registry, kind):
+        self.registry, self.kind = registry, kind
+
+    def __enter__(self):
+        # Un turno anidado (p. ej. un comprobante procesado en línea) no pisa al de afuera.
+        self.outer = getattr(self.registry._local, 'calls', None)
+        self.registry._local.calls = {}
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        registry = self.registry
+        registry.observe('bot_turno_segundos', time.perf_counter() - self.start, tipo=self.kind)
+        calls, registry._local.calls = registry._local.calls, self.outer
+        for service in registry.services:
+            registry.observe('bot_llamadas_por_mensaje', calls.get(service, 0), buckets=COUNT_BUCKETS, servicio=service)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self, enabled=METRICS_ENABLED, services=('firestore', 'whatsapp', 'sheets')):
+        self.enabled = enabled
+        self.services = services
+        self._histograms = {}   # (nombre, etiquetas) -> _Histogram
+        self._counters = {}     # (nombre, etiquetas) -> valor
+        self._collectors = []   # (prefijo, fn -> dict de stats)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            if (histogram := self._histograms.get(key)) is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def timed(self, name, **labels):
+        # with metrics.timed('bot_estado_segundos', estado=...): ...
+        return _Timer(self, name, labels) if self.enabled else _NULL
+
+    def call(self, service, operation, count=True):
+        # Llamada externa: latencia, errores y cuenta dentro del turno en curso.
+        if not self.enabled:
+            return _NULL
+        return _Timer(self, 'bot_llamada_externa_segundos', {"servicio": service, "operacion": operation},
+                      service if count else None)
+
+    def count_call(self, service):
+        if self.enabled and (calls := getattr(self._local, 'calls', None)) is not None:
+            calls[service] = calls.get(service, 0) + 1
+
+    def turn(self, kind):
+        return _Turn(self, kind) if self.enabled else _NULL
+
+    def add_stats(self, prefix, stats_fn):
+        # Publica un dict `stats` existente como gauges `<prefijo>_<clave>` al momento del scrape.
+        self._collectors.append((prefix, stats_fn))
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+        return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+    def render(self):
+        lines, typed = [], set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            histograms = [(k, h.buckets, list(h.counts), h.sum, h.count) for k, h in self._histograms.items()]
+            counters = list(self._counters.items())
+        for (name, labels), buckets, counts, total, count in sorted(histograms, key=lambda item: item[0]):
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, n in zip(buckets, counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{self._labels(labels)} {total}")
+            lines.append(f"{name}_count{self._labels(labels)} {count}")
+        for (name, labels), value in sorted(counters):
+            declare(name, 'counter')
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for prefix, stats_fn in self._collectors:
+            try:
+                stats = stats_fn() or {}
+            except Exception as e:
+                logger.error(f"[Métricas] Error leyendo stats de {prefix}: {e}")
+                continue
+            for key, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = _INVALID_NAME_RE.sub('_', f"{prefix}_{key}")
+                declare(name, 'gauge')
+                lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
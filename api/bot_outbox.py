@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - PROGRAMADOR DE MENSAJES SALIENTES
+# Encola las secuencias de mensajes por destinatario (con sus pausas)
+# y las envía desde hilos de trabajo. El request no espera cada pausa, pero
+# antes de responder drena la cola (drain): en Vercel el proceso se congela
+# tras la respuesta y lo que quede encolado no saldría hasta el próximo request.
+# ==========================================================
+import os
+import time
+import zlib
+import heapq
+import atexit
+import itertools
+import threading
+from collections import deque
+from logging import getLogger
+from bot_metrics import metrics
+
+logger = getLogger(__name__)
+
+# OUTBOUND_ASYNC=0 restaura el comportamiento anterior (envío y pausa dentro del request).
+OUTBOUND_ASYNC = os.environ.get('OUTBOUND_ASYNC', '1') != '0'
+OUTBOUND_WORKERS = int(os.environ.get('OUTBOUND_WORKERS', '4'))
+# Tope de la espera de drain() antes de responder; 0 = no esperar (solo en hosts que siguen
+# corriendo tras la respuesta).
+OUTBOUND_DRAIN_SECONDS = float(os.environ.get('OUTBOUND_DRAIN_SECONDS', '8'))
+# Mensajes por segundo permitidos por nuestro nivel de la Cloud API (80 es el estándar); 0 = sin límite.
+OUTBOUND_MAX_MPS = float(os.environ.get('OUTBOUND_MAX_MPS', '80'))
+
+
+class _RateLimiter:
+    # Cubeta de tokens compartida por todos los workers.
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_s = (1 - self.tokens) / self.rate
+            time.sleep(wait_s)
+
+
+class _Shard:
+    # Cada destinatario cae siempre en el mismo shard, así su secuencia se envía en orden
+    # mientras que destinatarios distintos avanzan en paralelo.
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.queues = {}   # to_number -> deque[(delay, payload, on_done)]
+        self.ready = []    # heap de (momento_listo, seq, to_number); una entrada por destinatario
+        self.in_flight = 0
+
+
+class OutboundScheduler:
+    def __init__(self, send_fn, workers=OUTBOUND_WORKERS, async_mode=OUTBOUND_ASYNC, max_rate=OUTBOUND_MAX_MPS):
+        self.send_fn = send_fn
+        self.async_mode = async_mode
+        self.limiter = _RateLimiter(max_rate)
+        self.shards = [_Shard() for _ in range(max(1, workers))]
+        self._seq = itertools.count()
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"encolados": 0, "enviados": 0, "fallidos": 0, "retraso_max_s": 0.0}
+
+    def _shard_for(self, to_number):
+        return self.shards[zlib.crc32(str(to_number).encode()) % len(self.shards)]
+
+    def _ensure_workers(self):
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            for i, shard in enumerate(self.shards):
+                threading.Thread(target=self._worker, args=(shard,), name=f"outbound-{i}", daemon=True).start()
+            self._started = True
+
+    def schedule(self, to_number, payload, delay=0, on_done=None):
+        """Encola un mensaje; `delay` es la pausa respecto al mensaje anterior del mismo destinatario.
+        `on_done(ok)` se llama tras el intento de envío."""
+        if not self.async_mode:
+            if delay:
+                time.sleep(delay)
+            self._send(to_number, payload, 0.0, on_done)
+            return
+        self._ensure_workers()
+        shard = self._shard_for(to_number)
+        with shard.cond:
+            if to_number in shard.queues:
+                shard.queues[to_number].append((delay, payload, on_done))
+            else:
+                shard.queues[to_number] = deque([(delay, payload, on_done)])
+                heapq.heappush(shard.ready, (time.monotonic() + delay, next(self._seq), to_number))
+            shard.cond.notify()
+        with self._stats_lock:
+            self.stats["encolados"] += 1
+
+    def _worker(self, shard):
+        while True:
+            with shard.cond:
+                while True:
+                    if not shard.ready:
+                        shard.cond.wait()
+                        continue
+                    wait_s = shard.ready[0][0] - time.monotonic()
+                    if wait_s > 0:
+                        shard.cond.wait(wait_s)
+                        continue
+                    ready_at, _, to_number = heapq.heappop(shard.ready)
+                    _, payload, on_done = shard.queues[to_number].popleft()
+                    shard.in_flight += 1
+                    break
+            self._send(to_number, payload, time.monotonic() - ready_at, on_done)
+            with shard.cond:
+                shard.in_flight -= 1
+                pending = shard.queues[to_number]
+                if pending:
+                    # La pausa del siguiente mensaje cuenta desde que terminó el envío anterior.
+                    heapq.heappush(shard.ready, (time.monotonic() + pending[0][0], next(self._seq), to_number))
+                else:
+                    del shard.queues[to_number]
+                shard.cond.notify_all()
+
+    def _send(self, to_number, payload, lag, on_done=None):
+        ok = True
+        self.limiter.acquire()
+        try:
+            ok = self.send_fn(to_number, payload) is not False
+        except Exception as e:
+            ok = False
+            logger.error(f"[Outbound] Error enviando a {to_number}: {e}")
+        with self._stats_lock:
+            self.stats["enviados" if ok else "fallidos"] += 1
+            self.stats["retraso_max_s"] = max(self.stats["retraso_max_s"], lag)
+        metrics.observe('bot_envio_retraso_segundos', lag)
+        if on_done is not None:
+            try:
+                on_done(ok)
+            except Exception as e:
+                logger.error(f"[Outbound] Error en el callback de {to_number}: {e}")
+
+    def pending(self):
+        total = 0
+        for shard in self.shards:
+            with shard.cond:
+                total += sum(len(q) for q in shard.queues.values()) + shard.in_flight
+        return total
+
+    def flush(self, timeout=None):
+        """Espera a que se vacíen todas las colas. Devuelve False si vence el timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for shard in self.shards:
+            with shard.cond:
+                while shard.queues or shard.in_flight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    shard.cond.wait(remaining)
+        return True
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_outbound_scheduler(send_fn):
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = OutboundScheduler(send_fn)
+                # Al apagar la instancia intentamos no perder mensajes ya encolados.
+                atexit.register(_scheduler.flush, 10)
+    return _scheduler
+
+def drain(timeout=OUTBOUND_DRAIN_SECONDS):
+    # Se llama al final del request que encoló mensajes. Devuelve False si quedaron pendientes.
+    if _scheduler is None or not _scheduler.async_mode or timeout <= 0:
+        return True
+    if not (drained := _scheduler.flush(timeout)):
+        logger.warning(f"[Outbound] {_scheduler.pending()} mensajes siguen pendientes tras {timeout:g} s.")
+    return drained
+
+metrics.add_stats('bot_salientes', lambda: {**_scheduler.stats, "pendientes": _scheduler.pending()} if _scheduler else {})
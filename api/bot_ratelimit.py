@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - LÍMITE POR CLIENTE Y DESCARTE POR CARGA
+# Antes de procesar un mensaje (y de gastar lecturas de Firestore o envíos
+# de la Graph API) se toma un token de la cubeta del wa_id: USER_BURST
+# mensajes seguidos y luego USER_RATE_PER_MIN por minuto. Las cubetas viven
+# en memoria o, con RATE_LIMIT_REDIS_URL, en Redis compartido entre
+# instancias. Un cliente con sesión activa o pedido abierto nunca pierde sus
+# respuestas con botón ni su comprobante (imagen): esos pasan siempre. Lo que
+# excede el límite:
+#   - coalesce: el texto se guarda y se procesa junto con el próximo texto
+#     admitido del cliente (un solo turno); si no llega en
+#     RATE_LIMIT_HOLD_SECONDS, se descarta como en drop;
+#   - drop: se descarta y el cliente recibe un único aviso por ventana.
+# Además, como mucho WEBHOOK_MAX_INFLIGHT mensajes se procesan a la vez en la
+# instancia; el resto espera RATE_LIMIT_WAIT_SECONDS y luego se descarta.
+# ==========================================================
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from logging import getLogger
+from bot_metrics import metrics
+from bot_utils import send_text_message, get_session, get_open_order
+
+logger = getLogger(__name__)
+
+USER_RATE_PER_MIN = float(os.environ.get('USER_RATE_PER_MIN', '20'))  # 0 = sin límite por cliente
+USER_BURST = float(os.environ.get('USER_BURST', '30'))  # bien por encima de un embudo (~11 mensajes)
+RATE_LIMIT_MODE = os.environ.get('RATE_LIMIT_MODE', 'coalesce')     # coalesce | drop
+RATE_LIMIT_PENDING_MAX = int(os.environ.get('RATE_LIMIT_PENDING_MAX', '5'))
+RATE_LIMIT_HOLD_SECONDS = float(os.environ.get('RATE_LIMIT_HOLD_SECONDS', '30'))
+RATE_LIMIT_NOTICE_SECONDS = float(os.environ.get('RATE_LIMIT_NOTICE_SECONDS', '300'))
+RATE_LIMIT_TRACKED = int(os.environ.get('RATE_LIMIT_TRACKED', '10000'))
+RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL')
+WEBHOOK_MAX_INFLIGHT = int(os.environ.get('WEBHOOK_MAX_INFLIGHT', '32'))
+RATE_LIMIT_WAIT_SECONDS = float(os.environ.get('RATE_LIMIT_WAIT_SECONDS', '5'))
+# Tipos que avanzan una compra en curso (botones Sí/No, oferta, comprobante).
+ENGAGED_TYPES = ('interactive', 'button', 'image')
+THROTTLE_NOTICE = ("Estoy recibiendo muchos mensajes tuyos seguidos. 😅 Dame unos segundos y "
+                   "vuelve a escribirme tu consulta en un solo mensaje, por favor.")
+
+# Cubeta atómica en Redis: {tokens, actualizado} por wa_id, con expiración.
+_REDIS_BUCKET = """
+local rate, capacity, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 't', 'u')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 't', tokens, 'u', now)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return allowed
+"""
+
+
+class _MemoryBuckets:
+    def __init__(self, rate, capacity, tracked=RATE_LIMIT_TRACKED):
+        self.rate, self.capacity, self.tracked = rate, capacity, tracked
+        self._buckets = OrderedDict()  # wa_id -> [tokens, actualizado]
+        self._lock = threading.Lock()
+
+    def take(self, wa_id):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.pop(wa_id, None) or [self.capacity, now]
+            bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            allowed = bucket[0] >= 1
+            if allowed:
+                bucket[0] -= 1
+            self._buckets[wa_id] = bucket
+            while len(self._buckets) > self.tracked:
+                self._buckets.popitem(last=False)
+            return allowed
+
+
+class _RedisBuckets:
+    # Compartido entre instancias; ante un error de Redis decide la cubeta local.
+    def __init__(self, url, rate, capacity, fallback):
+        import redis
+        self.rate, self.capacity, self.fallback = rate, capacity, fallback
+        self.ttl = int(capacity / rate) + 60
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self._script = self._client.register_script(_REDIS_BUCKET)
+
+    def take(self, wa_id):
+        try:
+            with metrics.call('redis', 'limite', count=False):
+                return bool(self._script(keys=[f"limite:{wa_id}"],
+                                         args=[self.rate, self.capacity, time.time(), self.ttl]))
+        except Exception as e:
+            logger.warning(f"[Límite] Redis no disponible, se usa la cubeta local: {e}")
+            return self.fallback.take(wa_id)
+
+
+class RateLimiter:
+    def __init__(self, rate_per_min=USER_RATE_PER_MIN, burst=USER_BURST, mode=RATE_LIMIT_MODE,
+                 max_inflight=WEBHOOK_MAX_INFLIGHT, wait_seconds=RATE_LIMIT_WAIT_SECONDS,
+                 redis_url=RATE_LIMIT_REDIS_URL, exempt=(), notify_fn=None, engaged_fn=None,
+                 hold_seconds=RATE_LIMIT_HOLD_SECONDS):
+        self.enabled = rate_per_min > 0
+        self.mode = mode if mode in ('coalesce', 'drop') else 'coalesce'
+        self.wait_seconds = wait_seconds
+        self.hold_seconds = hold_seconds
+        self.exempt = set(filter(None, exempt))
+        self.notify_fn = notify_fn or (lambda wa_id: send_text_message(wa_id, THROTTLE_NOTICE, coalesce=False))
+        self.engaged_fn = engaged_fn or (lambda wa_id: bool(get_session(wa_id) or get_open_order(wa_id)))
+        rate, capacity = rate_per_min / 60.0, max(1.0, burst)
+        self.buckets = _MemoryBuckets(rate, capacity)
+        if self.enabled and redis_url:
+            try:
+                self.buckets = _RedisBuckets(redis_url, rate, capacity, self.buckets)
+            except Exception as e:
+                logger.error(f"[Límite] No se pudo usar Redis ({e}); cubetas en memoria.")
+        self._inflight = threading.BoundedSemaphore(max_inflight) if max_inflight > 0 else None
+        self._pending = OrderedDict()   # wa_id -> (retenido desde, [textos excedentes]), el más viejo primero
+        self._notified = OrderedDict()  # wa_id -> último aviso (monotonic)
+        self._lock = threading.Lock()
+        self.stats = {"admitidos": 0, "limitados": 0, "agrupados": 0, "descartados": 0,
+                      "avisos": 0, "exentos_compra": 0, "descartados_carga": 0, "en_curso": 0, "en_curso_max": 0}
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _hold(self, message):
+        # Guarda el texto para el próximo turno; devuelve False si no se pudo (no es texto o ya hay muchos).
+        if self.mode != 'coalesce' or message.get('type') != 'text':
+            return False
+        wa_id = message.get('from')
+        evicted = None
+        with self._lock:
+            _, pending = self._pending.setdefault(wa_id, (time.monotonic(), []))
+            if len(pending) >= RATE_LIMIT_PENDING_MAX:
+                return False
+            pending.append(message.get('text', {}).get('body', ''))
+            if len(self._pending) > RATE_LIMIT_TRACKED:
+                evicted = self._pending.popitem(last=False)
+            self.stats["agrupados"] += 1
+        if evicted:
+            self._discard(evicted[0], len(evicted[1][1]))
+        return True
+
+    def _expire_held(self):
+        # Textos retenidos cuyo cliente no volvió a escribir: se descartan con el aviso de drop.
+        # Se revisa con cada mensaje que llega a la instancia (el proceso puede estar congelado entre medio).
+        expired, limit = [], time.monotonic() - self.hold_seconds
+        with self._lock:
+            while self._pending and next(iter(self._pending.values()))[0] < limit:
+                wa_id, (_, texts) = self._pending.popitem(last=False)
+                expired.append((wa_id, len(texts)))
+        for wa_id, count in expired:
+            logger.info(f"[Límite] {count} texto(s) retenido(s) de {wa_id} vencieron sin otro mensaje.")
+            self._discard(wa_id, count)
+
+    def _drop(self, message):
+        self._discard(message.get('from'))
+
+    def _discard(self, wa_id, count=1):
+        self._count("descartados", count)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._notified.get(wa_id, float('-inf')) < RATE_LIMIT_NOTICE_SECONDS:
+                return
+            self._notified[wa_id] = now
+            self._notified.move_to_end(wa_id)
+            while len(self._notified) > RATE_LIMIT_TRACKED:
+                self._notified.popitem(last=False)
+            self.stats["avisos"] += 1
+        try:
+            self.notify_fn(wa_id)
+        except Exception as e:
+            logger.error(f"[Límite] Error avisando a {wa_id}: {e}")
+
+    def _engaged(self, message):
+        # Solo se consulta cuando la cubeta está vacía: sesión y pedido abierto suelen estar en caché.
+        if message.get('type') not in ENGAGED_TYPES:
+            return False
+        try:
+            return self.engaged_fn(message.get('from'))
+        except Exception as e:
+            logger.error(f"[Límite] Error consultando la compra en curso de {message.get('from')}: {e}")
+            return True
+
+    def admit(self, message):
+        # Devuelve el mensaje a procesar (con los textos retenidos delante) o None si se retuvo o descartó.
+        wa_id = message.get('from')
+        if not self.enabled or wa_id in self.exempt:
+            return message
+        if self._pending:
+            self._expire_held()
+        if not self.buckets.take(wa_id):
+            if self._engaged(message):
+                self._count("exentos_compra")
+                return message
+            self._count("limitados")
+            if not self._hold(message):
+                self._drop(message)
+            logger.info(f"[Límite] Mensaje de {wa_id} sobre el límite ({self.mode}).")
+            return None
+        self._count("admitidos")
+        if message.get('type') == 'text':
+            with self._lock:
+                _, held = self._pending.pop(wa_id, (None, None))
+            if held:
+                body = '\n'.join(held + [message.get('text', {}).get('body', '')])
+                message = {**message, "text": {**message.get('text', {}), "body": body}}
+        return message
+
+    @contextmanager
+    def inflight(self, message):
+        # Techo global de mensajes en proceso; True si hay lugar para este mensaje. Si no lo hay,
+        # el llamador libera su message_id para que la reentrega de Meta lo procese.
+        if self._inflight is None:
+            yield True
+            return
+        if not self._inflight.acquire(timeout=self.wait_seconds):
+            self._count("descartados_carga")
+            logger.warning(f"[Límite] Instancia saturada: mensaje de {message.get('from')} queda para la reentrega.")
+            yield False
+            return
+        with self._lock:
+            self.stats["en_curso"] += 1
+            self.stats["en_curso_max"] = max(self.stats["en_curso_max"], self.stats["en_curso"])
+        try:
+            yield True
+        finally:
+            with self._lock:
+                self.stats["en_curso"] -= 1
+            self._inflight.release()
+
+
+rate_limiter = RateLimiter(exempt=(os.environ.get('ADMIN_WHATSAPP_NUMBER'),))
+metrics.add_stats('bot_limite', lambda: rate_limiter.stats)
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - AGREGADOS DE VENTAS Y CONSULTA PAGINADA
+# Los totales del negocio se mantienen al escribir, no al leer: cada venta
+# suma en el agregado de su día y en el total general (saldo pendiente,
+# conteos por estado_pedido y tipo_envio) dentro del mismo commit del
+# checkout. Cada agregado está repartido en AGGREGATE_SHARDS documentos
+# para que ventas simultáneas no compitan por el mismo documento; al leer
+# se suman los shards. Una venta contada lleva `en_agregados: True`: solo
+# esas cambian de estado al cerrarse (en el total y en el día de la venta),
+# y backfill_aggregates() cuenta las anteriores a los agregados. El saldo
+# pendiente solo se lleva en el total. La lista de ventas se pagina con
+# cursor sobre (fecha, id_venta), con los índices de firestore.indexes.json.
+# Solo con Firestore: con otro STORAGE_BACKEND get_db() es None y las
+# funciones devuelven None (ver bot_storage).
+# ==========================================================
+import os
+import re
+import json
+import base64
+import random
+import time
+import unicodedata
+from datetime import datetime, date, timedelta, timezone
+from logging import getLogger
+from bot_db import get_db
+from bot_metrics import metrics
+
+logger = getLogger(__name__)
+
+AGGREGATE_SHARDS = int(os.environ.get('AGGREGATE_SHARDS', '10'))
+AGGREGATES_COLLECTION = 'agregados_ventas'
+TOTAL_PERIOD = 'total'
+LIMA_TZ = timezone(timedelta(hours=-5))
+ADMIN_PAGE_SIZE = 50
+ADMIN_PAGE_MAX = 200
+ADMIN_SUMMARY_MAX_DAYS = 366
+OPEN_STATUS = "Adelanto Pagado"
+SALE_FILTERS = ('estado_pedido', 'tipo_envio', 'cliente_id')
+AGGREGATED_FIELD = 'en_agregados'
+BACKFILL_PAGE_SIZE = 150  # 3 escrituras por venta (día, total y marca): menos de 500 por commit
+BACKFILL_MAX_SECONDS = float(os.environ.get('BACKFILL_MAX_SECONDS', '20'))
+
+
+def _slug(value):
+    text = unicodedata.normalize('NFD', str(value or 'sin_dato'))
+    text = ''.join(c for c in text if unicodedata.category(c) != 'Mn').lower()
+    return re.sub(r'[^a-z0-9]+', '_', text).strip('_') or 'sin_dato'
+
+
+def today():
+    return datetime.now(LIMA_TZ).date().isoformat()
+
+
+def _shard_ref(db, period):
+    return db.collection(AGGREGATES_COLLECTION).document(f"{period}-{random.randrange(AGGREGATE_SHARDS)}")
+
+
+def add_sale_to_batch(batch, db, sale_data, day=None):
+    # La venta suma en su día y en el total, en el mismo batch que la guarda (con AGGREGATED_FIELD).
+    from firebase_admin import firestore
+    precio = sale_data.get('precio_venta') or 0
+    adelanto = sale_data.get('adelanto_recibido') or 0
+    saldo = sale_data.get('saldo_restante') or 0
+    pendiente = saldo if sale_data.get('estado_pedido') == OPEN_STATUS else 0
+    envio = f"envio_{_slug(sale_data.get('tipo_envio'))}"
+    estado = f"estado_{_slug(sale_data.get('estado_pedido'))}"
+    day = day or today()
+    batch.set(_shard_ref(db, day), {
+        "periodo": day, "ventas": firestore.Increment(1), "monto_total": firestore.Increment(precio),
+        "adelantos": firestore.Increment(adelanto), "saldo_generado": firestore.Increment(saldo),
+        envio: firestore.Increment(1), estado: firestore.Increment(1)}, merge=True)
+    batch.set(_shard_ref(db, TOTAL_PERIOD), {
+        "periodo": TOTAL_PERIOD, "ventas": firestore.Increment(1), "monto_total": firestore.Increment(precio),
+        "saldo_pendiente": firestore.Increment(pendiente),
+        envio: firestore.Increment(1), estado: firestore.Increment(1)}, merge=True)
+
+
+def add_status_change_to_batch(batch, db, sale_data, new_status):
+    # Al cerrar un pedido: pasa de un estado a otro y, si tenía saldo pendiente, deja de contar,
+    # en el total y en el día de la venta. Una venta que nunca se contó no resta (hasta que
+    # backfill_aggregates la cuente).
+    from firebase_admin import firestore
+    old_status = sale_data.get('estado_pedido')
+    if old_status == new_status or not sale_data.get(AGGREGATED_FIELD):
+        return
+    update = {f"estado_{_slug(old_status)}": firestore.Increment(-1),
+              f"estado_{_slug(new_status)}": firestore.Increment(1)}
+    if isinstance(sale_data.get('fecha'), datetime):
+        day = _sale_day(sale_data)
+        batch.set(_shard_ref(db, day), {"periodo": day, **update}, merge=True)
+    else:
+        # Sin fecha no se sabe en qué día se contó: solo se corrige el total.
+        logger.warning(f"[Agregados] Venta {sale_data.get('id_venta')} sin fecha: no se mueve su día.")
+    if old_status == OPEN_STATUS and (saldo := sale_data.get('saldo_restante')):
+        update["saldo_pendiente"] = firestore.Increment(-saldo)
+    batch.set(_shard_ref(db, TOTAL_PERIOD), {"periodo": TOTAL_PERIOD, **update}, merge=True)
+
+
+def _sale_day(sale_data):
+    fecha = sale_data.get('fecha')
+    return fecha.astimezone(LIMA_TZ).date().isoformat() if isinstance(fecha, datetime) else today()
+
+
+def backfill_aggregates(page_size=BACKFILL_PAGE_SIZE, max_seconds=BACKFILL_MAX_SECONDS):
+    # Una sola vez tras desplegar los agregados: cuenta las ventas sin AGGREGATED_FIELD con su
+    # estado actual. Se puede repetir (las ya contadas se saltan) hasta que `completo` sea True.
+    db = get_db()
+    if not db: return None
+    collection = db.collection('ventas')
+    started, last = time.monotonic(), None
+    report = {"revisadas": 0, "agregadas": 0, "conflictos": 0, "completo": False}
+    while time.monotonic() - started < max_seconds:
+        query = collection.order_by('__name__').limit(page_size)
+        if last is not None:
+            query = query.start_after(last)
+        with metrics.call('firestore', 'agregados_backfill'):
+            docs = query.get()
+        if not docs:
+            report["completo"] = True
+            break
+        pending = [doc for doc in docs if not doc.get(AGGREGATED_FIELD)]
+        if pending:
+            batch = db.batch()
+            for doc in pending:
+                sale = doc.to_dict()
+                add_sale_to_batch(batch, db, sale, day=_sale_day(sale))
+                # Precondición: si la venta cambió de estado desde la lectura, la página se relee.
+                update_time = getattr(doc, 'update_time', None)
+                option = db.write_option(last_update_time=update_time) if update_time is not None else None
+                batch.update(doc.reference, {AGGREGATED_FIELD: True}, option=option)
+            try:
+                with metrics.call('firestore', 'agregados_backfill'):
+                    batch.commit()
+            except Exception as e:
+                report["conflictos"] += 1
+                logger.warning(f"[Agregados] Página rechazada ({e}); se vuelve a leer.")
+                continue
+            report["agregadas"] += len(pending)
+        report["revisadas"] += len(docs)
+        if len(docs) < page_size:
+            report["completo"] = True
+            break
+        last = docs[-1]
+    logger.info(f"[Agregados] Backfill: {report}")
+    return report
+
+
+def _merge_shards(docs):
+    # {periodo: {campo: suma de los shards}}
+    periods = {}
+    for doc in docs:
+        if not doc.exists:
+            continue
+        data = doc.to_dict() or {}
+        totals = periods.setdefault(data.get('periodo'), {})
+        for key, value in data.items():
+            if key != 'periodo' and isinstance(value, (int, float)):
+                totals[key] = totals.get(key, 0) + value
+    return periods
+
+
+def read_aggregates(desde, hasta):
+    # Totales generales y por día en [desde, hasta] (YYYY-MM-DD): lee shards, nunca `ventas`.
+    db = get_db()
+    if not db: return None
+    collection = db.collection(AGGREGATES_COLLECTION)
+    refs = [collection.document(f"{TOTAL_PERIOD}-{i}") for i in range(AGGREGATE_SHARDS)]
+    with metrics.call('firestore', 'agregados'):
+        totals = _merge_shards(db.get_all(refs)).get(TOTAL_PERIOD, {})
+    with metrics.call('firestore', 'agregados'):
+        days = _merge_shards(collection.where('periodo', '>=', desde).where('periodo', '<=', hasta).get())
+    return {"totales": totals, "por_dia": [dict(fecha=day, **days[day]) for day in sorted(days)]}
+
+
+def encode_cursor(sale):
+    fecha = sale.get('fecha')
+    raw = json.dumps({"f": fecha.isoformat() if isinstance(fecha, datetime) else fecha, "id": sale.get('id_venta')})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    raw = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    return {"fecha": datetime.fromisoformat(raw["f"]) if raw.get("f") else None, "id_venta": raw["id"]}
+
+
+def _parse_day(value, field):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{field}' debe tener el formato YYYY-MM-DD")
+
+
+def _serialize(sale):
+    return {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in sale.items()}
+
+
+def list_sales(filters=None, desde=None, hasta=None, limit=ADMIN_PAGE_SIZE, cursor=None):
+    # Una página de ventas, de la más reciente a la más antigua. Lanza ValueError si los parámetros no son válidos.
+    from firebase_admin import firestore
+    db = get_db()
+    if not db: return None
+    limit = max(1, min(int(limit or ADMIN_PAGE_SIZE), ADMIN_PAGE_MAX))
+    query = db.collection('ventas')
+    for field, value in (filters or {}).items():
+        if field not in SALE_FILTERS:
+            raise ValueError(f"Filtro no soportado: {field}")
+        if value:
+            query = query.where(field, '==', value)
+    if desde:
+        start = _parse_day(desde, 'desde')
+        query = query.where('fecha', '>=', datetime(start.year, start.month, start.day, tzinfo=LIMA_TZ))
+    if hasta:
+        end = _parse_day(hasta, 'hasta') + timedelta(days=1)
+        query = query.where('fecha', '<', datetime(end.year, end.month, end.day, tzinfo=LIMA_TZ))
+    query = query.order_by('fecha', direction=firestore.Query.DESCENDING) \
+                 .order_by('id_venta', direction=firestore.Query.DESCENDING)
+    if cursor:
+        try:
+            query = query.start_after(decode_cursor(cursor))
+        except Exception:
+            raise ValueError("Cursor inválido")
+    # Un documento de más indica si hay otra página, sin contar ni saltar registros.
+    with metrics.call('firestore', 'admin_ventas'):
+        docs = query.limit(limit + 1).get()
+    sales = [doc.to_dict() for doc in docs[:limit]]
+    return {"ventas": [_serialize(sale) for sale in sales],
+            "siguiente": encode_cursor(sales[-1]) if len(docs) > limit else None}
+
+
+def summary_range(desde=None, hasta=None, days=30):
+    end = _parse_day(hasta, 'hasta') if hasta else date.fromisoformat(today())
+    start = _parse_day(desde, 'desde') if desde else end - timedelta(days=days - 1)
+    if start > end or (end - start).days >= ADMIN_SUMMARY_MAX_DAYS:
+        raise ValueError(f"Rango de fechas inválido (máximo {ADMIN_SUMMARY_MAX_DAYS} días)")
+    return start.isoformat(), end.isoformat()
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - GOOGLE SHEETS
+# Cliente gspread y hoja de pedidos cacheados por instancia, índice
+# en memoria WhatsApp ID -> clave de recojo (columnas L:O) y exportación
+# de pedidos en lotes con append_rows. Cada venta se guarda con
+# `exportado: False` y se marca al llegar a la hoja: lo que un proceso
+# congelado o un lote fallido dejó pendiente lo recupera recover() (ver
+# /api/admin/sheets/exportar).
+# ==========================================================
+import os
+import json
+import time
+import atexit
+import threading
+from datetime import datetime
+from logging import getLogger
+from bot_startup import startup_profile
+from bot_metrics import metrics
+from bot_storage import get_storage
+
+logger = getLogger(__name__)
+
+SHEETS_INDEX_TTL = float(os.environ.get('SHEETS_INDEX_TTL', '60'))
+# Ante un cliente desconocido se vuelve a leer la hoja, pero no más de una vez cada N segundos.
+SHEETS_INDEX_MIN_REFRESH = float(os.environ.get('SHEETS_INDEX_MIN_REFRESH', '10'))
+CLAVE_RANGE = 'L:O'  # L = WhatsApp ID, O = Clave
+SHEETS_BATCH_SIZE = int(os.environ.get('SHEETS_BATCH_SIZE', '20'))
+SHEETS_FLUSH_SECONDS = float(os.environ.get('SHEETS_FLUSH_SECONDS', '5'))
+SHEETS_RETRY_MAX_SECONDS = 300
+SHEETS_RECOVER_LIMIT = int(os.environ.get('SHEETS_RECOVER_LIMIT', '200'))
+EXPORTED_FIELD = 'exportado'
+
+_worksheet = None
+_worksheet_lock = threading.Lock()
+
+def get_worksheet():
+    # Autentica y abre la hoja una sola vez; si falla, se reintenta en la próxima llamada.
+    global _worksheet
+    if _worksheet is not None:
+        return _worksheet
+    with _worksheet_lock:
+        if _worksheet is None:
+            creds_json_str = os.environ.get('GOOGLE_CREDENTIALS_JSON')
+            sheet_name = os.environ.get('GOOGLE_SHEET_NAME')
+            if not creds_json_str or not sheet_name:
+                logger.error("[Sheets] Faltan variables de entorno para Google Sheets.")
+                return None
+            with startup_profile.measure('init:sheets'):
+                import gspread
+                gc = gspread.service_account_from_dict(json.loads(creds_json_str))
+                _worksheet = gc.open(sheet_name).sheet1
+            logger.info(f"[Sheets] Hoja '{sheet_name}' abierta.")
+    return _worksheet
+
+def reset_worksheet():
+    global _worksheet
+    with _worksheet_lock:
+        _worksheet = None
+
+
+class ClaveIndex:
+    def __init__(self, ttl=SHEETS_INDEX_TTL, min_refresh=SHEETS_INDEX_MIN_REFRESH, worksheet_fn=get_worksheet):
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        self.worksheet_fn = worksheet_fn
+        self.claves = {}
+        self.loaded_at = None
+        self._lock = threading.Lock()
+        self.stats = {"lecturas_hoja": 0, "consultas": 0}
+
+    def _age(self):
+        return float('inf') if self.loaded_at is None else time.monotonic() - self.loaded_at
+
+    def refresh(self):
+        worksheet = self.worksheet_fn()
+        if worksheet is None:
+            return False
+        # Una sola lectura masiva de L:O en lugar de find() + cell() por consulta.
+        with metrics.call('sheets', 'leer_claves'):
+            rows = worksheet.get_values(CLAVE_RANGE)
+        claves = {}
+        for row in rows:
+            if row and (wa_id := str(row[0]).strip()):
+                # La fila más reciente de un cliente (la última) es la de su pedido abierto.
+                claves[wa_id] = (row[3].strip() if len(row) > 3 else '') or None
+        with self._lock:
+            self.claves, self.loaded_at = claves, time.monotonic()
+        self.stats["lecturas_hoja"] += 1
+        return True
+
+    def lookup(self, cliente_id):
+        self.stats["consultas"] += 1
+        cliente_id = str(cliente_id)
+        if self._age() > self.ttl:
+            self.refresh()
+        elif (cliente_id not in self.claves or not self.claves[cliente_id]) and self._age() > self.min_refresh:
+            # Pedido o clave recién añadidos a la hoja.
+            self.refresh()
+        return cliente_id in self.claves, self.claves.get(cliente_id)
+
+
+clave_index = ClaveIndex()
+metrics.add_stats('bot_sheets_claves', lambda: clave_index.stats)
+
+def find_key_in_sheet(cliente_id):
+    try:
+        found, clave = clave_index.lookup(cliente_id)
+        if found:
+            logger.info(f"[Sheets] Clave encontrada para {cliente_id}: {'Sí' if clave else 'No'}")
+            return clave
+        logger.warning(f"[Sheets] No se encontró la fila para el cliente {cliente_id}.")
+        return None
+    except Exception as e:
+        logger.error(f"[Sheets] ERROR buscando la clave: {e}")
+        reset_worksheet()
+        return None
+
+
+# ==============================================================================
+# EXPORTACIÓN DE PEDIDOS POR LOTES
+# ==============================================================================
+def build_order_row(sale_data):
+    # Una venta recuperada conserva su fecha; una recién cerrada todavía no la trae.
+    fecha = sale_data.get('fecha') if isinstance(sale_data.get('fecha'), datetime) else datetime.now()
+    return [
+        fecha.strftime("%d/%m/%Y %H:%M:%S"),
+        sale_data.get('id_venta', 'N/A'),
+        sale_data.get('producto_nombre', 'N/A'),
+        sale_data.get('precio_venta', 0),
+        sale_data.get('tipo_envio', 'N/A'),
+        sale_data.get('metodo_pago', 'N/A'),
+        sale_data.get('adelanto_recibido', 0),
+        sale_data.get('saldo_restante', 0),
+        sale_data.get('provincia', 'N/A'),
+        sale_data.get('distrito', 'N/A'),
+        sale_data.get('detalles_cliente', 'N/A'),
+        sale_data.get('cliente_id', 'N/A')
+    ]
+
+
+class OrderExporter:
+    # Acumula filas y las envía con un solo append_rows cuando hay `batch_size` filas
+    # o la más antigua lleva `max_wait` segundos. Si el envío falla, las filas vuelven
+    # al inicio del buffer y se reintenta con backoff. El buffer es solo de esta instancia:
+    # lo que no llegó a la hoja sigue con `exportado: False` en el almacén y recover() lo retoma.
+    def __init__(self, worksheet_fn=get_worksheet, batch_size=SHEETS_BATCH_SIZE, max_wait=SHEETS_FLUSH_SECONDS,
+                 storage_fn=get_storage):
+        self.worksheet_fn = worksheet_fn
+        self.storage_fn = storage_fn
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait
+        self.buffer = []            # [(sale_id, fila)]
+        self.oldest_at = None
+        self.retry_at = 0.0
+        self.failures = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self.stats = {"filas_encoladas": 0, "filas_exportadas": 0, "lotes": 0, "lotes_fallidos": 0,
+                      "filas_recuperadas": 0, "marcas_fallidas": 0}
+
+    def enqueue(self, sale_data):
+        with self._cond:
+            self.buffer.append((sale_data.get('id_venta'), build_order_row(sale_data)))
+            self.oldest_at = self.oldest_at or time.monotonic()
+            self.stats["filas_encoladas"] += 1
+            self._ensure_thread()
+            self._cond.notify()
+
+    def recover(self, limit=SHEETS_RECOVER_LIMIT):
+        # Encola las ventas del almacén que siguen sin exportar (y no están ya en el buffer).
+        storage = self.storage_fn()
+        if not storage: return 0
+        sales = storage.pending_exports(limit)
+        with self._cond:
+            known = {sale_id for sale_id, _ in self.buffer}
+            fresh = [sale for sale in sales if sale.get('id_venta') not in known]
+            self.buffer.extend((sale.get('id_venta'), build_order_row(sale)) for sale in fresh)
+            if fresh:
+                self.oldest_at = self.oldest_at or time.monotonic()
+            self.stats["filas_recuperadas"] += len(fresh)
+        if fresh:
+            logger.info(f"[Sheets] {len(fresh)} pedidos sin exportar recuperados del almacén.")
+        return len(fresh)
+
+    def _mark_exported(self, sale_ids):
+        # Si la marca falla, la fila puede volver a exportarse en una recuperación (mejor que perderla).
+        storage = self.storage_fn()
+        if not storage or not (sale_ids := [i for i in sale_ids if i]): return
+        try:
+            storage.mark_exported(sale_ids)
+        except Exception as e:
+            self.stats["marcas_fallidas"] += 1
+            logger.error(f"[Sheets] Error marcando {len(sale_ids)} pedidos como exportados: {e}")
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sheets-exporter", daemon=True)
+            self._thread.start()
+
+    def _due_in(self):
+        if not self.buffer:
+            return None
+        now = time.monotonic()
+        if now < self.retry_at:
+            return self.retry_at - now
+        if len(self.buffer) >= self.batch_size:
+            return 0
+        return max(0.0, self.oldest_at + self.max_wait - now)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while (wait_s := self._due_in()) is None or wait_s > 0:
+                    self._cond.wait(wait_s)
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._cond:
+                batch, self.buffer, self.oldest_at = self.buffer, [], None
+            if not batch:
+                return True
+            try:
+                worksheet = self.worksheet_fn()
+                if worksheet is None:
+                    raise RuntimeError("hoja no disponible")
+                while batch:
+                    chunk = batch[:self.batch_size]
+                    with metrics.call('sheets', 'exportar_pedidos'):
+                        worksheet.append_rows([row for _, row in chunk])
+                    batch = batch[self.batch_size:]
+                    self._mark_exported([sale_id for sale_id, _ in chunk])
+                    self.stats["lotes"] += 1
+                    self.stats["filas_exportadas"] += len(chunk)
+                self.failures, self.retry_at = 0, 0.0
+                logger.info(f"[Sheets] Lote exportado; total exportado: {self.stats['filas_exportadas']} filas.")
+                return True
+            except Exception as e:
+                self.failures += 1
+                self.stats["lotes_fallidos"] += 1
+                with self._cond:
+                    self.buffer = batch + self.buffer
+                    self.oldest_at = time.monotonic()
+                    self.retry_at = time.monotonic() + min(SHEETS_RETRY_MAX_SECONDS, 2 ** self.failures)
+                ids = ', '.join(str(i) for i, _ in batch[:10]) + (', ...' if len(batch) > 10 else '')
+                logger.error(f"[Sheets] ERROR exportando {len(batch)} pedidos ({ids}); se reintentará: {e}")
+                if self.worksheet_fn is get_worksheet:
+                    reset_worksheet()
+                return False
+
+    def flush_due(self):
+        # Al final de un request: exporta lo encolado sin esperar al hilo (en Vercel no corre tras
+        # la respuesta), salvo durante el backoff de un fallo; ahí espera a la recuperación.
+        with self._cond:
+            if not self.buffer or time.monotonic() < self.retry_at:
+                return None
+        return self.flush()
+
+    def pending(self):
+        with self._cond:
+            return len(self.buffer)
+
+
+order_exporter = OrderExporter()
+metrics.add_stats('bot_sheets_exportacion', lambda: order_exporter.stats)
+atexit.register(order_exporter.flush)
+
+def guardar_pedido_en_sheet(sale_data):
+    # Ya no bloquea el cierre de la venta: la fila se exporta en el próximo lote.
+    try:
+        order_exporter.enqueue(sale_data)
+        logger.info(f"[Sheets] Pedido {sale_data.get('id_venta')} encolado para exportar.")
+        return True
+    except Exception as e:
+        logger.error(f"[Sheets] ERROR INESPERADO: {e}")
+        return False
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - PERFIL DE ARRANQUE
+# Mide importaciones e inicializaciones (Firebase, configuración, catálogo,
+# Sheets...) para vigilar el costo de cada arranque en frío en Vercel.
+# ==========================================================
+import os
+import time
+import threading
+from contextlib import contextmanager
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+# Presupuesto de importación de api/index.py (lo que paga cada arranque en frío antes de servir).
+COLD_START_BUDGET_MS = float(os.environ.get('COLD_START_BUDGET_MS', '400'))
+
+
+class StartupProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = {}  # componente -> ms (la primera vez que se inicializa)
+        self.imports_done_ms = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, component):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.timings.setdefault(component, round(elapsed_ms, 2))
+            logger.info(f"[Arranque] {component}: {elapsed_ms:.1f} ms")
+
+    def report(self):
+        with self._lock:
+            timings = dict(self.timings)
+        imports_ms = self.imports_done_ms
+        return {"componentes_ms": timings, "importacion_ms": imports_ms, "presupuesto_ms": COLD_START_BUDGET_MS,
+                "dentro_de_presupuesto": imports_ms is not None and imports_ms <= COLD_START_BUDGET_MS}
+
+    def log_imports(self):
+        # Se llama al final de index.py: tiempo desde que se importó este módulo.
+        self.imports_done_ms = round((time.perf_counter() - self.started) * 1000, 2)
+        report = self.report()
+        level = logger.info if report["dentro_de_presupuesto"] else logger.warning
+        level(f"[Arranque] Importación lista en {report['importacion_ms']:.1f} ms "
+              f"(presupuesto {COLD_START_BUDGET_MS:.0f} ms): {report['componentes_ms']}")
+
+
+startup_profile = StartupProfile()
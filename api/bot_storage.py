@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - ALMACENAMIENTO INTERCAMBIABLE
+# Las operaciones de datos del camino del mensaje (sesiones, catálogo,
+# configuración, venta + cliente, pedido abierto, nombres de clientes y
+# reserva de message_id) pasan por un adaptador:
+#   - firestore (por defecto): el comportamiento de siempre, vía bot_db;
+#   - sqlite: un archivo en modo WAL, para un despliegue local o de staging;
+#   - memory: SQLite en memoria, para benchmarks y simulaciones.
+# Un adaptador nuevo implementa todos los métodos abstractos de Storage.
+# Los módulos propios de Firestore (bot_reports: agregados y lista de
+# ventas; bot_sweeper: limpieza de sesiones; bot_media: registro de
+# comprobantes; bot_tracking: trabajos guardados) usan get_db() y quedan
+# inactivos fuera de Firestore; get_storage() lo avisa al elegir sqlite/memory.
+# ==========================================================
+import os
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging import getLogger
+from bot_db import get_db, STORAGE_BACKEND
+from bot_metrics import metrics
+from bot_reports import add_sale_to_batch, add_status_change_to_batch, AGGREGATED_FIELD
+
+logger = getLogger(__name__)
+
+STORAGE_SQLITE_PATH = os.environ.get('STORAGE_SQLITE_PATH', os.path.join('/tmp', 'daaqui.sqlite3'))
+# JSON {"productos": {id: {...}}, "configuracion": {id: {...}}} para poblar una base local vacía.
+STORAGE_SEED_FILE = os.environ.get('STORAGE_SEED_FILE')
+OPEN_STATUS = "Adelanto Pagado"
+DEDUP_COLLECTION = 'webhook_mensajes'  # con política TTL de Firestore sobre `expira_en`
+
+
+class Document:
+    # Lo mínimo de un DocumentSnapshot que usan los llamadores (p. ej. ConfigService).
+    __slots__ = ('id', '_data', 'exists', 'update_time')
+
+    def __init__(self, doc_id, data):
+        self.id, self._data, self.exists, self.update_time = doc_id, data, data is not None, None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class Storage(ABC):
+    name = 'base'
+
+    # --- Sesiones ---
+    @abstractmethod
+    def get_session(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_session(self, user_id, data, merge=False):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_session(self, user_id):
+        raise NotImplementedError
+
+    # --- Catálogo y configuración ---
+    @abstractmethod
+    def catalog_version(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_products(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_config(self, names):
+        # [Document] en el orden de `names`.
+        raise NotImplementedError
+
+    # --- Ventas y clientes ---
+    @abstractmethod
+    def complete_sale(self, sale_data, customer_id, customer_data):
+        # Venta, cliente (+1 compra, pedido abierto) y borrado de la sesión: todo o nada.
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_customer(self, customer_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_customer(self, customer_id, fields):
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_open_sale(self, customer_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def close_sale(self, customer_id, sale_id, final_status):
+        # Cambia el estado de la venta y limpia el pedido abierto del cliente en una sola escritura.
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_customer_names(self, customer_ids):
+        raise NotImplementedError
+
+    # --- Exportación a Sheets ---
+    @abstractmethod
+    def pending_exports(self, limit):
+        # Ventas con `exportado: False`, las más antiguas primero.
+        raise NotImplementedError
+
+    @abstractmethod
+    def mark_exported(self, sale_ids):
+        raise NotImplementedError
+
+    # --- Idempotencia del webhook ---
+    @abstractmethod
+    def claim_message(self, message_id, expires_at):
+        # False si el message_id ya estaba reservado (y no venció).
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_message(self, message_id):
+        raise NotImplementedError
+
+
+class FirestoreStorage(Storage):
+    name = 'firestore'
+
+    @staticmethod
+    def _db():
+        if (db := get_db()) is None:
+            raise RuntimeError("Firestore no disponible")
+        return db
+
+    def get_session(self, user_id):
+        with metrics.call('firestore', 'leer_sesion'):
+            doc = self._db().collection('sessions').document(user_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def set_session(self, user_id, data, merge=False):
+        with metrics.call('firestore', 'guardar_sesion'):
+            self._db().collection('sessions').document(user_id).set(data, merge=merge)
+
+    def delete_session(self, user_id):
+        with metrics.call('firestore', 'guardar_sesion'):
+            self._db().collection('sessions').document(user_id).delete()
+
+    def catalog_version(self):
+        # `configuracion/catalogo.version` es opcional.
+        with metrics.call('firestore', 'catalogo_version'):
+            doc = self._db().collection('configuracion').document('catalogo').get()
+        return doc.to_dict().get('version') if doc.exists else None
+
+    def list_products(self):
+        with metrics.call('firestore', 'catalogo'):
+            return {doc.id: doc.to_dict() or {} for doc in self._db().collection('productos').get()}
+
+    def config_refs(self, names):
+        db = self._db()
+        return [db.collection('configuracion').document(name) for name in names]
+
+    def get_config(self, names):
+        with metrics.call('firestore', 'config'):
+            docs = list(self._db().get_all(self.config_refs(names)))
+        docs.sort(key=lambda d: names.index(d.id))
+        return docs
+
+    def complete_sale(self, sale_data, customer_id, customer_data):
+        from firebase_admin import firestore
+        db = self._db()
+        sale_data = {"fecha": firestore.SERVER_TIMESTAMP, **sale_data, AGGREGATED_FIELD: True}
+        customer_data = {**customer_data, "total_compras": firestore.Increment(1),
+                         "fecha_ultima_compra": firestore.SERVER_TIMESTAMP, "pedido_abierto": sale_data['id_venta']}
+        # Venta, cliente, marcador de pedido abierto, agregados y cierre de la sesión
+        # en un solo commit: o se guarda todo o nada.
+        batch = db.batch()
+        batch.set(db.collection('ventas').document(sale_data['id_venta']), sale_data)
+        batch.set(db.collection('clientes').document(customer_id), customer_data, merge=True)
+        batch.delete(db.collection('sessions').document(customer_id))
+        add_sale_to_batch(batch, db, sale_data)
+        with metrics.call('firestore', 'checkout'):
+            batch.commit()
+
+    def get_customer(self, customer_id):
+        with metrics.call('firestore', 'pedido_abierto'):
+            doc = self._db().collection('clientes').document(customer_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def update_customer(self, customer_id, fields):
+        with metrics.call('firestore', 'pedido_abierto'):
+            self._db().collection('clientes').document(customer_id).set(fields, merge=True)
+
+    def find_open_sale(self, customer_id):
+        with metrics.call('firestore', 'pedido_abierto'):
+            pendientes = self._db().collection('ventas').where('cliente_id', '==', customer_id) \
+                                   .where('estado_pedido', '==', OPEN_STATUS).limit(1).get()
+        return pendientes[0].id if pendientes else None
+
+    def close_sale(self, customer_id, sale_id, final_status):
+        db = self._db()
+        # Venta, marcador y agregados (estado y saldo pendiente) en un solo commit.
+        batch = db.batch()
+        if sale_id:
+            sale_ref = db.collection('ventas').document(sale_id)
+            with metrics.call('firestore', 'cerrar_pedido'):
+                sale_doc = sale_ref.get()
+            if sale_doc.exists:
+                batch.set(sale_ref, {"estado_pedido": final_status}, merge=True)
+                add_status_change_to_batch(batch, db, sale_doc.to_dict(), final_status)
+        batch.set(db.collection('clientes').document(customer_id), {"pedido_abierto": None}, merge=True)
+        with metrics.call('firestore', 'cerrar_pedido'):
+            batch.commit()
+
+    def get_customer_names(self, customer_ids):
+        # Un solo get_all para todos en lugar de una lectura por cliente.
+        db = self._db()
+        refs = [db.collection('clientes').document(customer_id) for customer_id in customer_ids]
+        with metrics.call('firestore', 'clientes_lote'):
+            docs = list(db.get_all(refs))
+        return {doc.id: doc.to_dict().get('nombre_perfil_wa') for doc in docs if doc.exists}
+
+    def pending_exports(self, limit):
+        with metrics.call('firestore', 'exportacion_pendiente'):
+            docs = self._db().collection('ventas').where('exportado', '==', False).limit(limit).get()
+        sales = [doc.to_dict() for doc in docs]
+        return sorted(sales, key=lambda sale: sale.get('fecha') or datetime.min.replace(tzinfo=timezone.utc))
+
+    def mark_exported(self, sale_ids):
+        db = self._db()
+        for i in range(0, len(sale_ids), 500):  # límite de escrituras por batch
+            batch = db.batch()
+            for sale_id in sale_ids[i:i + 500]:
+                batch.set(db.collection('ventas').document(sale_id), {"exportado": True}, merge=True)
+            with metrics.call('firestore', 'marcar_exportados'):
+                batch.commit()
+
+    def claim_message(self, message_id, expires_at):
+        from google.api_core.exceptions import AlreadyExists
+        from firebase_admin import firestore
+        try:
+            # create() falla si el documento existe: es una reserva atómica entre instancias.
+            with metrics.call('firestore', 'dedup'):
+                self._db().collection(DEDUP_COLLECTION).document(message_id).create({
+                    "recibido": firestore.SERVER_TIMESTAMP, "expira_en": expires_at})
+            return True
+        except AlreadyExists:
+            return False
+
+    def release_message(self, message_id):
+        with metrics.call('firestore', 'dedup'):
+            self._db().collection(DEDUP_COLLECTION).document(message_id).delete()
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"$fecha": value.isoformat()}
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def _decode(obj):
+    if len(obj) == 1 and "$fecha" in obj:
+        return datetime.fromisoformat(obj["$fecha"])
+    return obj
+
+
+def _dumps(data):
+    return json.dumps(data, default=_encode, ensure_ascii=False)
+
+
+def _loads(text):
+    return json.loads(text, object_hook=_decode) if text is not None else None
+
+
+class SQLiteStorage(Storage):
+    # Documentos JSON por tabla, con las columnas que se consultan aparte.
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS clientes (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS ventas (id TEXT PRIMARY KEY, cliente_id TEXT, estado_pedido TEXT,
+                                           fecha TEXT, data TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS ventas_cliente_estado ON ventas (cliente_id, estado_pedido);
+        CREATE TABLE IF NOT EXISTS productos (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS configuracion (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS webhook_mensajes (id TEXT PRIMARY KEY, expira_en TEXT NOT NULL);
+    """
+
+    def __init__(self, path=STORAGE_SQLITE_PATH, seed_file=STORAGE_SEED_FILE):
+        self.path = path
+        self.name = 'memory' if path == ':memory:' else 'sqlite'
+        self._local = threading.local()
+        # En memoria hay una sola conexión (cada conexión sería otra base), protegida por un candado;
+        # en archivo, una conexión por hilo y WAL para que las lecturas no esperen a las escrituras.
+        self._shared = self._connect() if self.name == 'memory' else None
+        self._write_lock = threading.RLock() if self._shared is not None else None
+        self._connection().executescript(self.SCHEMA)
+        if seed_file:
+            self.seed_from_file(seed_file)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=self.path != ':memory:')
+        if self.path != ':memory:':
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _connection(self):
+        if self._shared is not None:
+            return self._shared
+        if (conn := getattr(self._local, 'conn', None)) is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    @contextmanager
+    def _tx(self):
+        conn = self._connection()
+        if self._write_lock is not None:
+            self._write_lock.acquire()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            if self._write_lock is not None:
+                self._write_lock.release()
+
+    def _read(self, sql, params=()):
+        conn = self._connection()
+        if self._write_lock is None:
+            return conn.execute(sql, params).fetchall()
+        with self._write_lock:
+            return conn.execute(sql, params).fetchall()
+
+    def _get(self, table, doc_id):
+        rows = self._read(f"SELECT data FROM {table} WHERE id = ?", (doc_id,))
+        return _loads(rows[0][0]) if rows else None
+
+    @staticmethod
+    def _merge(conn, table, doc_id, fields):
+        row = conn.execute(f"SELECT data FROM {table} WHERE id = ?", (doc_id,)).fetchone()
+        data = {**(_loads(row[0]) if row else {}), **fields}
+        conn.execute(f"INSERT OR REPLACE INTO {table} (id, data) VALUES (?, ?)", (doc_id, _dumps(data)))
+        return data
+
+    def seed(self, table, documents):
+        with self._tx() as conn:
+            conn.executemany(f"INSERT OR REPLACE INTO {table} (id, data) VALUES (?, ?)",
+                             [(doc_id, _dumps(data)) for doc_id, data in documents.items()])
+
+    def seed_from_file(self, seed_file):
+        with open(seed_file, encoding='utf-8') as f:
+            seed = json.load(f)
+        for table in ('productos', 'configuracion'):
+            if seed.get(table) and not self._read(f"SELECT 1 FROM {table} LIMIT 1"):
+                self.seed(table, seed[table])
+                logger.info(f"[Almacenamiento] {len(seed[table])} documentos cargados en {table}.")
+
+    def get_session(self, user_id):
+        with metrics.call(self.name, 'leer_sesion', count=False):
+            return self._get('sessions', user_id)
+
+    def set_session(self, user_id, data, merge=False):
+        with metrics.call(self.name, 'guardar_sesion', count=False), self._tx() as conn:
+            if merge:
+                self._merge(conn, 'sessions', user_id, data)
+            else:
+                conn.execute("INSERT OR REPLACE INTO sessions (id, data) VALUES (?, ?)", (user_id, _dumps(data)))
+
+    def delete_session(self, user_id):
+        with metrics.call(self.name, 'guardar_sesion', count=False), self._tx() as conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (user_id,))
+
+    def catalog_version(self):
+        return (self._get('configuracion', 'catalogo') or {}).get('version')
+
+    def list_products(self):
+        with metrics.call(self.name, 'catalogo', count=False):
+            return {doc_id: _loads(data) for doc_id, data in self._read("SELECT id, data FROM productos")}
+
+    def get_config(self, names):
+        return [Document(name, self._get('configuracion', name)) for name in names]
+
+    def complete_sale(self, sale_data, customer_id, customer_data):
+        now = datetime.now(timezone.utc)
+        sale_data = {"fecha": now, **sale_data}
+        with metrics.call(self.name, 'checkout', count=False), self._tx() as conn:
+            conn.execute("INSERT INTO ventas (id, cliente_id, estado_pedido, fecha, data) VALUES (?, ?, ?, ?, ?)",
+                         (sale_data['id_venta'], customer_id, sale_data.get('estado_pedido'), now.isoformat(),
+                          _dumps(sale_data)))
+            row = conn.execute("SELECT data FROM clientes WHERE id = ?", (customer_id,)).fetchone()
+            previous = _loads(row[0]) if row else {}
+            self._merge(conn, 'clientes', customer_id, {
+                **customer_data, "total_compras": (previous.get('total_compras') or 0) + 1,
+                "fecha_ultima_compra": now, "pedido_abierto": sale_data['id_venta']})
+            conn.execute("DELETE FROM sessions WHERE id = ?", (customer_id,))
+
+    def get_customer(self, customer_id):
+        return self._get('clientes', customer_id)
+
+    def update_customer(self, customer_id, fields):
+        with self._tx() as conn:
+            self._merge(conn, 'clientes', customer_id, fields)
+
+    def find_open_sale(self, customer_id):
+        rows = self._read("SELECT id FROM ventas WHERE cliente_id = ? AND estado_pedido = ? LIMIT 1",
+                          (customer_id, OPEN_STATUS))
+        return rows[0][0] if rows else None
+
+    def close_sale(self, customer_id, sale_id, final_status):
+        with metrics.call(self.name, 'cerrar_pedido', count=False), self._tx() as conn:
+            if sale_id and (row := conn.execute("SELECT data FROM ventas WHERE id = ?", (sale_id,)).fetchone()):
+                conn.execute("UPDATE ventas SET estado_pedido = ?, data = ? WHERE id = ?",
+                             (final_status, _dumps({**_loads(row[0]), "estado_pedido": final_status}), sale_id))
+            self._merge(conn, 'clientes', customer_id, {"pedido_abierto": None})
+
+    def get_customer_names(self, customer_ids):
+        names = {}
+        ids = list(customer_ids)
+        for i in range(0, len(ids), 500):  # límite de parámetros de SQLite
+            chunk = ids[i:i + 500]
+            rows = self._read(f"SELECT id, data FROM clientes WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            names.update((doc_id, _loads(data).get('nombre_perfil_wa')) for doc_id, data in rows)
+        return names
+
+    def pending_exports(self, limit):
+        rows = self._read("SELECT data FROM ventas WHERE json_extract(data, '$.exportado') = 0 "
+                          "ORDER BY fecha LIMIT ?", (limit,))
+        return [_loads(data) for data, in rows]
+
+    def mark_exported(self, sale_ids):
+        with self._tx() as conn:
+            conn.executemany("UPDATE ventas SET data = json_set(data, '$.exportado', json('true')) WHERE id = ?",
+                             [(sale_id,) for sale_id in sale_ids])
+
+    def claim_message(self, message_id, expires_at):
+        now = datetime.now(timezone.utc).isoformat()
+        with self._tx() as conn:
+            # Un id vencido se puede volver a reservar, como con la política TTL de Firestore.
+            conn.execute("DELETE FROM webhook_mensajes WHERE id = ? AND expira_en < ?", (message_id, now))
+            cursor = conn.execute("INSERT OR IGNORE INTO webhook_mensajes (id, expira_en) VALUES (?, ?)",
+                                  (message_id, expires_at.isoformat()))
+            return cursor.rowcount == 1
+
+    def release_message(self, message_id):
+        with self._tx() as conn:
+            conn.execute("DELETE FROM webhook_mensajes WHERE id = ?", (message_id,))
+
+
+_firestore_storage = FirestoreStorage()
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    # Como get_db(): None si el almacén no está disponible (p. ej. Firestore sin credenciales).
+    global _storage
+    if _storage is None and STORAGE_BACKEND in ('sqlite', 'memory'):
+        with _storage_lock:
+            if _storage is None:
+                _storage = SQLiteStorage(':memory:' if STORAGE_BACKEND == 'memory' else STORAGE_SQLITE_PATH)
+                logger.info(f"[Almacenamiento] Usando {_storage.name} ({_storage.path}).")
+                logger.warning("[Almacenamiento] Sin Firestore: agregados de ventas, limpieza de sesiones, "
+                               "registro de comprobantes y trabajos de tracking quedan inactivos.")
+    if _storage is not None:
+        return _storage
+    return _firestore_storage if get_db() is not None else None
+
+
+def override_storage(storage):
+    # Para benchmarks y pruebas locales; None vuelve a Firestore.
+    global _storage
+    with _storage_lock:
+        _storage = storage
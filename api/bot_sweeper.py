@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - LIMPIEZA DE SESIONES ABANDONADAS
+# Borra de `sessions` las conversaciones sin actividad por más de
+# SESSION_IDLE_TTL, de a una página por commit (memoria acotada a
+# SWEEP_BATCH_SIZE documentos, solo con el campo del sello). Las sesiones
+# anteriores al sello `ultima_actividad` se sellan con la hora del barrido
+# para que expiren si nadie las retoma; ese recorrido completo se hace una
+# sola vez (POST /api/admin/sesiones/limpiar?sellar=1, o el primer barrido
+# del hilo) y los siguientes solo usan la consulta indexada por expiración.
+# Se dispara con el endpoint (cron) o con un hilo si SESSION_SWEEP_INTERVAL > 0.
+# Solo con Firestore: con otro STORAGE_BACKEND sweep() devuelve None.
+# ==========================================================
+import os
+import time
+import threading
+from datetime import datetime, timedelta, timezone
+from logging import getLogger
+from bot_db import get_db
+from bot_metrics import metrics
+from bot_utils import session_store, SESSION_IDLE_TTL, ACTIVITY_FIELD
+
+logger = getLogger(__name__)
+
+SWEEP_BATCH_SIZE = int(os.environ.get('SWEEP_BATCH_SIZE', '200'))  # máximo de Firestore: 500 por commit
+SWEEP_MAX_SECONDS = float(os.environ.get('SWEEP_MAX_SECONDS', '20'))
+SESSION_SWEEP_INTERVAL = float(os.environ.get('SESSION_SWEEP_INTERVAL', '0'))
+SESSIONS_COLLECTION = 'sessions'
+
+
+def count_sessions(db):
+    # Agregación count() del servidor: no trae los documentos.
+    try:
+        with metrics.call('firestore', 'contar_sesiones'):
+            result = db.collection(SESSIONS_COLLECTION).count().get()
+        return int(result[0][0].value)
+    except Exception as e:
+        logger.error(f"[Limpieza] No se pudo contar la colección de sesiones: {e}")
+        return None
+
+
+class SessionSweeper:
+    def __init__(self, idle_ttl=SESSION_IDLE_TTL, batch_size=SWEEP_BATCH_SIZE, max_seconds=SWEEP_MAX_SECONDS):
+        self.idle_ttl = idle_ttl
+        self.batch_size = max(1, min(batch_size, 500))
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._thread = None
+        self.legacy_done = False  # True cuando un recorrido de sellado llegó al final de la colección
+        self.stats = {"barridos": 0, "borradas": 0, "selladas": 0, "commits": 0, "conflictos": 0}
+
+    def _delete_page(self, db, docs):
+        batch = db.batch()
+        for doc in docs:
+            # Precondición: si el cliente escribió después de la consulta, su sesión no se borra.
+            update_time = getattr(doc, 'update_time', None)
+            if update_time is not None:
+                batch.delete(doc.reference, option=db.write_option(last_update_time=update_time))
+            else:
+                batch.delete(doc.reference)
+        try:
+            with metrics.call('firestore', 'limpiar_sesiones'):
+                batch.commit()
+            self.stats["commits"] += 1
+            return len(docs)
+        except Exception as e:
+            # Una sola sesión retomada hace fallar el lote: se reintenta de a una.
+            logger.warning(f"[Limpieza] Lote rechazado ({e}); borrando de a una.")
+        deleted = 0
+        for doc in docs:
+            update_time = getattr(doc, 'update_time', None)
+            try:
+                with metrics.call('firestore', 'limpiar_sesiones'):
+                    if update_time is not None:
+                        doc.reference.delete(option=db.write_option(last_update_time=update_time))
+                    else:
+                        doc.reference.delete()
+                deleted += 1
+            except Exception:
+                self.stats["conflictos"] += 1
+        return deleted
+
+    def _deadline_passed(self, started):
+        return time.monotonic() - started > self.max_seconds
+
+    def _sweep_expired(self, db, cutoff, started):
+        collection = db.collection(SESSIONS_COLLECTION)
+        deleted = 0
+        while not self._deadline_passed(started):
+            with metrics.call('firestore', 'limpiar_sesiones'):
+                docs = collection.where(ACTIVITY_FIELD, '<', cutoff).select([ACTIVITY_FIELD]).limit(self.batch_size).get()
+            if not docs:
+                break
+            page = self._delete_page(db, docs)
+            deleted += page
+            for doc in docs:
+                session_store.forget(doc.id)
+            if len(docs) < self.batch_size or page == 0:
+                break
+        return deleted
+
+    def _stamp_legacy(self, db, now, started):
+        # Sesiones sin sello no aparecen en la consulta por rango: se recorren por nombre, página a página.
+        collection = db.collection(SESSIONS_COLLECTION)
+        stamped, last = 0, None
+        while not self._deadline_passed(started):
+            query = collection.order_by('__name__').select([ACTIVITY_FIELD]).limit(self.batch_size)
+            if last is not None:
+                query = query.start_after(last)
+            with metrics.call('firestore', 'limpiar_sesiones'):
+                docs = query.get()
+            if not docs:
+                self.legacy_done = True
+                break
+            legacy = [doc for doc in docs if not isinstance(doc.get(ACTIVITY_FIELD), datetime)]
+            if legacy:
+                batch = db.batch()
+                for doc in legacy:
+                    batch.set(doc.reference, {ACTIVITY_FIELD: now}, merge=True)
+                with metrics.call('firestore', 'limpiar_sesiones'):
+                    batch.commit()
+                self.stats["commits"] += 1
+                stamped += len(legacy)
+                for doc in legacy:
+                    session_store.forget(doc.id)
+            if len(docs) < self.batch_size:
+                self.legacy_done = True
+                break
+            last = docs[-1]
+        return stamped
+
+    def sweep(self, stamp_legacy=False):
+        db = get_db()
+        if not db: return None
+        if self.idle_ttl <= 0:
+            return {"error": "SESSION_IDLE_TTL=0: las sesiones no expiran"}
+        if not self._lock.acquire(blocking=False):
+            return {"error": "Ya hay un barrido en curso"}
+        try:
+            started = time.monotonic()
+            now = datetime.now(timezone.utc)
+            before = count_sessions(db)
+            deleted = self._sweep_expired(db, now - timedelta(seconds=self.idle_ttl), started)
+            stamped = self._stamp_legacy(db, now, started) if stamp_legacy else 0
+            after = count_sessions(db)
+            self.stats["barridos"] += 1
+            self.stats["borradas"] += deleted
+            self.stats["selladas"] += stamped
+            report = {"antes": before, "despues": after, "borradas": deleted, "selladas": stamped,
+                      "completo": not self._deadline_passed(started),
+                      "segundos": round(time.monotonic() - started, 3)}
+            logger.info(f"[Limpieza] Sesiones: {before} -> {after} ({deleted} borradas, {stamped} selladas).")
+            return report
+        finally:
+            self._lock.release()
+
+    def start_background(self, interval=SESSION_SWEEP_INTERVAL):
+        # Para despliegues con proceso persistente; en Vercel se usa el endpoint desde un cron.
+        if interval <= 0 or self._thread is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep(stamp_legacy=not self.legacy_done)
+                except Exception as e:
+                    logger.error(f"[Limpieza] Error en el barrido de sesiones: {e}")
+
+        self._thread = threading.Thread(target=loop, name="limpieza-sesiones", daemon=True)
+        self._thread.start()
+
+
+sweeper = SessionSweeper()
+metrics.add_stats('bot_limpieza_sesiones', lambda: sweeper.stats)
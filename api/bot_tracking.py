@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - AVISOS DE SEGUIMIENTO (SHALOM)
+# Mensajes de seguimiento para /api/send-tracking y envíos masivos:
+# un solo get_all para los nombres de los clientes, envíos repartidos entre
+# destinatarios por el programador de salientes (con su límite de mensajes
+# por segundo) y un trabajo consultable con el estado de cada destinatario.
+# Un envío masivo avanza por tandas dentro de cada request (el POST y cada
+# consulta de Make.com): nada queda en cola cuando el proceso se congela.
+# Los trabajos se guardan en Firestore; con otro STORAGE_BACKEND solo se
+# consultan (y avanzan) en la instancia que los lanzó.
+# ==========================================================
+import os
+import uuid
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from logging import getLogger
+from bot_db import get_db
+from bot_storage import get_storage
+from bot_metrics import metrics
+from bot_utils import send_text_message, outbound_turn, flush_outbound
+from bot_outbox import OUTBOUND_DRAIN_SECONDS
+
+logger = getLogger(__name__)
+
+TRACKING_BULK_MAX = int(os.environ.get('TRACKING_BULK_MAX', '500'))
+TRACKING_JOBS_KEPT = int(os.environ.get('TRACKING_JOBS_KEPT', '200'))
+TRACKING_PAUSE_SECONDS = 2
+# Destinatarios por request: sus 3 mensajes deben caber en OUTBOUND_DRAIN_SECONDS.
+TRACKING_SLICE = int(os.environ.get('TRACKING_SLICE', '50'))
+TRACKING_LEASE_SECONDS = OUTBOUND_DRAIN_SECONDS + 20
+JOBS_COLLECTION = 'trabajos_tracking'
+
+
+def tracking_messages(customer_name, nro_orden, codigo_recojo=None):
+    # [(pausa respecto al anterior, texto)]
+    message_1 = (f"¡Hola {customer_name}! 👋🏽✨\n\n¡Excelentes noticias! Tu pedido de Daaqui Joyas ha sido enviado. 🚚\n\n"
+                 f"Datos para seguimiento Shalom:\n👉🏽 *Nro. de Orden:* {nro_orden}" +
+                 (f"\n👉🏽 *Código de Recojo:* {codigo_recojo}" if codigo_recojo else "") +
+                 "\n\nA continuación, los pasos a seguir:")
+    message_2 = ("*Pasos para una entrega exitosa:* 👇\n\n"
+                 "*1. HAZ EL SEGUIMIENTO:* 📲\nDescarga la app *\"Mi Shalom\"*. Si eres nuevo, regístrate. Con los datos de arriba, podrás ver el estado de tu paquete.\n\n"
+                 "*2. PAGA EL SALDO CUANDO LLEGUE:* 💳\nCuando la app confirme que tu pedido llegó a la agencia, yapea o plinea el saldo restante. Haz este paso *antes de ir a la agencia*.\n\n"
+                 "*3. AVISA Y RECIBE TU CLAVE:* 🔑\nApenas nos envíes la captura de tu pago, lo validaremos y te daremos la *clave secreta de recojo*. ¡La necesitarás junto a tu DNI! 🎁")
+    message_3 = ("✨ *¡Ya casi es tuya! Tu último paso es el más importante.* ✨\n\n"
+                 "Para darte atención prioritaria, responde este chat con la **captura de tu pago**.\n\n"
+                 "¡Estaremos atentos para enviarte tu clave al instante! La necesitarás junto a tu DNI para recibir tu joya. 🎁")
+    return [(0, message_1), (TRACKING_PAUSE_SECONDS, message_2), (TRACKING_PAUSE_SECONDS, message_3)]
+
+
+def get_customer_names(numbers):
+    # Un solo get_all para todos los destinatarios en lugar de una lectura por pedido.
+    storage = get_storage()
+    if not storage or not numbers:
+        return {}
+    try:
+        return storage.get_customer_names(numbers)
+    except Exception as e:
+        logger.error(f"[Tracking] Error leyendo nombres de clientes: {e}")
+        return {}
+
+
+class TrackingJob:
+    def __init__(self, records=(), job_id=None, created_at=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.created_at = created_at or datetime.now(timezone.utc)
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self.recipients = []   # estado por registro, en el orden recibido
+        self.by_number = {}    # to_number -> estado (solo los que se envían)
+        self.expected = {}     # to_number -> mensajes aún sin resultado (encolados en esta instancia)
+        for record in records:
+            to_number = str(record.get('to_number') or '').strip()
+            status = {"to_number": to_number, "nro_orden": record.get('nro_orden'),
+                      "codigo_recojo": record.get('codigo_recojo'),
+                      "estado": "pendiente", "enviados": 0, "fallidos": 0}
+            if not to_number.isdigit() or not status["nro_orden"]:
+                status["estado"] = "invalido"
+            elif to_number in self.by_number:
+                status["estado"] = "duplicado"
+            else:
+                self.by_number[to_number] = status
+            self.recipients.append(status)
+        self._check_finished()
+
+    @classmethod
+    def from_summary(cls, data):
+        # Reconstruye un trabajo guardado para seguir con los destinatarios que faltan.
+        job = cls(job_id=data["job_id"], created_at=datetime.fromisoformat(data["creado"]))
+        job.recipients = [dict(status) for status in data.get("destinatarios", [])]
+        job.by_number = {s["to_number"]: s for s in job.recipients if s["estado"] not in ("invalido", "duplicado")}
+        job.finished_at = datetime.fromisoformat(data["terminado_en"]) if data.get("terminado_en") else None
+        job._check_finished()
+        return job
+
+    def _check_finished(self):
+        if self.finished_at is None and not any(s["estado"] in ("pendiente", "en_curso") for s in self.by_number.values()):
+            self.finished_at = datetime.now(timezone.utc)
+
+    def next_slice(self, size):
+        # Destinatarios sin terminar que no están en la cola de esta instancia.
+        with self._lock:
+            return [s for s in self.by_number.values()
+                    if s["estado"] in ("pendiente", "en_curso") and s["to_number"] not in self.expected][:size]
+
+    def _on_done(self, to_number, ok):
+        with self._lock:
+            status = self.by_number[to_number]
+            status["enviados" if ok else "fallidos"] += 1
+            self.expected[to_number] -= 1
+            if self.expected[to_number] == 0:
+                status["estado"] = "enviado" if not status["fallidos"] else "fallido"
+                del self.expected[to_number]
+                self._check_finished()
+            else:
+                status["estado"] = "en_curso"
+            finished = self.finished_at is not None
+        if finished:
+            jobs.persist(self)
+
+    def summary(self):
+        with self._lock:
+            counts = {}
+            for status in self.recipients:
+                counts[status["estado"]] = counts.get(status["estado"], 0) + 1
+            return {"job_id": self.id, "total": len(self.recipients), "resumen": counts,
+                    "terminado": self.finished_at is not None,
+                    "creado": self.created_at.isoformat(),
+                    "terminado_en": self.finished_at.isoformat() if self.finished_at else None,
+                    "destinatarios": [dict(status) for status in self.recipients]}
+
+
+class TrackingJobs:
+    # Cada request (el POST y cada consulta) avanza una tanda de TRACKING_SLICE destinatarios y
+    # la espera antes de responder: en Vercel el proceso se congela tras la respuesta. El estado
+    # queda en `trabajos_tracking` y la siguiente consulta sigue desde ahí, en cualquier instancia.
+    def __init__(self, kept=TRACKING_JOBS_KEPT, slice_size=TRACKING_SLICE):
+        self.kept = kept
+        self.slice_size = max(1, slice_size)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+            self._jobs.move_to_end(job.id)
+            while len(self._jobs) > self.kept:
+                self._jobs.popitem(last=False)
+
+    def start(self, records):
+        job = TrackingJob(records)
+        self._remember(job)
+        self.advance(job)
+        logger.info(f"[Tracking] Trabajo {job.id}: {len(job.by_number)} de {len(job.recipients)} destinatarios válidos.")
+        return job
+
+    def advance(self, job):
+        # Encola una tanda, espera sus envíos (acotado por OUTBOUND_DRAIN_SECONDS) y guarda el avance.
+        batch = job.next_slice(self.slice_size)
+        names = get_customer_names([status["to_number"] for status in batch])
+        # Cada destinatario mantiene sus pausas (o sus textos se agrupan); el programador reparte
+        # entre destinatarios y respeta el límite de mensajes por segundo de la Graph API.
+        with outbound_turn():
+            for status in batch:
+                to_number = status["to_number"]
+                messages = tracking_messages(names.get(to_number) or "cliente", status["nro_orden"], status["codigo_recojo"])
+                # Un destinatario a medias (instancia congelada) sigue desde el primer mensaje sin resultado.
+                messages = messages[status["enviados"] + status["fallidos"]:]
+                if not messages:
+                    continue
+                with job._lock:
+                    job.expected[to_number] = len(messages)
+                for delay, text in messages:
+                    send_text_message(to_number, text, delay=delay,
+                                      on_done=lambda ok, n=to_number: job._on_done(n, ok))
+        if batch and not flush_outbound():
+            logger.warning(f"[Tracking] Trabajo {job.id}: la tanda no terminó dentro del request.")
+        self.persist(job)
+
+    def persist(self, job):
+        db = get_db()
+        if not db: return
+        data = job.summary()
+        if job.expected:
+            # Aún hay mensajes en la cola de esta instancia: otra no retoma la tanda hasta que venza.
+            data['reservado_hasta'] = datetime.now(timezone.utc) + timedelta(seconds=TRACKING_LEASE_SECONDS)
+        try:
+            with metrics.call('firestore', 'trabajo_tracking'):
+                db.collection(JOBS_COLLECTION).document(job.id).set(data)
+        except Exception as e:
+            logger.error(f"[Tracking] Error guardando el trabajo {job.id}: {e}")
+
+    def _claim(self, db, job_id):
+        # (trabajo guardado, reservado). La reserva evita que dos instancias envíen la misma tanda;
+        # vence sola si la instancia que la tomó se congela.
+        ref = db.collection(JOBS_COLLECTION).document(job_id)
+        with metrics.call('firestore', 'trabajo_tracking'):
+            doc = ref.get()
+        if not doc.exists:
+            return None, False
+        data = doc.to_dict()
+        job = TrackingJob.from_summary(data)
+        now = datetime.now(timezone.utc)
+        if job.finished_at is not None or ((until := data.get('reservado_hasta')) and until > now):
+            return job, False
+        try:
+            with metrics.call('firestore', 'trabajo_tracking'):
+                ref.update({'reservado_hasta': now + timedelta(seconds=TRACKING_LEASE_SECONDS)},
+                           option=db.write_option(last_update_time=doc.update_time))
+        except Exception:
+            return job, False
+        return job, True
+
+    def get(self, job_id):
+        # Consultar también avanza el trabajo: Make.com repite la consulta hasta `terminado`.
+        db = get_db()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None and job.expected:
+            # La tanda anterior sigue en la cola de esta instancia: se termina de enviar antes de seguir.
+            flush_outbound()
+            self.persist(job)
+            return job.summary()
+        if not db:
+            if job is None:
+                return None
+            if job.finished_at is None:
+                self.advance(job)
+            return job.summary()
+        job, claimed = self._claim(db, job_id)
+        if job is None:
+            return None
+        if claimed:
+            self._remember(job)
+            self.advance(job)
+        return job.summary()
+
+
+jobs = TrackingJobs()
@@ -5,16 +5,24 @@
 # ==========================================================
 import os
 import re
-import json
+import copy
 import time
 import uuid
-import gspread
-import requests
 import logging
+import threading
 import unicodedata
-from datetime import datetime
+from collections import OrderedDict
+from datetime import datetime, timezone
 from logging import getLogger
-from firebase_admin import firestore
+from bot_storage import get_storage
+from bot_outbox import get_outbound_scheduler, drain as flush_outbound
+from bot_whatsapp import get_whatsapp_client
+from bot_catalog import catalog, find_product
+from bot_intents import get_intent_classifier
+from bot_sheets import find_key_in_sheet, guardar_pedido_en_sheet
+from bot_districts import get_district_resolver
+from bot_metrics import metrics
+from bot_coalesce import coalescer
 
 # Configuración del logger
 logger = getLogger(__name__)
@@ -23,72 +31,226 @@ logger = getLogger(__name__)
 # 3. FUNCIONES DE COMUNICACIÓN CON WHATSAPP
 # ==============================================================================
 def send_whatsapp_message(to_number, message_data):
-    WHATSAPP_TOKEN = os.environ.get('WHATSAPP_ACCESS_TOKEN')
-    PHONE_NUMBER_ID = os.environ.get('WHATSAPP_PHONE_NUMBER_ID')
-    if not WHATSAPP_TOKEN or not PHONE_NUMBER_ID:
-        logger.error("Token de WhatsApp o ID de número de teléfono no configurados.")
-        return
-    headers = {'Authorization': f'Bearer {WHATSAPP_TOKEN}', 'Content-Type': 'application/json'}
-    url = f"https://graph.facebook.com/v20.0/{PHONE_NUMBER_ID}/messages"
-    data = {"messaging_product": "whatsapp", "to": to_number, **message_data}
-    try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        logger.info(f"Mensaje enviado exitosamente a {to_number}.")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error enviando mensaje a {to_number}: {e.response.text if e.response else e}")
+    # El cliente reutiliza conexiones; un envío solo se reintenta si no llegó a salir (conexión o 429); ver bot_whatsapp.
+    return get_whatsapp_client().send_message(to_number, message_data)
+
+# Los handlers no esperan al envío: el mensaje se encola y `delay` es la pausa
+# respecto al mensaje anterior del mismo destinatario (antes era un time.sleep en el request).
+def _schedule_whatsapp_message(to_number, message_data, delay=0, on_done=None):
+    metrics.count_call('whatsapp')
+    if delay:
+        metrics.inc('bot_pausa_programada_segundos_total', delay)
+    get_outbound_scheduler(send_whatsapp_message).schedule(to_number, message_data, delay, on_done)
+
+# Dentro de un turno (ver outbound_turn) los mensajes se acumulan y se agrupan al final;
+# coalesce=False lo deja como mensaje propio (p. ej. un comando para copiar).
+def queue_whatsapp_message(to_number, message_data, delay=0, on_done=None, coalesce=True):
+    if not coalescer.add(to_number, message_data, delay, on_done, coalesce):
+        _schedule_whatsapp_message(to_number, message_data, delay, on_done)
+
+def outbound_turn():
+    return coalescer.collect(_schedule_whatsapp_message)
 
-def send_text_message(to_number, text):
-    send_whatsapp_message(to_number, {"type": "text", "text": {"body": text}})
+def send_text_message(to_number, text, delay=0, on_done=None, coalesce=True):
+    queue_whatsapp_message(to_number, {"type": "text", "text": {"body": text}}, delay, on_done, coalesce)
 
-def send_image_message(to_number, image_url):
-    send_whatsapp_message(to_number, {"type": "image", "image": {"link": image_url}})
+def send_image_message(to_number, image_url, delay=0):
+    queue_whatsapp_message(to_number, {"type": "image", "image": {"link": image_url}}, delay)
 
 # ==============================================================================
 # 4. FUNCIONES DE INTERACCIÓN CON FIRESTORE
 # ==============================================================================
+# 0 (por defecto): la sesión se lee una vez por mensaje y se descarta en flush_session, porque
+# mensajes seguidos de un cliente pueden caer en instancias distintas. Un valor > 0 la reutiliza
+# entre mensajes durante esos segundos: solo para hosts con una única instancia.
+SESSION_CACHE_TTL = float(os.environ.get('SESSION_CACHE_TTL', '0'))
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '2000'))
+# Una sesión sin actividad por más de SESSION_IDLE_TTL segundos se considera terminada
+# (0 = nunca expira). Cada escritura la sella con `ultima_actividad`; una sesión que solo
+# se lee se vuelve a sellar como mucho cada SESSION_TOUCH_SECONDS.
+SESSION_IDLE_TTL = float(os.environ.get('SESSION_IDLE_TTL', str(48 * 3600)))
+SESSION_TOUCH_SECONDS = float(os.environ.get('SESSION_TOUCH_SECONDS', '3600'))
+ACTIVITY_FIELD = 'ultima_actividad'
+_MISSING = object()
+
+def session_expired(session_data, now=None, idle_ttl=SESSION_IDLE_TTL):
+    # Las sesiones anteriores al sello no expiran aquí: las sella el barrido (ver bot_sweeper).
+    stamp = (session_data or {}).get(ACTIVITY_FIELD)
+    if idle_ttl <= 0 or not isinstance(stamp, datetime):
+        return False
+    return ((now or datetime.now(timezone.utc)) - stamp).total_seconds() > idle_ttl
+
+class _SessionEntry:
+    __slots__ = ('persisted', 'current', 'loaded_at', 'dirty', 'replaced')
+
+    def __init__(self, persisted):
+        self.persisted = persisted                  # lo que hay en Firestore (o None)
+        self.current = copy.deepcopy(persisted)     # lo que ve el turno actual
+        self.loaded_at = time.monotonic()
+        self.dirty = False
+        self.replaced = False                       # se borró en este turno: la escritura final no hace merge
+
+class SessionStore:
+    # Caché por wa_id con escritura diferida: los handlers leen y guardan contra la memoria y
+    # flush() manda a Firestore solo los campos cambiados, una vez por turno. Con ttl=0 la entrada
+    # vive hasta ese flush; con ttl > 0, también entre turnos (TTL/LRU).
+    def __init__(self, ttl=SESSION_CACHE_TTL, max_size=SESSION_CACHE_SIZE, idle_ttl=SESSION_IDLE_TTL,
+                 touch_seconds=SESSION_TOUCH_SECONDS):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.touch_seconds = min(touch_seconds, idle_ttl / 4) if idle_ttl > 0 else touch_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.stats = {"lecturas": 0, "escrituras": 0, "borrados": 0, "aciertos_cache": 0, "expiradas": 0}
+
+    def _entry(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and (entry.dirty or self.ttl <= 0 or time.monotonic() - entry.loaded_at < self.ttl):
+                self._entries.move_to_end(user_id)
+                self.stats["aciertos_cache"] += 1
+                return entry
+        storage = get_storage()
+        if not storage: return None
+        entry = _SessionEntry(storage.get_session(user_id))
+        with self._lock:
+            self.stats["lecturas"] += 1
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            self._evict()
+        return entry
+
+    def _evict(self):
+        # Nunca se descartan entradas con cambios pendientes.
+        while len(self._entries) > self.max_size:
+            victim = next((k for k, e in self._entries.items() if not e.dirty), None)
+            if victim is None: break
+            del self._entries[victim]
+
+    def get(self, user_id):
+        entry = self._entry(user_id)
+        if entry is None or entry.current is None: return None
+        with self._lock:
+            if session_expired(entry.current, idle_ttl=self.idle_ttl):
+                # Conversación abandonada: el cliente empieza de cero y el flush borra el documento.
+                entry.current, entry.replaced, entry.dirty = None, True, True
+                self.stats["expiradas"] += 1
+                logger.info(f"Sesión de {user_id} expirada por inactividad.")
+                return None
+            return copy.deepcopy(entry.current)
+
+    def save(self, user_id, session_data):
+        entry = self._entry(user_id)
+        if entry is None: return
+        with self._lock:
+            entry.current = {**(entry.current or {}), **copy.deepcopy(session_data)}
+            entry.dirty = True
+
+    def delete(self, user_id):
+        entry = self._entry(user_id)
+        if entry is None: return
+        with self._lock:
+            entry.current = None
+            entry.replaced = True
+            entry.dirty = True
+
+    def mark_deleted(self, user_id):
+        # La sesión ya se borró en Firestore por otra vía (p. ej. el commit de la venta).
+        with self._lock:
+            entry = _SessionEntry(None)
+            self._entries[user_id] = entry
+
+    def forget(self, user_id):
+        # Descarta la entrada (p. ej. si la sesión se escribió por otra vía).
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def _needs_touch(self, entry, now):
+        stamp = (entry.current or {}).get(ACTIVITY_FIELD)
+        return entry.current is not None and (not isinstance(stamp, datetime)
+                                              or (now - stamp).total_seconds() > self.touch_seconds)
+
+    def flush(self, user_id):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and self.ttl <= 0:
+                # Fin del turno: el próximo mensaje vuelve a leer la sesión.
+                del self._entries[user_id]
+            if not entry or not (entry.dirty or self._needs_touch(entry, now)): return
+            if entry.current is not None:
+                entry.current[ACTIVITY_FIELD] = now
+            current, persisted, replaced = copy.deepcopy(entry.current), entry.persisted, entry.replaced
+        storage = get_storage()
+        if not storage: return
+        try:
+            if current is None:
+                if persisted is not None:
+                    storage.delete_session(user_id)
+                    self.stats["borrados"] += 1
+            elif replaced or persisted is None:
+                storage.set_session(user_id, current)
+                self.stats["escrituras"] += 1
+            else:
+                changed = {k: v for k, v in current.items() if persisted.get(k, _MISSING) != v}
+                if changed:
+                    storage.set_session(user_id, changed, merge=True)
+                    self.stats["escrituras"] += 1
+            with self._lock:
+                entry.persisted, entry.dirty, entry.replaced = current, False, False
+                entry.loaded_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Error guardando sesión para {user_id}: {e}")
+            self.forget(user_id)
+
+session_store = SessionStore()
+metrics.add_stats('bot_sesiones', lambda: session_store.stats)
+
 def get_session(user_id):
-    db = firestore.client()
-    if not db: return None
     try:
-        doc = db.collection('sessions').document(user_id).get()
-        return doc.to_dict() if doc.exists else None
+        return session_store.get(user_id)
     except Exception as e:
         logger.error(f"Error obteniendo sesión para {user_id}: {e}")
         return None
 
 def save_session(user_id, session_data):
-    db = firestore.client()
-    if not db: return
     try:
-        db.collection('sessions').document(user_id).set(session_data, merge=True)
+        session_store.save(user_id, session_data)
     except Exception as e:
         logger.error(f"Error guardando sesión para {user_id}: {e}")
 
 def delete_session(user_id):
-    db = firestore.client()
-    if not db: return
     try:
-        db.collection('sessions').document(user_id).delete()
+        session_store.delete(user_id)
     except Exception as e:
         logger.error(f"Error eliminando sesión para {user_id}: {e}")
 
+# Se llama una vez al final de cada mensaje entrante (ver process_message).
+def flush_session(user_id):
+    try:
+        session_store.flush(user_id)
+    except Exception as e:
+        logger.error(f"Error guardando sesión para {user_id}: {e}")
+
 def find_product_by_keywords(text, KEYWORDS_GIRASOL):
-    db = firestore.client()
-    if not db: return None, None
+    # Búsqueda en memoria sobre el catálogo indexado (ver bot_catalog).
     try:
-        if any(keyword in text.lower() for keyword in KEYWORDS_GIRASOL):
-            product_id = "collar-girasol-radiant-01"
-            product_doc = db.collection('productos').document(product_id).get()
-            if product_doc.exists and product_doc.to_dict().get('activo'):
-                return product_id, product_doc.to_dict()
+        return find_product(text, KEYWORDS_GIRASOL)
     except Exception as e:
         logger.error(f"Error buscando producto por palabras clave: {e}")
     return None, None
 
+# Clasifica el mensaje una sola vez: cancelación, FAQ y productos del catálogo (ver bot_intents).
+def classify_message(text, FAQ_KEYWORD_MAP, KEYWORDS_GIRASOL, PALABRAS_CANCELACION=(), config=None):
+    catalog.refresh(KEYWORDS_GIRASOL)
+    if config is not None:
+        return config.classifier(catalog.keyword_index).classify(text)
+    return get_intent_classifier(FAQ_KEYWORD_MAP, PALABRAS_CANCELACION, catalog.keyword_index).classify(text)
+
 def save_completed_sale_and_customer(session_data):
-    db = firestore.client()
-    if not db: return False, None
+    storage = get_storage()
+    if not storage: return False, None
     try:
         sale_id = str(uuid.uuid4())
         customer_id = session_data.get('whatsapp_id')
@@ -96,7 +258,6 @@ def save_completed_sale_and_customer(session_data):
         adelanto = session_data.get('adelanto', 0)
         saldo_restante = precio_total - adelanto
         sale_data = {
-            "fecha": firestore.SERVER_TIMESTAMP,
             "id_venta": sale_id,
             "producto_id": session_data.get('product_id'),
             "producto_nombre": session_data.get('product_name'),
@@ -109,25 +270,73 @@ def save_completed_sale_and_customer(session_data):
             "cliente_id": customer_id,
             "estado_pedido": "Adelanto Pagado",
             "adelanto_recibido": adelanto,
-            "saldo_restante": saldo_restante
+            "saldo_restante": saldo_restante,
+            "comprobante": session_data.get('comprobante'),
+            "exportado": False,  # lo marca el exportador de Sheets al llegar a la hoja
         }
-        db.collection('ventas').document(sale_id).set(sale_data)
-        logger.info(f"Venta {sale_id} guardada en Firestore.")
         customer_data = {
             "nombre_perfil_wa": session_data.get('user_name'),
             "provincia_ultimo_envio": session_data.get('provincia'),
             "distrito_ultimo_envio": session_data.get('distrito'),
             "detalles_ultimo_envio": session_data.get('detalles_cliente'),
-            "total_compras": firestore.Increment(1),
-            "fecha_ultima_compra": firestore.SERVER_TIMESTAMP
         }
-        db.collection('clientes').document(customer_id).set(customer_data, merge=True)
-        logger.info(f"Cliente {customer_id} creado/actualizado.")
+        # Venta, cliente (+1 compra, pedido abierto) y cierre de la sesión en una sola
+        # escritura atómica: o se guarda todo o nada (ver bot_storage).
+        storage.complete_sale(sale_data, customer_id, customer_data)
+        session_store.mark_deleted(customer_id)
+        _cache_open_order(customer_id, sale_id)
+        coalescer.sale_completed(customer_id)
+        logger.info(f"Venta {sale_id} guardada y cliente {customer_id} creado/actualizado.")
         return True, sale_data
     except Exception as e:
         logger.error(f"Error guardando venta y cliente en Firestore: {e}")
         return False, None
 
+# Marcador de pedido abierto (saldo pendiente) en `clientes/{id}.pedido_abierto`:
+# lo pone save_completed_sale_and_customer y lo limpia close_open_order. Sustituye la
+# consulta compuesta sobre `ventas` que se hacía con cada mensaje.
+# 0 (por defecto): se lee en cada consulta; la clave del admin puede cerrar el pedido en otra
+# instancia. Un valor > 0 solo para hosts con una única instancia.
+OPEN_ORDER_CACHE_TTL = float(os.environ.get('OPEN_ORDER_CACHE_TTL', '0'))
+_open_orders = {}  # cliente_id -> (sale_id | None, cached_at)
+
+def _cache_open_order(cliente_id, sale_id):
+    _open_orders[cliente_id] = (sale_id, time.monotonic())
+
+def get_open_order(cliente_id):
+    if (cached := _open_orders.get(cliente_id)) and time.monotonic() - cached[1] < OPEN_ORDER_CACHE_TTL:
+        return cached[0]
+    storage = get_storage()
+    if not storage: return None
+    try:
+        customer = storage.get_customer(cliente_id)
+        if customer and 'pedido_abierto' in customer:
+            sale_id = customer['pedido_abierto']
+        elif customer is not None:
+            # Cliente anterior al marcador: se consulta `ventas` una vez y se guarda el resultado.
+            sale_id = storage.find_open_sale(cliente_id)
+            storage.update_customer(cliente_id, {"pedido_abierto": sale_id})
+        else:
+            sale_id = None
+        _cache_open_order(cliente_id, sale_id)
+        return sale_id
+    except Exception as e:
+        logger.error(f"Error consultando pedido abierto de {cliente_id}: {e}")
+        return None
+
+def close_open_order(cliente_id, estado_final="Completado"):
+    storage = get_storage()
+    if not storage: return False
+    try:
+        sale_id = get_open_order(cliente_id)
+        storage.close_sale(cliente_id, sale_id, estado_final)
+        _cache_open_order(cliente_id, None)
+        logger.info(f"Pedido {sale_id} de {cliente_id} cerrado como '{estado_final}'.")
+        return True
+    except Exception as e:
+        logger.error(f"Error cerrando pedido abierto de {cliente_id}: {e}")
+        return False
+
 # ==============================================================================
 # 5. FUNCIONES AUXILIARES DE LÓGICA DE NEGOCIO
 # ==============================================================================
@@ -135,22 +344,8 @@ def strip_accents(text):
     return ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
 
 def normalize_and_check_district(text, BUSINESS_RULES):
-    clean_text = re.sub(r'soy de|vivo en|estoy en|es en|de', '', text, flags=re.IGNORECASE).strip()
-    normalized_input = strip_accents(clean_text.lower())
-    abreviaturas = BUSINESS_RULES.get('abreviaturas_distritos', {})
-    for abbr, full_name in abreviaturas.items():
-        if abbr in normalized_input:
-            normalized_input = strip_accents(full_name.lower())
-            break
-    distritos_cobertura = BUSINESS_RULES.get('distritos_cobertura_delivery', [])
-    for distrito in distritos_cobertura:
-        if normalized_input in strip_accents(distrito.lower()):
-            return distrito.title(), 'CON_COBERTURA'
-    distritos_totales = BUSINESS_RULES.get('distritos_lima_total', [])
-    for distrito in distritos_totales:
-        if normalized_input in strip_accents(distrito.lower()):
-            return distrito.title(), 'SIN_COBERTURA'
-    return None, 'NO_ENCONTRADO'
+    # Devuelve (distrito, 'CON_COBERTURA' | 'SIN_COBERTURA' | 'NO_ENCONTRADO'); ver bot_districts.
+    return get_district_resolver(BUSINESS_RULES).resolve(text)
 
 def parse_province_district(text):
     clean_text = re.sub(r'soy de|vivo en|mi ciudad es|el distrito es', '', text, flags=re.IGNORECASE).strip()
@@ -167,100 +362,3 @@ def get_delivery_day_message(BUSINESS_RULES):
         return BUSINESS_RULES.get('mensaje_dia_habil', 'mañana')
     else:
         return BUSINESS_RULES.get('mensaje_fin_semana', 'el Lunes')
-
-def guardar_pedido_en_sheet(sale_data):
-    try:
-        creds_json_str = os.environ.get('GOOGLE_CREDENTIALS_JSON')
-        sheet_name = os.environ.get('GOOGLE_SHEET_NAME')
-        if not creds_json_str or not sheet_name:
-            logger.error("[Sheets] Faltan variables de entorno para Google Sheets.")
-            return False
-        creds_dict = json.loads(creds_json_str)
-        gc = gspread.service_account_from_dict(creds_dict)
-        spreadsheet = gc.open(sheet_name)
-        worksheet = spreadsheet.sheet1
-        nueva_fila = [
-            datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
-            sale_data.get('id_venta', 'N/A'),
-            sale_data.get('producto_nombre', 'N/A'),
-            sale_data.get('precio_venta', 0),
-            sale_data.get('tipo_envio', 'N/A'),
-            sale_data.get('metodo_pago', 'N/A'),
-            sale_data.get('adelanto_recibido', 0),
-            sale_data.get('saldo_restante', 0),
-            sale_data.get('provincia', 'N/A'),
-            sale_data.get('distrito', 'N/A'),
-            sale_data.get('detalles_cliente', 'N/A'),
-            sale_data.get('cliente_id', 'N/A')
-        ]
-        worksheet.append_row(nueva_fila)
-        logger.info(f"[Sheets] Pedido {sale_data.get('id_venta')} guardado.")
-        return True
-    except Exception as e:
-        logger.error(f"[Sheets] ERROR INESPERADO: {e}")
-        return False
-
-def find_key_in_sheet(cliente_id):
-    try:
-        creds_json_str = os.environ.get('GOOGLE_CREDENTIALS_JSON')
-        sheet_name = os.environ.get('GOOGLE_SHEET_NAME')
-        if not creds_json_str or not sheet_name:
-            logger.error("[Sheets] Faltan variables de entorno para buscar clave.")
-            return None
-        creds_dict = json.loads(creds_json_str)
-        gc = gspread.service_account_from_dict(creds_dict)
-        spreadsheet = gc.open(sheet_name)
-        worksheet = spreadsheet.sheet1
-        cell = worksheet.find(cliente_id, in_column=12) # Columna L para WhatsApp ID
-        if cell:
-            clave = worksheet.cell(cell.row, 15).value # Columna O para Clave
-            logger.info(f"[Sheets] Clave encontrada para {cliente_id}: {'Sí' if clave else 'No'}")
-            return clave
-        else:
-            logger.warning(f"[Sheets] No se encontró la fila para el cliente {cliente_id}.")
-            return None
-    except Exception as e:
-        logger.error(f"[Sheets] ERROR buscando la clave: {e}")
-        return None
-
-def get_last_question(state):
-    questions = {
-        "awaiting_occasion_response": "Cuéntame, ¿es un tesoro para ti o un regalo para alguien especial?",
-        "awaiting_purchase_decision": "¿Te gustaría coordinar tu pedido ahora para asegurar el tuyo? (Sí/No)",
-        "awaiting_upsell_decision": "Para continuar, por favor, respóndeme con una de estas dos palabras:\n👉🏽 Escribe *oferta* para ampliar tu pedido.\n👉🏽 Escribe *continuar* para llevar solo un collar.",
-        "awaiting_location": "Para empezar a coordinar el envío, por favor, dime: ¿eres de *Lima* o de *provincia*?",
-        "awaiting_lima_district": "¡Genial! ✨ Para saber qué tipo de envío te corresponde, por favor, dime: ¿en qué distrito te encuentras? 📍",
-        "awaiting_province_district": "¡Entendido! Para continuar, por favor, indícame tu *provincia y distrito*. ✍🏽\n\n📝 *Ej: Arequipa, Arequipa*",
-        "awaiting_shalom_agreement": "¿Estás de acuerdo con el adelanto? (Sí/No)",
-        "awaiting_lima_payment_agreement": "¿Procedemos con la confirmación del adelanto? (Sí/No)",
-        "awaiting_lima_payment": "Una vez realizado, por favor, envíame la *captura de pantalla* para validar tu pedido.",
-        "awaiting_shalom_payment": "Una vez realizado, por favor, envíame la *captura de pantalla* para validar tu pedido."
-    }
-    return questions.get(state)
-
-def find_key_in_sheet(cliente_id):
-    try:
-        creds_json_str = os.environ.get('GOOGLE_CREDENTIALS_JSON')
-        sheet_name = os.environ.get('GOOGLE_SHEET_NAME')
-        if not creds_json_str or not sheet_name:
-            logger.error("[Sheets] Faltan variables de entorno para buscar clave.")
-            return None
-
-        creds_dict = json.loads(creds_json_str)
-        gc = gspread.service_account_from_dict(creds_dict)
-        spreadsheet = gc.open(sheet_name)
-        worksheet = spreadsheet.sheet1
-
-        # Asumimos que el WhatsApp ID (cliente_id) está en la columna 12 (L)
-        # y la Clave está en la columna 15 (O)
-        cell = worksheet.find(cliente_id, in_column=12) 
-        if cell:
-            clave = worksheet.cell(cell.row, 15).value
-            logger.info(f"[Sheets] Clave encontrada para {cliente_id}: {'Sí' if clave else 'No'}")
-            return clave
-        else:
-            logger.warning(f"[Sheets] No se encontró la fila para el cliente {cliente_id}.")
-            return None
-    except Exception as e:
-        logger.error(f"[Sheets] ERROR buscando la clave: {e}")
-        return None
\ No newline at end of file
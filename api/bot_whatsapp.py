@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - CLIENTE DE LA GRAPH API DE WHATSAPP
+# Cliente de larga vida: sesión HTTP con pool keep-alive, configuración
+# leída una sola vez, timeouts y reintentos que respetan Retry-After.
+# Un envío (POST /messages) no es idempotente: tras un timeout de lectura o
+# un 5xx Meta pudo haberlo entregado, así que solo se reintenta si no llegó
+# a conectarse o si respondió 429.
+# ==========================================================
+import os
+import time
+import random
+import threading
+from logging import getLogger
+from bot_startup import startup_profile
+from bot_metrics import metrics
+
+logger = getLogger(__name__)
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+SEND_RETRY_STATUS = {429}  # el único rechazo que garantiza que el mensaje no salió
+
+
+class WhatsAppClient:
+    def __init__(self, token=None, phone_number_id=None, base_url=None,
+                 connect_timeout=3.05, read_timeout=10, max_retries=3,
+                 backoff_base=0.5, max_retry_after=30, pool_size=10):
+        self.token = token if token is not None else os.environ.get('WHATSAPP_ACCESS_TOKEN')
+        self.phone_number_id = phone_number_id if phone_number_id is not None else os.environ.get('WHATSAPP_PHONE_NUMBER_ID')
+        base_url = base_url or os.environ.get('WHATSAPP_GRAPH_API_URL', 'https://graph.facebook.com/v20.0')
+        self.base_url = base_url.rstrip('/')
+        self.messages_url = f"{self.base_url}/{self.phone_number_id}/messages"
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_retry_after = max_retry_after
+
+        with startup_profile.measure('import:requests'):
+            import requests
+            from requests.adapters import HTTPAdapter
+        self._requests = requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Authorization': f'Bearer {self.token}', 'Content-Type': 'application/json'})
+
+        self._lock = threading.Lock()
+        self.stats = {"llamadas": 0, "reintentos": 0, "errores": 0, "latencia_total_s": 0.0, "latencia_max_s": 0.0}
+
+    @property
+    def configured(self):
+        return bool(self.token and self.phone_number_id)
+
+    def _record(self, key, latency=None):
+        with self._lock:
+            self.stats[key] += 1
+            if latency is not None:
+                self.stats["latencia_total_s"] += latency
+                self.stats["latencia_max_s"] = max(self.stats["latencia_max_s"], latency)
+
+    def _retry_delay(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_retry_after)
+            except ValueError:
+                pass
+        return min(self.backoff_base * (2 ** attempt), self.max_retry_after) * (0.5 + random.random() / 2)
+
+    def _never_sent(self, error):
+        # True si la petición no llegó a salir: timeout o rechazo al conectar (incluye DNS).
+        if isinstance(error, self._requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(error, self._requests.exceptions.Timeout):
+            return False
+        from urllib3.exceptions import ConnectTimeoutError
+        reason = getattr(error.args[0], 'reason', error.args[0]) if error.args else None
+        return isinstance(reason, ConnectTimeoutError)
+
+    def request(self, method, url, idempotent=None, **kwargs):
+        # idempotent=False (envíos): sin reintentos que puedan duplicar el mensaje al cliente.
+        kwargs.setdefault('timeout', self.timeout)
+        if idempotent is None:
+            idempotent = method in ('GET', 'HEAD')
+        retry_status = RETRY_STATUS if idempotent else SEND_RETRY_STATUS
+        for attempt in range(self.max_retries + 1):
+            response = None
+            start = time.perf_counter()
+            try:
+                with metrics.call('whatsapp', 'graph_api', count=False):
+                    response = self.session.request(method, url, **kwargs)
+                self._record("llamadas", time.perf_counter() - start)
+                if response.status_code not in retry_status or attempt == self.max_retries:
+                    response.raise_for_status()
+                    return response
+            except (self._requests.exceptions.ConnectionError, self._requests.exceptions.Timeout) as e:
+                self._record("llamadas", time.perf_counter() - start)
+                if attempt == self.max_retries or not (idempotent or self._never_sent(e)):
+                    raise
+                logger.warning(f"[WhatsApp] Error de red ({e}), reintentando...")
+            delay = self._retry_delay(attempt, response)
+            self._record("reintentos")
+            if response is not None:
+                logger.warning(f"[WhatsApp] HTTP {response.status_code}, reintento en {delay:.1f}s.")
+            time.sleep(delay)
+
+    def send_message(self, to_number, message_data):
+        if not self.configured:
+            logger.error("Token de WhatsApp o ID de número de teléfono no configurados.")
+            return False
+        data = {"messaging_product": "whatsapp", "to": to_number, **message_data}
+        try:
+            self.request('POST', self.messages_url, idempotent=False, json=data)
+            logger.info(f"Mensaje enviado exitosamente a {to_number}.")
+            return True
+        except self._requests.exceptions.RequestException as e:
+            self._record("errores")
+            response = getattr(e, 'response', None)
+            logger.error(f"Error enviando mensaje a {to_number}: {response.text if response is not None else e}")
+            return False
+
+    def get_media_info(self, media_id):
+        # {url, mime_type, sha256, file_size, id}; la URL firmada caduca en minutos.
+        return self.request('GET', f"{self.base_url}/{media_id}").json()
+
+    def open_media(self, media_url):
+        # Respuesta en streaming: el llamador la lee por bloques y debe cerrarla.
+        return self.request('GET', media_url, stream=True)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["latencia_media_s"] = stats["latencia_total_s"] / stats["llamadas"] if stats["llamadas"] else 0.0
+        return stats
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_whatsapp_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = WhatsAppClient()
+    return _client
+
+# Solo si el cliente ya existe: el scrape no debe importar requests.
+metrics.add_stats('bot_whatsapp', lambda: _client.metrics() if _client else {})
@@ -3,57 +3,39 @@
 # BOT DAAQUI JOYAS - V10.2 - DEBUG DETALLADO
 # Archivo principal: maneja la configuración inicial y los webhooks.
 # ==========================================================
-from flask import Flask, request, jsonify
 import logging
 from logging import getLogger
 import os
-import json
-import firebase_admin
-from firebase_admin import credentials, firestore
-import time
-
-# --- Importaciones de nuestros nuevos módulos ---
-from bot_utils import find_key_in_sheet, send_text_message, get_session, delete_session
-from bot_logic import handle_initial_message, handle_sales_flow
+from bot_startup import startup_profile
 
 # Configuración del logger
 logging.basicConfig(level=logging.INFO)
 logger = getLogger(__name__)
 
-# ==========================================================
-# INICIALIZACIÓN DE FIREBASE Y CARGA DE CONFIGURACIÓN
-# ==========================================================
-db = None
-BUSINESS_RULES = {}
-FAQ_RESPONSES = {}
-
-try:
-    service_account_info_str = os.environ.get('FIREBASE_SERVICE_ACCOUNT_JSON')
-    if service_account_info_str:
-        service_account_info = json.loads(service_account_info_str)
-        cred = credentials.Certificate(service_account_info)
-        if not firebase_admin._apps:
-            firebase_admin.initialize_app(cred)
-        db = firestore.client()
-        logger.info("✅ Conexión con Firebase establecida.")
-
-        if (rules_doc := db.collection('configuracion').document('reglas_envio').get()).exists:
-            BUSINESS_RULES = rules_doc.to_dict()
-            logger.info("✅ Reglas del negocio cargadas.")
-        else:
-            logger.error("❌ Documento de reglas de envío no encontrado.")
+with startup_profile.measure('import:flask'):
+    from flask import Flask, request, jsonify
 
-        if (faq_doc := db.collection('configuracion').document('respuestas_faq').get()).exists:
-            FAQ_RESPONSES = faq_doc.to_dict()
-            logger.info("✅ Respuestas FAQ cargadas.")
-        else:
-            logger.error("❌ Documento de respuestas_faq no encontrado.")
-    else:
-        logger.error("❌ Variable de entorno FIREBASE_SERVICE_ACCOUNT_JSON no configurada.")
-except Exception as e:
-    # ESTA ES LA LÍNEA CLAVE PARA VER EL ERROR REAL
-    logger.error(f"❌❌❌ ERROR DETALLADO EN INICIALIZACIÓN DE FIREBASE: {e} ❌❌❌")
-    logger.error(f"❌ Error crítico en inicialización: {e}")
+# --- Importaciones de nuestros nuevos módulos ---
+# firebase_admin, gspread y requests se importan recién cuando se usan (ver bot_db,
+# bot_sheets y bot_whatsapp): GET / y la verificación del webhook no los pagan.
+with startup_profile.measure('import:bot'):
+    from bot_utils import (
+        find_key_in_sheet, send_text_message, outbound_turn, flush_outbound, get_session, delete_session, flush_session,
+        classify_message, get_open_order, close_open_order
+    )
+    from bot_logic import handle_initial_message, handle_sales_flow
+    from bot_dedup import is_new_message, release_message
+    from bot_config import ConfigService
+    from bot_catalog import catalog
+    from bot_db import on_db_ready
+    from bot_dispatch import WebhookDispatcher
+    from bot_metrics import metrics
+    from bot_media import receipt_pipeline
+    from bot_reports import list_sales, read_aggregates, summary_range, backfill_aggregates, SALE_FILTERS
+    from bot_tracking import tracking_messages, get_customer_names, TRACKING_BULK_MAX, jobs as tracking_jobs
+    from bot_sweeper import sweeper
+    from bot_ratelimit import rate_limiter
+    from bot_sheets import order_exporter, SHEETS_RECOVER_LIMIT
 
 app = Flask(__name__)
 
@@ -75,6 +57,13 @@ FAQ_KEYWORD_MAP = {
     'cambios_devoluciones': ['cambio', 'cambiar', 'devolución'], 'stock': ['stock', 'disponible', 'tienen', 'hay']
 }
 
+# Reglas de negocio y respuestas FAQ: se recargan en caliente (ver bot_config).
+# Con la primera conexión a Firestore, configuración y catálogo se cargan en paralelo.
+config_service = ConfigService(FAQ_KEYWORD_MAP, PALABRAS_CANCELACION)
+on_db_ready('config', config_service.refresh)
+on_db_ready('catalogo', lambda: catalog.refresh(KEYWORDS_GIRASOL))
+sweeper.start_background()
+
 # ==============================================================================
 # 8. WEBHOOK PRINCIPAL Y PROCESADOR DE MENSAJES
 # ==============================================================================
@@ -86,26 +75,64 @@ def webhook():
         return 'Forbidden', 403
     elif request.method == 'POST':
         try:
-            data = request.get_json()
-            if data.get('object') == 'whatsapp_business_account':
-                for entry in data.get('entry', []):
-                    for change in entry.get('changes', []):
-                        if change.get('field') == 'messages' and (value := change.get('value', {})):
-                            if messages := value.get('messages'):
-                                for message in messages:
-                                    process_message(message, value.get('contacts', []))
+            # Los callbacks de estado se descartan sin parsear; clientes distintos en paralelo
+            # y los mensajes de cada cliente, en orden.
+            pending = dispatcher.dispatch_raw(request.get_data(cache=False))
+            # Las respuestas y los pedidos para Sheets salen antes de devolver el 200: después el
+            # proceso se congela.
+            flush_outbound()
+            order_exporter.flush_due()
+            if pending:
+                # Hubo mensajes descartados por carga: con un 503 Meta reenvía el lote y la
+                # deduplicación deja pasar solo esos.
+                return jsonify({'status': 'retry'}), 503
             return jsonify({'status': 'success'}), 200
+        except ValueError as e:
+            logger.error(f"Payload de webhook inválido: {e}"); return jsonify({'error': 'JSON inválido'}), 400
         except Exception as e:
             logger.error(f"Error procesando webhook: {e}"); return jsonify({'error': str(e)}), 500
 
-def process_message(message, contacts):
+def process_new_message(message, names):
+    from_number = message.get('from')
+    # Reentregas de Meta: se descartan antes de leer sesión, gastar tokens del límite o enviar nada.
+    if not is_new_message(message.get('id')):
+        return
+    # Límite por cliente antes de gastar Firestore o envíos: lo excedente se agrupa con
+    # el próximo mensaje o se descarta (ver bot_ratelimit).
+    try:
+        if (message := rate_limiter.admit(message)) is None:
+            return
+        with rate_limiter.inflight(message) as admitted:
+            if not admitted:
+                # Descartado por carga: se libera la reserva para que la reentrega de Meta lo procese.
+                release_message(message.get('id'))
+                return False
+            process_message(message, names)
+    finally:
+        # El límite pudo leer la sesión: no queda en caché para el próximo mensaje.
+        flush_session(from_number)
+
+dispatcher = WebhookDispatcher(process_new_message)
+metrics.add_stats('bot_webhook', dispatcher.acceptance)
+
+def process_message(message, names):
+    from_number = message.get('from')
+    # Lo que se envía durante el turno se agrupa y sale al terminar (ver bot_coalesce).
+    with metrics.turn(message.get('type') or 'desconocido'), outbound_turn():
+        _process_message(from_number, message, names)
+
+def _process_message(from_number, message, names):
     try:
-        from_number = message.get('from')
-        user_name = next((c.get('profile', {}).get('name', 'Usuario') for c in contacts if c.get('wa_id') == from_number), 'Usuario')
+        user_name = names.get(from_number) or 'Usuario'
         message_type = message.get('type')
         text_body = ""
         if message_type == 'text':
             text_body = message.get('text', {}).get('body', '')
+        elif message_type in ('interactive', 'button'):
+            # Respuesta a nuestros botones (Sí/No, oferta/continuar): se trata como el texto del botón.
+            reply = message.get('interactive', {}).get('button_reply') or message.get('interactive', {}).get('list_reply') or {}
+            text_body = reply.get('title') or reply.get('id') or message.get('button', {}).get('text', '')
+            message_type = 'text'
         elif message_type == 'image':
             text_body = "_Imagen Recibida_"
         else:
@@ -122,6 +149,8 @@ def process_message(message, contacts):
                            f"Aquí tienes tu clave secreta para recoger tu pedido:\n\n"
                            f"🔑 *CLAVE:* {secret_key}\n\n¡Que disfrutes tu joya!")
                     send_text_message(target_number, msg)
+                    # Con la clave entregada el saldo está pagado: el pedido deja de estar abierto.
+                    close_open_order(target_number)
                     send_text_message(from_number, f"✅ Clave '{secret_key}' enviada a {target_number}.")
                 else:
                     send_text_message(from_number, f"❌ Error: El número '{target_number}' no parece válido.")
@@ -129,48 +158,118 @@ def process_message(message, contacts):
                 send_text_message(from_number, "❌ Error: Usa: clave <numero> <clave>")
             return
 
-        if db and (ventas_pendientes := db.collection('ventas').where('cliente_id', '==', from_number).where('estado_pedido', '==', 'Adelanto Pagado').limit(1).get()) and message_type == 'image':
-            clave_encontrada = find_key_in_sheet(from_number)
-            
-            # Mensaje 1: La información
-            notificacion_info = (f"🔔 *¡Atención! Posible Pago Final Recibido* 🔔\n\n"
-                                 f"*Cliente:* {user_name}\n*WA ID:* {from_number}\n")
-            
-            if clave_encontrada:
-                notificacion_info += f"*Clave Encontrada:* `{clave_encontrada}`"
-                # Mensaje 2: El comando listo para copiar
-                comando_listo = f"clave {from_number} {clave_encontrada}"
-                
-                send_text_message(ADMIN_WHATSAPP_NUMBER, notificacion_info)
-                time.sleep(1) 
-                send_text_message(ADMIN_WHATSAPP_NUMBER, comando_listo)
-            else:
-                notificacion_info += ("*Clave:* No encontrada en Sheet.\n\n"
-                                      f"Busca la clave y envíala con:\n`clave {from_number} LA_CLAVE_SECRETA`")
-                send_text_message(ADMIN_WHATSAPP_NUMBER, notificacion_info)
+        # Comprobantes: se descargan y verifican dentro del request; el aviso al admin o el
+        # cierre de la venta siguen cuando se sabe que no es un comprobante repetido.
+        media_id = message.get('image', {}).get('id') if message_type == 'image' else None
+        if message_type == 'image' and get_open_order(from_number):
+            receipt_pipeline.submit(media_id, from_number, 'saldo', lambda result: continue_with_receipt(
+                from_number, user_name, result, lambda: notify_final_payment(from_number, user_name, result)))
             return
 
-        if any(palabra in text_body.lower() for palabra in PALABRAS_CANCELACION):
+        # Una sola pasada sobre el texto para cancelación, FAQ y productos.
+        config = config_service.get()
+        intents = classify_message(text_body, FAQ_KEYWORD_MAP, KEYWORDS_GIRASOL, config=config) if message_type == 'text' else None
+        if intents and intents.cancelacion:
             if get_session(from_number):
                 delete_session(from_number)
                 send_text_message(from_number, "Hecho. He cancelado el proceso. Si necesitas algo más, escríbeme. 😊")
             return
 
+        if message_type == 'image' and (session := get_session(from_number)) and session.get('state') in RECEIPT_STATES:
+            receipt_pipeline.submit(media_id, from_number, 'adelanto', lambda result: continue_with_receipt(
+                from_number, user_name, result, lambda: complete_sale_with_receipt(from_number, result)))
+            return
+
         if not (session := get_session(from_number)):
-            handle_initial_message(from_number, user_name, text_body if message_type == 'text' else "collar girasol", FAQ_KEYWORD_MAP, FAQ_RESPONSES, KEYWORDS_GIRASOL)
+            handle_initial_message(from_number, user_name, text_body if message_type == 'text' else "collar girasol", FAQ_KEYWORD_MAP, config.faq_responses, KEYWORDS_GIRASOL, intents)
         else:
-            handle_sales_flow(from_number, text_body if message_type == 'text' else "COMPROBANTE_RECIBIDO", session, FAQ_KEYWORD_MAP, FAQ_RESPONSES, KEYWORDS_GIRASOL, BUSINESS_RULES, RUC_EMPRESA, TITULAR_YAPE, ADMIN_WHATSAPP_NUMBER)
+            handle_sales_flow(from_number, text_body if message_type == 'text' else "COMPROBANTE_RECIBIDO", session, FAQ_KEYWORD_MAP, config.faq_responses, KEYWORDS_GIRASOL, config.business_rules, RUC_EMPRESA, TITULAR_YAPE, ADMIN_WHATSAPP_NUMBER, intents, config=config)
             
     except Exception as e:
         logger.error(f"Error fatal en process_message: {e}")
+    finally:
+        # Una sola escritura de sesión por mensaje, con los campos que cambiaron.
+        flush_session(from_number)
+
+RECEIPT_STATES = ('awaiting_lima_payment', 'awaiting_shalom_payment')
+
+def continue_with_receipt(from_number, user_name, result, action):
+    # Serializado con los demás mensajes del cliente (con MEDIA_ASYNC=1 corre en el pool de comprobantes).
+    def run():
+        with metrics.turn('comprobante'), outbound_turn():
+            try:
+                if result.duplicate_of is not None:
+                    previous = result.duplicate_of
+                    send_text_message(from_number, "Recibimos tu imagen, pero este comprobante ya fue registrado antes. 🧐 "
+                                                   "Un asesor lo revisará y te escribirá en breve.")
+                    if ADMIN_WHATSAPP_NUMBER:
+                        send_text_message(ADMIN_WHATSAPP_NUMBER,
+                                          f"⚠️ *Comprobante repetido* ⚠️\n\n*Cliente:* {user_name}\n*WA ID:* {from_number}\n"
+                                          f"*Ya recibido de:* {previous.get('cliente_id')} ({previous.get('contexto')})\n"
+                                          f"*SHA-256:* {result.sha256[:16]}…\n\nRevísalo antes de confirmar el pago.")
+                    return
+                if result.similar_to is not None and ADMIN_WHATSAPP_NUMBER:
+                    # Misma plantilla o imagen parecida: no se rechaza, el admin lo revisa.
+                    similar = result.similar_to
+                    send_text_message(ADMIN_WHATSAPP_NUMBER,
+                                      f"🔎 *Comprobante para revisar* 🔎\n\n*Cliente:* {user_name}\n*WA ID:* {from_number}\n"
+                                      f"*Parecido a uno de:* {similar.get('cliente_id')} ({similar.get('contexto')})\n\n"
+                                      f"Confirma que el pago es distinto antes de despachar.")
+                if action() is False:
+                    # La venta no se guardó: el cliente debe poder reenviar la misma captura.
+                    receipt_pipeline.release(result)
+            except Exception as e:
+                logger.error(f"Error continuando el comprobante de {from_number}: {e}")
+                receipt_pipeline.release(result)
+            finally:
+                flush_session(from_number)
+    dispatcher.run_exclusive(from_number, run)
+
+def notify_final_payment(from_number, user_name, result):
+    clave_encontrada = find_key_in_sheet(from_number)
+    
+    # Mensaje 1: La información
+    notificacion_info = (f"🔔 *¡Atención! Posible Pago Final Recibido* 🔔\n\n"
+                         f"*Cliente:* {user_name}\n*WA ID:* {from_number}\n"
+                         f"*Comprobante:* {'nuevo ✅' if result.verified else 'no se pudo verificar ⚠️'}\n")
+    
+    if clave_encontrada:
+        notificacion_info += f"*Clave Encontrada:* `{clave_encontrada}`"
+        # Mensaje 2: El comando listo para copiar
+        comando_listo = f"clave {from_number} {clave_encontrada}"
+        
+        send_text_message(ADMIN_WHATSAPP_NUMBER, notificacion_info)
+        send_text_message(ADMIN_WHATSAPP_NUMBER, comando_listo, delay=1, coalesce=False)
+    else:
+        notificacion_info += ("*Clave:* No encontrada en Sheet.\n\n"
+                              f"Busca la clave y envíala con:\n`clave {from_number} LA_CLAVE_SECRETA`")
+        send_text_message(ADMIN_WHATSAPP_NUMBER, notificacion_info)
+
+def complete_sale_with_receipt(from_number, result):
+    # False si la venta no quedó guardada. La sesión se vuelve a leer: pudo cambiar mientras se
+    # descargaba el comprobante.
+    if not (session := get_session(from_number)) or session.get('state') not in RECEIPT_STATES:
+        return False
+    if result.verified:
+        session['comprobante'] = result.as_dict()
+    config = config_service.get()
+    handle_sales_flow(from_number, "COMPROBANTE_RECIBIDO", session, FAQ_KEYWORD_MAP, config.faq_responses, KEYWORDS_GIRASOL, config.business_rules, RUC_EMPRESA, TITULAR_YAPE, ADMIN_WHATSAPP_NUMBER, config=config)
+    # Con la venta guardada la sesión se cerró; si sigue esperando el pago, el guardado falló.
+    return not ((session := get_session(from_number)) and session.get('state') in RECEIPT_STATES)
 
 # ==============================================================================
-# 9. ENDPOINT PARA AUTOMATIZACIONES (MAKE.COM)
+# 9. ENDPOINTS PARA AUTOMATIZACIONES (MAKE.COM) Y MONITOREO
 # ==============================================================================
+def is_authorized(endpoint):
+    # Make.com y el monitoreo se autentican con el mismo token.
+    if (auth_header := request.headers.get('Authorization')) is None or auth_header != f'Bearer {MAKE_SECRET_TOKEN}':
+        logger.warning(f"Acceso no autorizado a {endpoint}")
+        return False
+    return True
+
 @app.route('/api/send-tracking', methods=['POST'])
 def send_tracking_code():
-    if (auth_header := request.headers.get('Authorization')) is None or auth_header != f'Bearer {MAKE_SECRET_TOKEN}':
-        logger.warning("Acceso no autorizado a /api/send-tracking")
+    if not is_authorized('/api/send-tracking'):
         return jsonify({'error': 'No autorizado'}), 401
     
     data = request.get_json()
@@ -181,32 +280,121 @@ def send_tracking_code():
         return jsonify({'error': 'Faltan parámetros'}), 400
     
     try:
-        customer_name = "cliente"
-        if db and (customer_doc := db.collection('clientes').document(str(to_number)).get()).exists:
-            customer_name = customer_doc.to_dict().get('nombre_perfil_wa', 'cliente')
-
-        message_1 = (f"¡Hola {customer_name}! 👋🏽✨\n\n¡Excelentes noticias! Tu pedido de Daaqui Joyas ha sido enviado. 🚚\n\n"
-                     f"Datos para seguimiento Shalom:\n👉🏽 *Nro. de Orden:* {nro_orden}" +
-                     (f"\n👉🏽 *Código de Recojo:* {codigo_recojo}" if codigo_recojo else "") +
-                     "\n\nA continuación, los pasos a seguir:")
-        send_text_message(str(to_number), message_1)
-        time.sleep(2)
-        message_2 = ("*Pasos para una entrega exitosa:* 👇\n\n"
-                     "*1. HAZ EL SEGUIMIENTO:* 📲\nDescarga la app *\"Mi Shalom\"*. Si eres nuevo, regístrate. Con los datos de arriba, podrás ver el estado de tu paquete.\n\n"
-                     "*2. PAGA EL SALDO CUANDO LLEGUE:* 💳\nCuando la app confirme que tu pedido llegó a la agencia, yapea o plinea el saldo restante. Haz este paso *antes de ir a la agencia*.\n\n"
-                     "*3. AVISA Y RECIBE TU CLAVE:* 🔑\nApenas nos envíes la captura de tu pago, lo validaremos y te daremos la *clave secreta de recojo*. ¡La necesitarás junto a tu DNI! 🎁")
-        send_text_message(str(to_number), message_2)
-        time.sleep(2)
-        message_3 = ("✨ *¡Ya casi es tuya! Tu último paso es el más importante.* ✨\n\n"
-                     "Para darte atención prioritaria, responde este chat con la **captura de tu pago**.\n\n"
-                     "¡Estaremos atentos para enviarte tu clave al instante! La necesitarás junto a tu DNI para recibir tu joya. 🎁")
-        send_text_message(str(to_number), message_3)
+        customer_name = get_customer_names([str(to_number)]).get(str(to_number)) or "cliente"
+        with outbound_turn():
+            for delay, text in tracking_messages(customer_name, nro_orden, codigo_recojo):
+                send_text_message(str(to_number), text, delay=delay)
+        flush_outbound()
 
         return jsonify({'status': 'mensajes enviados'}), 200
     except Exception as e:
         logger.error(f"Error crítico en send_tracking_code: {e}")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
+@app.route('/api/send-tracking/bulk', methods=['POST'])
+def send_tracking_bulk():
+    # Lista de {to_number, nro_orden, codigo_recojo}: envía la primera tanda dentro del request
+    # y responde con un job_id; cada consulta a /bulk/<job_id> envía la siguiente (ver bot_tracking).
+    if not is_authorized('/api/send-tracking/bulk'):
+        return jsonify({'error': 'No autorizado'}), 401
+
+    data = request.get_json(silent=True) or {}
+    records = data.get('pedidos') if isinstance(data, dict) else data
+    if not isinstance(records, list) or not records or not all(isinstance(r, dict) for r in records):
+        return jsonify({'error': 'Se espera una lista de pedidos {to_number, nro_orden, codigo_recojo}'}), 400
+    if len(records) > TRACKING_BULK_MAX:
+        return jsonify({'error': f'Máximo {TRACKING_BULK_MAX} pedidos por solicitud'}), 413
+
+    try:
+        job = tracking_jobs.start(records)
+        return jsonify(job.summary()), 202
+    except Exception as e:
+        logger.error(f"Error crítico en send_tracking_bulk: {e}")
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
+@app.route('/api/send-tracking/bulk/<job_id>', methods=['GET'])
+def send_tracking_bulk_status(job_id):
+    # Make.com consulta hasta `terminado`: cada consulta avanza el trabajo donde quedó.
+    if not is_authorized('/api/send-tracking/bulk'):
+        return jsonify({'error': 'No autorizado'}), 401
+    if (summary := tracking_jobs.get(job_id)) is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(summary), 200
+
+@app.route('/api/admin/ventas', methods=['GET'])
+def admin_sales():
+    # ?estado_pedido=&tipo_envio=&cliente_id=&desde=YYYY-MM-DD&hasta=YYYY-MM-DD&limit=&cursor=
+    # La primera página incluye el resumen del rango, leído de los agregados (sin recorrer `ventas`).
+    if not is_authorized('/api/admin/ventas'):
+        return jsonify({'error': 'No autorizado'}), 401
+
+    args = request.args
+    filters = {field: args.get(field) for field in SALE_FILTERS if args.get(field)}
+    try:
+        page = list_sales(filters, args.get('desde'), args.get('hasta'), args.get('limit', type=int), args.get('cursor'))
+        if page is None:
+            return jsonify({'error': 'Base de datos no disponible'}), 503
+        if not args.get('cursor'):
+            page['resumen'] = read_aggregates(*summary_range(args.get('desde'), args.get('hasta')))
+        return jsonify(page), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error crítico en admin_sales: {e}")
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
+@app.route('/api/admin/ventas/agregados', methods=['POST'])
+def backfill_sales_aggregates():
+    # Una vez tras desplegar los agregados (repetir hasta `completo`): cuenta las ventas anteriores.
+    if not is_authorized('/api/admin/ventas/agregados'):
+        return jsonify({'error': 'No autorizado'}), 401
+    try:
+        report = backfill_aggregates()
+        if report is None:
+            return jsonify({'error': 'Base de datos no disponible'}), 503
+        return jsonify(report), 200
+    except Exception as e:
+        logger.error(f"Error crítico en backfill_sales_aggregates: {e}")
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
+@app.route('/api/admin/sesiones/limpiar', methods=['POST'])
+def sweep_sessions():
+    # Para un cron: borra sesiones abandonadas y, con ?sellar=1, sella las anteriores a `ultima_actividad`.
+    if not is_authorized('/api/admin/sesiones/limpiar'):
+        return jsonify({'error': 'No autorizado'}), 401
+    try:
+        report = sweeper.sweep(stamp_legacy=request.args.get('sellar') == '1')
+        if report is None:
+            return jsonify({'error': 'Base de datos no disponible'}), 503
+        return jsonify(report), 409 if 'error' in report else 200
+    except Exception as e:
+        logger.error(f"Error crítico en sweep_sessions: {e}")
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
+@app.route('/api/admin/sheets/exportar', methods=['POST'])
+def export_orders():
+    # Para un cron: exporta a Sheets las ventas que quedaron con `exportado: False`.
+    if not is_authorized('/api/admin/sheets/exportar'):
+        return jsonify({'error': 'No autorizado'}), 401
+    try:
+        recovered = order_exporter.recover(request.args.get('limit', type=int) or SHEETS_RECOVER_LIMIT)
+        exported = order_exporter.flush()
+        return jsonify({'recuperados': recovered, 'exportado': exported, 'pendientes': order_exporter.pending()}), \
+            200 if exported else 502
+    except Exception as e:
+        logger.error(f"Error crítico en export_orders: {e}")
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    if not is_authorized('/api/metrics'):
+        return jsonify({'error': 'No autorizado'}), 401
+    if not metrics.enabled:
+        return jsonify({'error': 'Métricas deshabilitadas (METRICS_ENABLED=0)'}), 404
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.route('/')
 def home():
-    return jsonify({'status': 'Bot Daaqui Activo - V10.2 - DEBUG DETALLADO'})
\ No newline at end of file
+    return jsonify({'status': 'Bot Daaqui Activo - V10.2 - DEBUG DETALLADO'})
+
+startup_profile.log_imports()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - AGREGADOS DE VENTAS Y /api/admin/ventas
+# Registra ventas con el checkout real contra el Firestore falso (más unas
+# anteriores a los agregados), cierra algunas, corre el backfill y compara
+# los agregados (sumando shards) con un recorrido completo de `ventas`. Luego pagina la lista con cursor y verifica que no se repiten
+# ni se pierden ventas, contando las lecturas por página.
+#
+# Uso: python benchmarks/bench_admin_sales.py --sales 500 --page 50
+# ==========================================================
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from fake_firestore import FakeFirestore, install
+
+SHIPPING = ("Lima Contra Entrega", "Provincia Shalom")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sales', type=int, default=500)
+    parser.add_argument('--page', type=int, default=50)
+    parser.add_argument('--legacy', type=int, default=100, help="Ventas anteriores a los agregados")
+    args = parser.parse_args()
+
+    fake = install(FakeFirestore())
+    import bot_utils
+    from bot_reports import list_sales, read_aggregates, today, backfill_aggregates
+
+    rng = random.Random(7)
+    customers = []
+    # Ventas guardadas antes de los agregados: sin `en_agregados`, nunca sumaron.
+    for i in range(args.legacy):
+        wa_id, sale_id = f"51800{i:06d}", f"legado-{i:06d}"
+        fake.data[f"ventas/{sale_id}"] = {
+            "id_venta": sale_id, "cliente_id": wa_id, "estado_pedido": "Adelanto Pagado", "tipo_envio": SHIPPING[1],
+            "precio_venta": 69.0, "adelanto_recibido": 20.0, "saldo_restante": 49.0, "fecha": datetime.now(timezone.utc)}
+        fake.data[f"clientes/{wa_id}"] = {"nombre_perfil_wa": f"Cliente {i}", "pedido_abierto": sale_id}
+        customers.append(wa_id)
+    for i in range(args.sales):
+        wa_id = f"51900{i:06d}"
+        tipo = rng.choice(SHIPPING)
+        ok, _ = bot_utils.save_completed_sale_and_customer({
+            "whatsapp_id": wa_id, "user_name": f"Cliente {i}", "product_id": "collar-girasol-radiant-01",
+            "product_name": "Collar Mágico Girasol Radiant", "product_price": 69.0,
+            "adelanto": 10.0 if tipo == SHIPPING[0] else 20.0, "tipo_envio": tipo})
+        assert ok
+        customers.append(wa_id)
+    for wa_id in rng.sample(customers, args.sales // 3):
+        bot_utils.close_open_order(wa_id, rng.choice(("Completado", "Cancelado")))
+    # Los cierres de ventas no contadas no restan: el saldo pendiente nunca queda negativo.
+    assert read_aggregates(today(), today())["totales"]["saldo_pendiente"] >= 0
+    backfill = backfill_aggregates(page_size=40)
+    assert backfill["completo"] and backfill["agregadas"] == args.legacy, backfill
+    assert backfill_aggregates()["agregadas"] == 0
+
+    # Agregados frente a un recorrido completo de `ventas`.
+    fake.reset_stats()
+    t0 = time.perf_counter()
+    summary = read_aggregates(today(), today())
+    aggregate_ms = (time.perf_counter() - t0) * 1000
+    aggregate_reads = fake.stats['round_trips']
+    sales = [doc.to_dict() for doc in fake.collection('ventas').get()]
+    expected_pending = sum(s['saldo_restante'] for s in sales if s['estado_pedido'] == "Adelanto Pagado")
+    totals = summary["totales"]
+    assert totals["ventas"] == len(sales) == summary["por_dia"][0]["ventas"]
+    assert abs(totals["saldo_pendiente"] - expected_pending) < 1e-6, (totals["saldo_pendiente"], expected_pending)
+    for status in ("Adelanto Pagado", "Completado", "Cancelado"):
+        key = f"estado_{status.lower().replace(' ', '_')}"
+        assert totals.get(key, 0) == sum(s['estado_pedido'] == status for s in sales), key
+        assert summary["por_dia"][0].get(key, 0) == totals.get(key, 0), f"{key} por día"
+    shards = sum(1 for path in fake.data if path.startswith('agregados_ventas/'))
+
+    # Paginación por cursor.
+    fake.reset_stats()
+    seen, pages, cursor = [], 0, None
+    while True:
+        page = list_sales({"tipo_envio": SHIPPING[1]}, limit=args.page, cursor=cursor)
+        seen += [sale["id_venta"] for sale in page["ventas"]]
+        pages += 1
+        if not (cursor := page["siguiente"]):
+            break
+    expected_ids = {s['id_venta'] for s in sales if s['tipo_envio'] == SHIPPING[1]}
+    assert len(seen) == len(set(seen)) and set(seen) == expected_ids
+
+    print(f"Ventas: {len(sales)} ({args.legacy} anteriores, contadas por el backfill), "
+          f"documentos de agregados (shards): {shards}")
+    print(f"Resumen desde agregados: {aggregate_reads} lecturas, {aggregate_ms:.1f} ms "
+          f"(saldo pendiente S/ {totals['saldo_pendiente']:.2f}, coincide con el recorrido de {len(sales)} ventas)")
+    print(f"Paginación '{SHIPPING[1]}': {len(seen)} ventas en {pages} páginas, "
+          f"{fake.stats['round_trips']} consultas (una por página), sin repetidos ni faltantes")
+
+
+if __name__ == '__main__':
+    main()
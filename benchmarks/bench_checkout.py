@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - CAMINO DE ESCRITURA DEL CHECKOUT
+# Verifica contra el Firestore falso que la venta, el cliente, el marcador
+# de pedido abierto y el borrado de la sesión van en un solo commit
+# (un round-trip) y que un fallo no deja escrituras a medias.
+#
+# Uso: python benchmarks/bench_checkout.py --latency-ms 40
+# ==========================================================
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from fake_firestore import FakeFirestore, install
+
+SESSION = {"state": "awaiting_shalom_payment", "product_id": "collar-girasol-radiant-01",
+           "product_name": "Collar Mágico Girasol Radiant", "product_price": 69.0, "adelanto": 20.0,
+           "user_name": "Ana", "whatsapp_id": "51900000001", "tipo_envio": "Provincia Shalom",
+           "metodo_pago": "Adelanto y Saldo (Yape/Plin)", "provincia": "Arequipa", "distrito": "Arequipa",
+           "detalles_cliente": "Ana Pérez, 12345678, Agencia Shalom Av. Ejército"}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency-ms', type=float, default=40.0)
+    args = parser.parse_args()
+
+    fake = install(FakeFirestore(latency_s=args.latency_ms / 1000))
+    import bot_utils
+
+    wa_id = SESSION["whatsapp_id"]
+    fake.data[f"sessions/{wa_id}"] = dict(SESSION)
+    fake.reset_stats()
+    t0 = time.perf_counter()
+    ok, sale = bot_utils.save_completed_sale_and_customer(dict(SESSION))
+    elapsed = time.perf_counter() - t0
+    assert ok, "la venta debió guardarse"
+    assert f"ventas/{sale['id_venta']}" in fake.data and f"sessions/{wa_id}" not in fake.data
+    assert fake.data[f"clientes/{wa_id}"]["pedido_abierto"] == sale["id_venta"]
+    print(f"Checkout correcto: {fake.stats['round_trips']} round-trip(s), {fake.ops}, {elapsed * 1000:.1f} ms")
+
+    # Fallo en el commit: no debe quedar ni la venta ni el cliente, y la sesión sigue viva.
+    fake.data = {f"sessions/{wa_id}": dict(SESSION)}
+    bot_utils.session_store.forget(wa_id)
+    fake.fail_next = 1
+    ok, _ = bot_utils.save_completed_sale_and_customer(dict(SESSION))
+    assert not ok
+    assert list(fake.data) == [f"sessions/{wa_id}"], fake.data
+    assert bot_utils.get_session(wa_id) is not None
+    print("Checkout con fallo: sin escrituras parciales, la sesión se conserva.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - BENCHMARK DE ARRANQUE EN FRÍO
+# Importa api/index.py en procesos nuevos (como un arranque en frío de Vercel),
+# atiende GET / y la verificación del webhook, y compara el tiempo de
+# importación con COLD_START_BUDGET_MS. Sale con código 1 si se excede.
+#
+# Uso: python benchmarks/bench_cold_start.py --runs 5
+# ==========================================================
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api')
+PROBE = r'''
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+import index
+from bot_startup import startup_profile
+client = index.app.test_client()
+t0 = time.perf_counter(); client.get('/'); home_ms = (time.perf_counter() - t0) * 1000
+t0 = time.perf_counter()
+client.get('/api/webhook?hub.mode=subscribe&hub.verify_token=' + index.VERIFY_TOKEN + '&hub.challenge=1')
+verify_ms = (time.perf_counter() - t0) * 1000
+heavy = [m for m in ('firebase_admin', 'gspread', 'requests', 'google.cloud.firestore') if m in sys.modules]
+print(json.dumps({"perfil": startup_profile.report(), "home_ms": home_ms, "verify_ms": verify_ms, "modulos_pesados": heavy}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    env = dict(os.environ, FIREBASE_SERVICE_ACCOUNT_JSON=os.environ.get('FIREBASE_SERVICE_ACCOUNT_JSON', '{}'))
+    results = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, '-c', PROBE, API_DIR], capture_output=True, text=True, env=env, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    imports = [r["perfil"]["importacion_ms"] for r in results]
+    budget = results[0]["perfil"]["presupuesto_ms"]
+    print(f"Importación de index.py: mediana {statistics.median(imports):.1f} ms, máx {max(imports):.1f} ms (presupuesto {budget:.0f} ms)")
+    print(f"Componentes (última corrida): {results[-1]['perfil']['componentes_ms']}")
+    print(f"GET / : {statistics.median(r['home_ms'] for r in results):.2f} ms   "
+          f"verificación webhook: {statistics.median(r['verify_ms'] for r in results):.2f} ms")
+    print(f"Módulos pesados cargados sin usar la base: {results[-1]['modulos_pesados'] or 'ninguno'}")
+    sys.exit(0 if statistics.median(imports) <= budget else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - BENCHMARK DEL DESPACHO CONCURRENTE DEL WEBHOOK
+# Payloads sintéticos con mensajes de varios clientes; cada mensaje simula
+# la E/S de process_message (lecturas de Firestore + POST a la Graph API).
+# Compara el recorrido en serie con WebhookDispatcher y verifica el orden
+# por cliente.
+#
+# Uso: python benchmarks/bench_dispatch.py --users 10 --per-user 3 --io-ms 40
+# ==========================================================
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from bot_dispatch import WebhookDispatcher
+
+
+def build_payload(users, per_user, shuffle_seed=7):
+    # Los mensajes de los clientes llegan intercalados, como en un lote real de Meta.
+    messages = [{"from": f"51900{u:06d}", "id": f"wamid.{u}.{n}", "type": "text", "text": {"body": f"mensaje {n}"}}
+                for u in range(users) for n in range(per_user)]
+    rng = random.Random(shuffle_seed)
+    rng.shuffle(messages)
+    per_sender = {}
+    for m in messages:
+        # Se renumera en el orden de llegada para poder verificarlo después.
+        n = per_sender.get(m["from"], 0)
+        m["text"]["body"], per_sender[m["from"]] = f"mensaje {n}", n + 1
+    contacts = [{"wa_id": f"51900{u:06d}", "profile": {"name": f"Cliente {u}"}} for u in range(users)]
+    return {"object": "whatsapp_business_account",
+            "entry": [{"changes": [{"field": "messages", "value": {"contacts": contacts, "messages": messages}}]}]}
+
+
+def make_handler(io_s, calls_per_message):
+    seen, lock = {}, threading.Lock()
+
+    def handler(message, contacts):
+        for _ in range(calls_per_message):
+            time.sleep(io_s)
+        with lock:
+            seen.setdefault(message["from"], []).append(message["text"]["body"])
+    return handler, seen
+
+
+def serial(payload, handler):
+    for entry in payload.get('entry', []):
+        for change in entry.get('changes', []):
+            value = change.get('value', {})
+            for message in value.get('messages') or []:
+                handler(message, value.get('contacts', []))
+
+
+def out_of_order(seen):
+    return sum(bodies != [f"mensaje {n}" for n in range(len(bodies))] for bodies in seen.values())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--per-user', type=int, default=3)
+    parser.add_argument('--io-ms', type=float, default=40.0, help="Latencia de cada llamada simulada")
+    parser.add_argument('--calls', type=int, default=4, help="Llamadas de E/S por mensaje")
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+    payload = build_payload(args.users, args.per_user)
+    total = args.users * args.per_user
+
+    handler, seen_serial = make_handler(args.io_ms / 1000, args.calls)
+    t0 = time.perf_counter()
+    serial(payload, handler)
+    serial_s = time.perf_counter() - t0
+
+    handler, seen = make_handler(args.io_ms / 1000, args.calls)
+    dispatcher = WebhookDispatcher(handler, workers=args.workers)
+    t0 = time.perf_counter()
+    dispatcher.dispatch(payload)
+    concurrent_s = time.perf_counter() - t0
+
+    print(f"{total} mensajes de {args.users} clientes, {args.calls} llamadas de {args.io_ms:.0f} ms por mensaje")
+    print(f"Serie:        {serial_s * 1000:8.1f} ms")
+    print(f"Concurrente:  {concurrent_s * 1000:8.1f} ms  ({args.workers} workers, x{serial_s / concurrent_s:.1f})")
+    print(f"Mensajes procesados: {sum(len(v) for v in seen.values())} / {total}; "
+          f"clientes fuera de orden: {out_of_order(seen)} (serie: {out_of_order(seen_serial)})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - MICRO-BENCHMARK DE RESOLUCIÓN DE DISTRITOS
+# Compara la función anterior (regex sin compilar + recorridos lineales)
+# con DistrictResolver sobre un corpus de respuestas típicas de clientes.
+#
+# Uso: python benchmarks/bench_districts.py --rounds 200
+# ==========================================================
+import os
+import re
+import sys
+import timeit
+import argparse
+import unicodedata
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from bot_districts import DistrictResolver
+
+COBERTURA = ["Ate", "Barranco", "Breña", "Chorrillos", "Jesús María", "La Molina", "La Victoria", "Lince",
+             "Los Olivos", "Magdalena del Mar", "Miraflores", "Pueblo Libre", "San Borja", "San Isidro",
+             "San Juan de Lurigancho", "San Juan de Miraflores", "San Luis", "San Martín de Porres",
+             "San Miguel", "Santiago de Surco", "Surquillo", "Villa El Salvador", "Villa María del Triunfo",
+             "Cercado de Lima", "Comas", "Independencia", "El Agustino", "Rímac"]
+TOTALES = COBERTURA + ["Ancón", "Carabayllo", "Chaclacayo", "Cieneguilla", "Lurigancho", "Lurín",
+                       "Pachacámac", "Pucusana", "Puente Piedra", "Punta Hermosa", "Punta Negra",
+                       "San Bartolo", "Santa María del Mar", "Santa Rosa", "Santa Anita"]
+BUSINESS_RULES = {
+    "distritos_cobertura_delivery": [d.lower() for d in COBERTURA],
+    "distritos_lima_total": [d.lower() for d in TOTALES],
+    "abreviaturas_distritos": {"sjl": "San Juan de Lurigancho", "sjm": "San Juan de Miraflores",
+                               "smp": "San Martín de Porres", "vmt": "Villa María del Triunfo",
+                               "ves": "Villa El Salvador", "surco": "Santiago de Surco"},
+}
+CORPUS = ["Miraflores", "miraflores", "soy de surco", "vivo en SJL", "estoy en san juan de lurigancho",
+          "Jesus Maria", "jesús maría", "breña", "Brena", "la molina", "Los olivos!!", "smp",
+          "vivo en puente piedra", "Lurín", "es en pachacamac", "santa anita", "independencia",
+          "magdalena del mar", "Magdalena", "villa el salvador", "ves", "vmt", "chorrillos por favor",
+          "san isidro", "San Borja", "surquillo", "carabayllo", "comas", "Callao", "no sé", "lima",
+          "San Miguel", "Rimac", "El Agustino", "cercado", "punta hermosa", "ate vitarte", "lince"]
+
+
+def strip_accents(text):
+    return ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
+
+def legacy_normalize_and_check_district(text, BUSINESS_RULES):
+    clean_text = re.sub(r'soy de|vivo en|estoy en|es en|de', '', text, flags=re.IGNORECASE).strip()
+    normalized_input = strip_accents(clean_text.lower())
+    abreviaturas = BUSINESS_RULES.get('abreviaturas_distritos', {})
+    for abbr, full_name in abreviaturas.items():
+        if abbr in normalized_input:
+            normalized_input = strip_accents(full_name.lower())
+            break
+    for distrito in BUSINESS_RULES.get('distritos_cobertura_delivery', []):
+        if normalized_input in strip_accents(distrito.lower()):
+            return distrito.title(), 'CON_COBERTURA'
+    for distrito in BUSINESS_RULES.get('distritos_lima_total', []):
+        if normalized_input in strip_accents(distrito.lower()):
+            return distrito.title(), 'SIN_COBERTURA'
+    return None, 'NO_ENCONTRADO'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    resolver = DistrictResolver(BUSINESS_RULES)
+    legacy = timeit.timeit(lambda: [legacy_normalize_and_check_district(t, BUSINESS_RULES) for t in CORPUS], number=args.rounds)
+    new = timeit.timeit(lambda: [resolver.resolve(t) for t in CORPUS], number=args.rounds)
+    build = timeit.timeit(lambda: DistrictResolver(BUSINESS_RULES), number=20) / 20
+    calls = args.rounds * len(CORPUS)
+    print(f"Anterior:  {legacy / calls * 1e6:8.2f} µs/llamada")
+    print(f"Resolver:  {new / calls * 1e6:8.2f} µs/llamada  (x{legacy / new:.1f})")
+    print(f"Construcción del resolver: {build * 1e3:.2f} ms (una vez por versión de reglas)")
+    print("\nDiferencias de resultado (entrada: anterior -> nuevo):")
+    for text in CORPUS:
+        before, after = legacy_normalize_and_check_district(text, BUSINESS_RULES), resolver.resolve(text)
+        if before != after:
+            print(f"  {text!r}: {before} -> {after}")
+
+
+if __name__ == '__main__':
+    main()
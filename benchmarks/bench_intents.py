@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - BENCHMARK DEL CLASIFICADOR DE INTENCIONES
+# Compara los recorridos anteriores (cancelación + FAQ + palabras clave del
+# producto, con text.lower() repetido) contra una pasada de IntentClassifier.
+#
+# Uso: python benchmarks/bench_intents.py --rounds 500
+# ==========================================================
+import os
+import sys
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from bot_intents import IntentClassifier
+
+# Copia de las constantes de api/index.py (importarlo inicializaría Firebase).
+KEYWORDS_GIRASOL = ["girasol", "radiant", "precio", "cambia de color"]
+PALABRAS_CANCELACION = ["cancelar", "cancelo", "ya no quiero", "ya no", "mejor no", "detener", "no gracias"]
+FAQ_KEYWORD_MAP = {
+    'precio': ['precio', 'valor', 'costo'], 'envio': ['envío', 'envio', 'delivery', 'mandan', 'entrega'],
+    'pago': ['pago', 'pagar', 'métodos de pago', 'contraentrega', 'yape', 'plin'], 'tienda': ['tienda', 'local', 'ubicación'],
+    'transferencia': ['transferencia', 'banco', 'bcp', 'interbank', 'cuenta'], 'material': ['material', 'acero', 'alergia'],
+    'cuidados': ['mojar', 'agua', 'oxida', 'negro', 'cuidar'], 'garantia': ['garantía', 'garantia', 'falla', 'roto'],
+    'cambios_devoluciones': ['cambio', 'cambiar', 'devolución'], 'stock': ['stock', 'disponible', 'tienen', 'hay']
+}
+CORPUS = ["Hola, quisiera info del collar girasol", "cuál es el precio?", "Sí", "no", "para regalo",
+          "para mí", "Lima", "provincia", "Miraflores", "Arequipa, Arequipa",
+          "Ana Pérez, Jr. Gamarra 123, La Victoria. Al lado de la farmacia", "¿Hacen envíos a Cusco?",
+          "aceptan yape?", "se oxida con el agua?", "ya no quiero, gracias", "cancelar", "oferta",
+          "continuar", "tienen tienda física?", "el material es acero?", "Buenas tardes 😊",
+          "ok, perfecto, ya realicé el pago por plin", "me pueden mandar por shalom?",
+          "quiero el collar que cambia de color", "ya nos vemos mañana", "ENVIO GRATIS?"]
+
+
+def legacy_scan(text):
+    # Las pasadas que hacía un mensaje de texto en process_message + handle_sales_flow.
+    cancel = any(p in text.lower() for p in PALABRAS_CANCELACION)
+    faq = None
+    text_lower = text.lower()
+    for key, keywords in FAQ_KEYWORD_MAP.items():
+        if any(k in text_lower for k in keywords):
+            faq = key
+            break
+    product = any(k in text.lower() for k in KEYWORDS_GIRASOL)
+    product = product or any(k in text.lower() for k in KEYWORDS_GIRASOL)
+    return cancel, faq, product
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, default=500)
+    args = parser.parse_args()
+
+    classifier = IntentClassifier(FAQ_KEYWORD_MAP, PALABRAS_CANCELACION,
+                                  [(kw, 'collar-girasol-radiant-01') for kw in KEYWORDS_GIRASOL])
+    legacy = timeit.timeit(lambda: [legacy_scan(t) for t in CORPUS], number=args.rounds)
+    new = timeit.timeit(lambda: [classifier.classify(t) for t in CORPUS], number=args.rounds)
+    calls = args.rounds * len(CORPUS)
+    print(f"Recorridos anteriores: {legacy / calls * 1e6:7.2f} µs/mensaje")
+    print(f"Clasificador:          {new / calls * 1e6:7.2f} µs/mensaje  (x{legacy / new:.2f})")
+    print("\nDiferencias (texto: anterior -> nuevo como (cancelación, primera FAQ, producto)):")
+    for text in CORPUS:
+        intents = classifier.classify(text)
+        after = (intents.cancelacion, intents.faq[0] if intents.faq else None, bool(intents.product_id))
+        if (before := legacy_scan(text)) != after:
+            print(f"  {text!r}: {before} -> {after}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - BENCHMARK DE COMPROBANTES (MEDIOS)
+# Corre el pipeline de comprobantes contra la Graph API simulada (media ID ->
+# URL -> descarga por bloques) y el Firestore falso:
+#   - comprobantes distintos se registran, el mismo archivo reenviado o
+#     reutilizado por otro cliente se marca como repetido,
+#   - un archivo grande se descarga sin pasar de unos pocos bloques en memoria,
+#   - un medio inexistente no rompe el flujo (queda sin verificar).
+#
+# Uso: python benchmarks/bench_media.py --receipts 50 --big-mb 12
+# ==========================================================
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from graph_api_stub import GraphAPIStub
+from fake_firestore import FakeFirestore, install
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--receipts', type=int, default=50)
+    parser.add_argument('--big-mb', type=float, default=12.0)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    stub = GraphAPIStub(latency_s=args.latency_ms / 1000).start()
+    os.environ.update({'WHATSAPP_ACCESS_TOKEN': 'bench', 'WHATSAPP_PHONE_NUMBER_ID': '1000',
+                       'WHATSAPP_GRAPH_API_URL': stub.base_url})
+    fake = install(FakeFirestore())
+    from bot_media import ReceiptPipeline
+
+    media_dir = tempfile.mkdtemp(prefix='bench-comprobantes-')
+    pipeline = ReceiptPipeline(media_dir=media_dir, async_mode=False,
+                               max_bytes=int((args.big_mb + 1) * 1024 * 1024))
+    try:
+        # 1. Comprobantes distintos.
+        receipts = [os.urandom(150 * 1024) for _ in range(args.receipts)]
+        t0 = time.perf_counter()
+        results = [pipeline.process(stub.add_media(content), f"51900{i:06d}", 'adelanto')
+                   for i, content in enumerate(receipts)]
+        elapsed = time.perf_counter() - t0
+        assert all(r.verified and r.duplicate_of is None for r in results), "ningún comprobante nuevo es repetido"
+
+        # 2. El mismo archivo reenviado por el cliente y reutilizado por otro (media IDs nuevos).
+        resent = pipeline.process(stub.add_media(receipts[0]), "51900000000", 'saldo')
+        reused = pipeline.process(stub.add_media(receipts[1]), "51999999999", 'adelanto')
+        assert resent.duplicate_of and resent.duplicate_of.get('cliente_id') == "51900000000"
+        assert reused.duplicate_of and reused.duplicate_of.get('cliente_id') == "51900000001"
+
+        # 3. Memoria acotada con un archivo grande.
+        big = os.urandom(int(args.big_mb * 1024 * 1024))
+        big_id = stub.add_media(big)
+        tracemalloc.start()
+        big_result = pipeline.process(big_id, "51900000099", 'saldo')
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del big
+        assert big_result.verified and big_result.size == int(args.big_mb * 1024 * 1024)
+
+        # 4. Medio inexistente: falla abierto.
+        missing = pipeline.process("no-existe", "51900000098", 'adelanto')
+        assert not missing.verified
+    finally:
+        stub.stop()
+        shutil.rmtree(media_dir, ignore_errors=True)
+
+    print(f"Comprobantes distintos: {args.receipts} en {elapsed * 1000:.0f} ms "
+          f"({elapsed * 1000 / args.receipts:.1f} ms c/u, latencia simulada {args.latency_ms:.0f} ms)")
+    print(f"Repetidos detectados: reenvío={bool(resent.duplicate_of)} reutilizado={bool(reused.duplicate_of)}")
+    print(f"Archivo de {args.big_mb:.0f} MB: pico de memoria {peak / 1024:.0f} KB "
+          f"(bloque de {pipeline.chunk_bytes // 1024} KB)")
+    print(f"Medio inexistente: verificado={missing.verified} ({missing.error[:60]})")
+    print(f"Descargas en el simulador: {stub.media_downloads}, documentos en comprobantes: "
+          f"{sum(1 for path in fake.data if path.startswith('comprobantes/'))}")
+    print(f"Stats: {pipeline.stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - BENCHMARK DEL PROGRAMADOR DE MENSAJES SALIENTES
+# Mide cuánto tarda un handler en "enviar" una secuencia (ahora solo encolar)
+# y el throughput de los workers contra la Graph API simulada.
+#
+# Uso: python benchmarks/bench_outbound.py --recipients 200 --latency-ms 80
+# ==========================================================
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from graph_api_stub import GraphAPIStub
+
+# Secuencia de /api/send-tracking: tres mensajes con pausas de 2 s.
+TRACKING_SEQUENCE = [(0, "Mensaje 1"), (2, "Mensaje 2"), (2, "Mensaje 3")]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--recipients', type=int, default=100)
+    parser.add_argument('--latency-ms', type=float, default=80.0)
+    parser.add_argument('--pause-scale', type=float, default=0.05,
+                        help="Factor aplicado a las pausas reales (1.0 = 2 s como en producción)")
+    args = parser.parse_args()
+
+    stub = GraphAPIStub(latency_s=args.latency_ms / 1000).start()
+    os.environ.update({'WHATSAPP_ACCESS_TOKEN': 'bench', 'WHATSAPP_PHONE_NUMBER_ID': '1000',
+                       'WHATSAPP_GRAPH_API_URL': stub.base_url})
+    import bot_utils
+    from bot_outbox import get_outbound_scheduler
+    from bot_whatsapp import get_whatsapp_client
+
+    handler_latencies = []
+    started = time.perf_counter()
+    for i in range(args.recipients):
+        to_number = f"51900{i:06d}"
+        t0 = time.perf_counter()
+        for delay, text in TRACKING_SEQUENCE:
+            bot_utils.send_text_message(to_number, text, delay=delay * args.pause_scale)
+        handler_latencies.append(time.perf_counter() - t0)
+    scheduler = get_outbound_scheduler(bot_utils.send_whatsapp_message)
+    scheduler.flush(timeout=600)
+    elapsed = time.perf_counter() - started
+
+    total = len(TRACKING_SEQUENCE) * args.recipients
+    out_of_order = 0
+    for i in range(args.recipients):
+        bodies = [m[2]['text']['body'] for m in stub.messages_for(f"51900{i:06d}")]
+        out_of_order += bodies != [text for _, text in TRACKING_SEQUENCE]
+    stub.stop()
+
+    handler_latencies.sort()
+    serial_estimate = args.recipients * (sum(d for d, _ in TRACKING_SEQUENCE) * args.pause_scale
+                                         + len(TRACKING_SEQUENCE) * args.latency_ms / 1000)
+    print(f"Mensajes recibidos por el simulador: {stub.count()} / {total}")
+    print(f"Secuencias fuera de orden: {out_of_order}")
+    print(f"Latencia del handler p50={statistics.median(handler_latencies) * 1000:.3f} ms "
+          f"p99={handler_latencies[int(len(handler_latencies) * 0.99) - 1] * 1000:.3f} ms")
+    print(f"Vaciado de la cola: {elapsed:.2f} s -> {total / elapsed:.1f} msg/s "
+          f"(estimado con sleeps en el request: {serial_estimate:.2f} s)")
+    print(f"Stats del programador: {scheduler.stats}")
+    print(f"Stats del cliente Graph API: {get_whatsapp_client().metrics()}")
+
+
+if __name__ == '__main__':
+    main()
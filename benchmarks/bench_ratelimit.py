@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - LÍMITE POR CLIENTE Y DESCARTE POR CARGA
+# Un cliente que pega muchos mensajes (o un bot que spamea) junto a clientes
+# normales, a través del despachador real:
+#   - cuántos turnos llegan a procesarse (cada uno = lecturas de Firestore y
+#     envíos) con y sin límite, en modo coalesce y drop,
+#   - que los clientes normales no se ven afectados,
+#   - que el techo global de mensajes en curso se respeta,
+#   - que los embudos completos de bench_webhook_load (con los valores por
+#     defecto) terminan en venta: ningún mensaje de una compra se limita.
+#
+# Uso: python benchmarks/bench_ratelimit.py --spam 200 --normal 30
+# ==========================================================
+import os
+import sys
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from bot_dispatch import WebhookDispatcher
+from bot_ratelimit import RateLimiter, USER_RATE_PER_MIN, USER_BURST, ENGAGED_TYPES
+from bench_webhook_load import SCENARIOS, webhook_payload
+
+SPAMMER = "51911111111"
+
+
+def payload(messages):
+    return {"object": "whatsapp_business_account", "entry": [{"changes": [{"field": "messages", "value": {
+        "contacts": [{"wa_id": m["from"], "profile": {"name": "Cliente"}} for m in messages], "messages": messages}}]}]}
+
+
+def text(wa_id, n):
+    return {"from": wa_id, "id": f"wamid.{wa_id}.{n}", "type": "text", "text": {"body": f"mensaje {n}"}}
+
+
+def run(mode, args, limited=True):
+    turns, notices, lock = {}, [], threading.Lock()
+    limiter = RateLimiter(rate_per_min=args.rate if limited else 0, burst=args.burst, mode=mode,
+                          max_inflight=args.inflight, wait_seconds=args.wait, notify_fn=notices.append)
+    active, peak = [0], [0]
+
+    def handler(message, names):
+        if (message := limiter.admit(message)) is None:
+            return
+        with limiter.inflight(message) as admitted:
+            if not admitted:
+                return
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+                turns.setdefault(message["from"], []).append(message["text"]["body"])
+            time.sleep(args.io_ms / 1000)
+            with lock:
+                active[0] -= 1
+
+    dispatcher = WebhookDispatcher(handler, workers=args.workers)
+    batches = []
+    for n in range(args.spam):
+        batch = [text(SPAMMER, n)]
+        if n < args.normal:
+            batch += [text(f"51900{u:06d}", n) for u in range(args.normal_users)]
+        batches.append(payload(batch))
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.posts) as posts:
+        list(posts.map(dispatcher.dispatch, batches))
+    elapsed = time.perf_counter() - t0
+    normal_turns = sum(len(v) for k, v in turns.items() if k != SPAMMER)
+    return {"spam_turns": len(turns.get(SPAMMER, [])), "normal_turns": normal_turns, "notices": len(notices),
+            "peak": peak[0], "elapsed": elapsed, "stats": dict(limiter.stats),
+            "spam_texts": sum(body.count("mensaje") for body in turns.get(SPAMMER, []))}
+
+
+def run_funnels(args, rate=USER_RATE_PER_MIN, burst=USER_BURST):
+    # Cada embudo se envía de corrido (peor caso: un cliente que responde al instante). La sesión
+    # existe desde el primer mensaje procesado, como en el bot.
+    engaged, processed, notices, blocked = set(), {}, [], [0]
+    limiter = RateLimiter(rate_per_min=rate, burst=burst, max_inflight=args.inflight, notify_fn=notices.append,
+                          engaged_fn=lambda wa_id: wa_id in engaged)
+    funnels = {}
+    for n in range(args.funnels):
+        scenario = ("embudo_lima", "embudo_provincia")[n % 2]
+        funnels[f"51930{n:06d}"] = SCENARIOS[scenario]
+
+    def handler(message, names):
+        if limiter.admit(message) is None:
+            blocked[0] += message["type"] in ENGAGED_TYPES
+            return
+        with limiter.inflight(message) as admitted:
+            if not admitted:
+                return False
+            engaged.add(message["from"])
+            processed[message["from"]] = processed.get(message["from"], 0) + 1
+
+    dispatcher = WebhookDispatcher(handler, workers=args.workers)
+    for wa_id, bodies in funnels.items():
+        for body in bodies:
+            dispatcher.dispatch(webhook_payload(wa_id, body))
+    completed = sum(1 for wa_id, bodies in funnels.items() if processed.get(wa_id) == len(bodies))
+    return completed, len(funnels), blocked[0], dict(limiter.stats)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--spam', type=int, default=200, help="Mensajes del cliente que spamea")
+    parser.add_argument('--normal', type=int, default=3, help="Mensajes de cada cliente normal")
+    parser.add_argument('--normal-users', type=int, default=30)
+    parser.add_argument('--rate', type=float, default=20.0, help="Mensajes por minuto por cliente")
+    parser.add_argument('--burst', type=float, default=8.0)
+    parser.add_argument('--inflight', type=int, default=16)
+    parser.add_argument('--wait', type=float, default=5.0)
+    parser.add_argument('--io-ms', type=float, default=20.0, help="Duración simulada de un turno")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--posts', type=int, default=16, help="POST concurrentes")
+    parser.add_argument('--funnels', type=int, default=20, help="Embudos completos a verificar")
+    args = parser.parse_args()
+
+    completed, total, blocked, stats = run_funnels(args)
+    assert completed == total and not blocked, (completed, total, stats)
+    print(f"   embudos: {completed}/{total} completos con USER_RATE_PER_MIN={USER_RATE_PER_MIN:g}, "
+          f"USER_BURST={USER_BURST:g} (limitados {stats['limitados']})")
+    # Aun con una ráfaga menor que el embudo, botones y comprobantes de una compra en curso pasan.
+    _, _, blocked, stats = run_funnels(args, burst=8)
+    assert not blocked, stats
+    print(f"  burst=8: botones/comprobantes limitados {blocked}, exentos {stats['exentos_compra']}; "
+          f"textos limitados {stats['limitados']} (agrupados {stats['agrupados']})")
+
+    expected_normal = args.normal * args.normal_users
+    for label, mode, limited in (("sin límite", 'drop', False), ("coalesce", 'coalesce', True), ("drop", 'drop', True)):
+        result = run(mode, args, limited)
+        assert result["normal_turns"] == expected_normal, result
+        assert result["peak"] <= args.inflight, result
+        print(f"{label:>10}: turnos del spammer {result['spam_turns']:4d} / {args.spam} "
+              f"(textos procesados {result['spam_texts']}), clientes normales {result['normal_turns']}/{expected_normal}, "
+              f"avisos {result['notices']}, en curso máx {result['peak']}/{args.inflight}, {result['elapsed'] * 1000:.0f} ms")
+        stats = result["stats"]
+        print(f"{'':>10}  limitados {stats['limitados']}, agrupados {stats['agrupados']}, "
+              f"descartados {stats['descartados']}, descartados por carga {stats['descartados_carga']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - EXPIRACIÓN Y LIMPIEZA DE SESIONES
+# Llena `sessions` en el Firestore falso con conversaciones activas,
+# abandonadas y anteriores al sello `ultima_actividad`, y verifica:
+#   - que una sesión abandonada expira al leerla (el cliente empieza de cero),
+#   - que el barrido borra solo las abandonadas, en commits por página,
+#   - el tamaño de la colección antes y después.
+#
+# Uso: python benchmarks/bench_sessions.py --sessions 5000 --abandoned 0.7
+# ==========================================================
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from fake_firestore import FakeFirestore, install
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=5000)
+    parser.add_argument('--abandoned', type=float, default=0.7, help="Fracción de sesiones abandonadas")
+    parser.add_argument('--legacy', type=float, default=0.1, help="Fracción de sesiones sin sello")
+    parser.add_argument('--batch', type=int, default=200)
+    args = parser.parse_args()
+
+    fake = install(FakeFirestore())
+    import bot_utils
+    from bot_sweeper import SessionSweeper
+
+    now = datetime.now(timezone.utc)
+    idle = timedelta(seconds=bot_utils.SESSION_IDLE_TTL)
+    rng = random.Random(3)
+    kinds = {"activa": [], "abandonada": [], "sin_sello": []}
+    for i in range(args.sessions):
+        wa_id = f"51900{i:06d}"
+        session = {"state": "awaiting_purchase_decision", "product_id": "collar-girasol-radiant-01"}
+        roll = rng.random()
+        if roll < args.legacy:
+            kinds["sin_sello"].append(wa_id)
+        elif roll < args.legacy + args.abandoned:
+            session[bot_utils.ACTIVITY_FIELD] = now - idle - timedelta(hours=rng.randint(1, 24 * 60))
+            kinds["abandonada"].append(wa_id)
+        else:
+            session[bot_utils.ACTIVITY_FIELD] = now - timedelta(minutes=rng.randint(0, 600))
+            kinds["activa"].append(wa_id)
+        fake.data[f"sessions/{wa_id}"] = session
+
+    # Expiración al leer: un cliente que vuelve tras abandonar no queda atrapado en el embudo viejo.
+    returning = kinds["abandonada"][0]
+    assert bot_utils.get_session(returning) is None
+    bot_utils.flush_session(returning)
+    assert f"sessions/{returning}" not in fake.data
+    active = kinds["activa"][0]
+    assert bot_utils.get_session(active) is not None
+
+    fake.reset_stats()
+    sweeper = SessionSweeper(batch_size=args.batch, max_seconds=600)
+    t0 = time.perf_counter()
+    report = sweeper.sweep(stamp_legacy=True)
+    elapsed = time.perf_counter() - t0
+
+    remaining = {path.split('/', 1)[1] for path in fake.data if path.startswith('sessions/')}
+    assert remaining == set(kinds["activa"]) | set(kinds["sin_sello"]), "solo deben quedar activas y sin sello"
+    assert all(isinstance(fake.data[f"sessions/{wa_id}"].get(bot_utils.ACTIVITY_FIELD), datetime)
+               for wa_id in kinds["sin_sello"])
+    assert report["antes"] == args.sessions - 1 and report["despues"] == len(remaining)
+
+    print(f"Sesiones: {args.sessions} ({len(kinds['activa'])} activas, {len(kinds['abandonada'])} abandonadas, "
+          f"{len(kinds['sin_sello'])} sin sello)")
+    print(f"Expiración al leer: sesión abandonada de {returning} descartada y borrada en el flush")
+    print(f"Barrido: {report['antes']} -> {report['despues']} documentos, {report['borradas']} borradas, "
+          f"{report['selladas']} selladas en {elapsed * 1000:.0f} ms")
+    print(f"Round-trips: {fake.stats['round_trips']} {fake.ops} (lotes de {args.batch})")
+
+    # El hilo periódico ya no recorre la colección: el sellado se hizo una vez.
+    assert sweeper.legacy_done
+    fake.reset_stats()
+    again = sweeper.sweep(stamp_legacy=not sweeper.legacy_done)
+    assert again["selladas"] == 0 and fake.ops.get('query', 0) == 1
+    print(f"Barrido periódico siguiente: {fake.stats['round_trips']} round-trips {fake.ops}")
+
+
+if __name__ == '__main__':
+    main()
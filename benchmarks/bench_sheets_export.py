@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - EXPORTACIÓN DE PEDIDOS A SHEETS POR LOTES
+# Simula un pico de ventas contra FakeWorksheet: cuenta llamadas a la API,
+# tiempo en el camino de la venta y verifica que no se pierdan filas aunque
+# fallen los primeros envíos, ni cuando la instancia muere con el buffer lleno
+# (las ventas siguen con `exportado: False` y otra instancia las recupera).
+#
+# Uso: python benchmarks/bench_sheets_export.py --sales 200 --latency-ms 300 --fail 2
+# ==========================================================
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from fake_sheets import FakeWorksheet
+import bot_sheets
+from bot_storage import SQLiteStorage
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sales', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=300.0)
+    parser.add_argument('--fail', type=int, default=2, help="Escrituras iniciales que fallarán")
+    parser.add_argument('--batch-size', type=int, default=bot_sheets.SHEETS_BATCH_SIZE)
+    parser.add_argument('--max-wait', type=float, default=0.5)
+    args = parser.parse_args()
+
+    sheet = FakeWorksheet(latency_s=args.latency_ms / 1000, fail_next=args.fail)
+    exporter = bot_sheets.OrderExporter(worksheet_fn=lambda: sheet, batch_size=args.batch_size, max_wait=args.max_wait)
+    checkout_times = []
+    for i in range(args.sales):
+        t0 = time.perf_counter()
+        exporter.enqueue({"id_venta": f"venta-{i}", "producto_nombre": "Collar", "precio_venta": 69.0,
+                          "cliente_id": f"51900{i:06d}"})
+        checkout_times.append(time.perf_counter() - t0)
+
+    deadline = time.monotonic() + 120
+    while exporter.pending() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    exporter.flush()
+
+    exported = [row[1] for row in sheet.rows]
+    missing = {f"venta-{i}" for i in range(args.sales)} - set(exported)
+    print(f"Filas exportadas: {len(exported)} / {args.sales}  (perdidas: {len(missing)}, duplicadas: {len(exported) - len(set(exported))})")
+    print(f"Llamadas a la API: {sheet.calls}  (antes: {args.sales} append_row + {args.sales} autenticaciones)")
+    print(f"Tiempo en el camino de la venta: máx {max(checkout_times) * 1000:.3f} ms "
+          f"(antes ≈ {args.latency_ms:.0f} ms + autenticación por venta)")
+    print(f"Stats del exportador: {exporter.stats}")
+
+    # Instancia congelada con ventas en el buffer: solo queda lo guardado en el almacén.
+    storage = SQLiteStorage(':memory:')
+    for i in range(args.sales):
+        storage.complete_sale({"id_venta": f"perdida-{i}", "producto_nombre": "Collar", "precio_venta": 69.0,
+                               "cliente_id": f"51901{i:06d}", "exportado": False}, f"51901{i:06d}", {})
+    survivor = bot_sheets.OrderExporter(worksheet_fn=lambda: sheet, batch_size=args.batch_size,
+                                        storage_fn=lambda: storage)
+    recovered = survivor.recover(limit=args.sales)
+    survivor.flush()
+    exported = {row[1] for row in sheet.rows}
+    missing = {f"perdida-{i}" for i in range(args.sales)} - exported
+    assert not missing and not storage.pending_exports(args.sales) and survivor.recover() == 0
+    print(f"Recuperación tras perder el buffer: {recovered} ventas recuperadas, {len(missing)} perdidas, "
+          f"pendientes en el almacén: {len(storage.pending_exports(args.sales))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - CONVERSACIONES SIMULADAS POR ALMACÉN
+# Corre los escenarios de bench_webhook_load (embudos completos, FAQ,
+# cancelaciones) directamente sobre los handlers del bot, sin Flask ni
+# Graph API (los envíos de cada turno se agrupan y se descartan), con cada
+# adaptador de bot_storage: memory, sqlite (WAL) y el Firestore falso con
+# latencia. Reporta conversaciones y mensajes por segundo y verifica que las
+# ventas y los clientes quedaron guardados.
+#
+# Uso: python benchmarks/bench_storage.py --conversations 2000 --threads 8 --firestore-latency-ms 15
+# ==========================================================
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from bench_webhook_load import SCENARIOS, IMAGE, BUSINESS_RULES, FAQ_RESPONSES, PRODUCT_ID, seed as seed_firestore
+from fake_firestore import FakeFirestore, install
+from fake_sheets import FakeWorksheet
+
+# Los mismos parámetros que index.py (que no se importa para no depender de Flask).
+KEYWORDS_GIRASOL = ["girasol", "radiant", "precio", "cambia de color"]
+PALABRAS_CANCELACION = ["cancelar", "cancelo", "ya no quiero", "ya no", "mejor no", "detener", "no gracias"]
+FAQ_KEYWORD_MAP = {
+    'precio': ['precio', 'valor', 'costo'], 'envio': ['envío', 'envio', 'delivery', 'mandan', 'entrega'],
+    'pago': ['pago', 'pagar', 'métodos de pago', 'contraentrega', 'yape', 'plin'],
+    'material': ['material', 'acero', 'alergia'], 'stock': ['stock', 'disponible', 'tienen', 'hay'],
+}
+RECEIPT_STATES = ('awaiting_lima_payment', 'awaiting_shalom_payment')
+ADMIN_NUMBER = '51999000000'
+
+
+def make_turn(config_service):
+    import bot_utils
+    from bot_logic import handle_initial_message, handle_sales_flow
+    from bot_coalesce import coalescer
+
+    def turn(wa_id, body):
+        # Versión reducida de _process_message (index.py) para texto y comprobantes.
+        with coalescer.collect(lambda *args: None):
+            try:
+                config = config_service.get()
+                text = body[1] if isinstance(body, tuple) else body
+                if body is IMAGE:
+                    if (session := bot_utils.get_session(wa_id)) and session.get('state') in RECEIPT_STATES:
+                        handle_sales_flow(wa_id, "COMPROBANTE_RECIBIDO", session, FAQ_KEYWORD_MAP, config.faq_responses,
+                                          KEYWORDS_GIRASOL, config.business_rules, "10700761130", "Titular", ADMIN_NUMBER,
+                                          config=config)
+                    return
+                intents = bot_utils.classify_message(text, FAQ_KEYWORD_MAP, KEYWORDS_GIRASOL, config=config)
+                if intents.cancelacion:
+                    if bot_utils.get_session(wa_id):
+                        bot_utils.delete_session(wa_id)
+                    return
+                if not (session := bot_utils.get_session(wa_id)):
+                    handle_initial_message(wa_id, "Cliente", text, FAQ_KEYWORD_MAP, config.faq_responses,
+                                           KEYWORDS_GIRASOL, intents)
+                else:
+                    handle_sales_flow(wa_id, text, session, FAQ_KEYWORD_MAP, config.faq_responses, KEYWORDS_GIRASOL,
+                                      config.business_rules, "10700761130", "Titular", ADMIN_NUMBER, intents, config=config)
+            finally:
+                bot_utils.flush_session(wa_id)
+    return turn
+
+
+def reset_caches():
+    import bot_utils
+    from bot_catalog import catalog
+    bot_utils.session_store._entries.clear()
+    bot_utils._open_orders.clear()
+    catalog.invalidate()
+
+
+def run(backend, customers, args):
+    import bot_utils
+    import bot_storage
+    from bot_config import ConfigService
+
+    reset_caches()
+    fake = None
+    if backend == 'firestore':
+        bot_storage.override_storage(None)
+        fake = install(FakeFirestore(latency_s=args.firestore_latency_ms / 1000))
+        seed_firestore(fake, [])
+    else:
+        path = ':memory:' if backend == 'memory' else os.path.join(tempfile.mkdtemp(prefix='bench-storage-'), 'bot.sqlite3')
+        storage = bot_storage.SQLiteStorage(path)
+        storage.seed('configuracion', {"reglas_envio": BUSINESS_RULES, "respuestas_faq": FAQ_RESPONSES})
+        storage.seed('productos', {PRODUCT_ID: {
+            "activo": True, "nombre": "Collar Mágico Girasol Radiant", "precio_base": 69.0,
+            "descripcion_corta": "cambia de color con tu energía.",
+            "imagenes": {"principal": "https://example.com/girasol.jpg", "empaque": "https://example.com/caja.jpg",
+                         "upsell": "https://example.com/oferta.jpg"},
+            "detalles": {"material": "Acero quirúrgico", "empaque": "Caja de regalo"}}})
+        bot_storage.override_storage(storage)
+    turn = make_turn(ConfigService(FAQ_KEYWORD_MAP, PALABRAS_CANCELACION))
+
+    work, lock, messages = list(customers), threading.Lock(), [0]
+
+    def worker():
+        while True:
+            with lock:
+                if not work:
+                    return
+                wa_id, scenario = work.pop()
+            for body in SCENARIOS[scenario]:
+                turn(wa_id, body)
+            with lock:
+                messages[0] += len(SCENARIOS[scenario])
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    storage = bot_storage.get_storage()
+    funnels = [wa_id for wa_id, scenario in customers if scenario.startswith("embudo")]
+    sold = sum(1 for wa_id in funnels if (storage.get_customer(wa_id) or {}).get('pedido_abierto'))
+    left = sum(1 for wa_id, _ in customers if storage.get_session(wa_id) is not None)
+    return {"elapsed": elapsed, "messages": messages[0], "sold": sold, "funnels": len(funnels), "sessions_left": left}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--conversations', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--firestore-latency-ms', type=float, default=15.0)
+    parser.add_argument('--firestore-conversations', type=int, default=100,
+                        help="Conversaciones para el Firestore falso (con latencia es mucho más lento)")
+    parser.add_argument('--backends', default='memory,sqlite,firestore')
+    args = parser.parse_args()
+
+    import bot_sheets
+    bot_sheets._worksheet = FakeWorksheet()
+    scenarios = ["embudo_lima", "embudo_provincia", "faq", "cancelacion"]
+    rng = random.Random(5)
+    for backend in args.backends.split(','):
+        n = args.firestore_conversations if backend == 'firestore' else args.conversations
+        customers = [(f"5197{backend[0]}{i:06d}", rng.choice(scenarios)) for i in range(n)]
+        result = run(backend, customers, args)
+        assert result["sold"] == result["funnels"], result
+        print(f"{backend:>9}: {n} conversaciones, {result['messages']} mensajes en {result['elapsed']:.2f} s -> "
+              f"{n / result['elapsed']:8.1f} conv/s, {result['messages'] / result['elapsed']:8.1f} msg/s; "
+              f"ventas {result['sold']}/{result['funnels']}, sesiones abiertas {result['sessions_left']}")
+    bot_sheets.order_exporter.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - FILTRO RÁPIDO DEL WEBHOOK
+# Compara, sobre una mezcla realista de callbacks de estado (sent/delivered/
+# read) y mensajes, el camino anterior (json.loads de todo + recorrido de
+# entry/changes + búsqueda lineal del nombre en `contacts` por mensaje) con
+# dispatch_raw (filtro sobre los bytes, parser opcional, mapa wa_id -> nombre
+# por cambio). El handler no hace nada: se mide solo el costo del webhook.
+#
+# Uso: python benchmarks/bench_webhook_filter.py --payloads 20000 --status-ratio 0.85
+# ==========================================================
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from bot_dispatch import WebhookDispatcher, _loads
+
+
+def status_payload(rng, wa_id):
+    statuses = [{"id": f"wamid.{rng.getrandbits(64):x}", "status": rng.choice(("sent", "delivered", "read")),
+                 "timestamp": "1760000000", "recipient_id": wa_id,
+                 "conversation": {"id": f"{rng.getrandbits(64):x}", "origin": {"type": "service"}},
+                 "pricing": {"billable": True, "pricing_model": "CBP", "category": "service"}}
+                for _ in range(rng.randint(1, 3))]
+    return {"object": "whatsapp_business_account", "entry": [{"id": "1000", "changes": [{"field": "messages", "value": {
+        "messaging_product": "whatsapp", "metadata": {"display_phone_number": "51999999999", "phone_number_id": "1000"},
+        "statuses": statuses}}]}]}
+
+
+def message_payload(rng, senders):
+    contacts = [{"wa_id": wa_id, "profile": {"name": f"Cliente {wa_id[-4:]}"}} for wa_id in senders]
+    messages = [{"from": wa_id, "id": f"wamid.{rng.getrandbits(64):x}", "timestamp": "1760000000", "type": "text",
+                 "text": {"body": rng.choice(("hola", "precio del collar", "Sí", 'dice "messages": [1]'))}}
+                for wa_id in senders]
+    return {"object": "whatsapp_business_account", "entry": [{"id": "1000", "changes": [{"field": "messages", "value": {
+        "messaging_product": "whatsapp", "metadata": {"display_phone_number": "51999999999", "phone_number_id": "1000"},
+        "contacts": contacts, "messages": messages}}]}]}
+
+
+def build_mix(n, status_ratio, seed=11):
+    rng = random.Random(seed)
+    bodies, expected = [], 0
+    for _ in range(n):
+        if rng.random() < status_ratio:
+            bodies.append(json.dumps(status_payload(rng, f"51900{rng.randrange(10**6):06d}")).encode())
+        else:
+            senders = [f"51900{rng.randrange(10**6):06d}" for _ in range(rng.choice((1, 1, 1, 2, 4)))]
+            bodies.append(json.dumps(message_payload(rng, senders)).encode())
+            expected += len(senders)
+    return bodies, expected
+
+
+def previous_path(body, handler):
+    data = json.loads(body)
+    if data.get('object') == 'whatsapp_business_account':
+        for entry in data.get('entry', []):
+            for change in entry.get('changes', []):
+                if change.get('field') == 'messages' and (value := change.get('value', {})):
+                    contacts = value.get('contacts', [])
+                    for message in value.get('messages') or []:
+                        from_number = message.get('from')
+                        user_name = next((c.get('profile', {}).get('name', 'Usuario') for c in contacts
+                                          if c.get('wa_id') == from_number), 'Usuario')
+                        handler(message, user_name)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--payloads', type=int, default=20000)
+    parser.add_argument('--status-ratio', type=float, default=0.85)
+    args = parser.parse_args()
+    bodies, expected = build_mix(args.payloads, args.status_ratio)
+
+    seen_previous = []
+    t0 = time.perf_counter()
+    for body in bodies:
+        previous_path(body, lambda message, name: seen_previous.append((message['from'], name)))
+    previous_s = time.perf_counter() - t0
+
+    seen = []
+    dispatcher = WebhookDispatcher(lambda message, names: seen.append((message['from'], names.get(message['from']))),
+                                   workers=1)
+    t0 = time.perf_counter()
+    for body in bodies:
+        dispatcher.dispatch_raw(body)
+    filtered_s = time.perf_counter() - t0
+
+    assert len(seen) == len(seen_previous) == expected and sorted(seen) == sorted(seen_previous)
+    stats = dispatcher.acceptance()
+    parser_name = 'orjson' if _loads is not json.loads else 'json'
+    print(f"{args.payloads} payloads ({args.status_ratio:.0%} callbacks de estado), {expected} mensajes, parser: {parser_name}")
+    print(f"Anterior:      {previous_s * 1e6 / args.payloads:7.1f} µs/payload")
+    print(f"Filtro rápido: {filtered_s * 1e6 / args.payloads:7.1f} µs/payload  (x{previous_s / filtered_s:.1f})")
+    print(f"Aceptados {stats['aceptados']}, rechazados por estado {stats['rechazados_estado']}, "
+          f"otros {stats['rechazados_otros']}; tasa de aceptación {stats['tasa_aceptacion']:.1%}")
+
+
+if __name__ == '__main__':
+    main()
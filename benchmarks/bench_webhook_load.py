@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - PRUEBA DE CARGA DE EXTREMO A EXTREMO DE /api/webhook
+# Ejecuta la app Flask de api/index.py con payloads sintéticos de la
+# WhatsApp Cloud API: embudos completos ("collar girasol" -> comprobante),
+# consultas FAQ, cancelaciones y comprobantes de saldo. Graph API, Firestore
+# y Google Sheets se sustituyen por dobles locales con latencia configurable.
+#
+# Reporta throughput, latencia p50/p95/p99 del webhook y llamadas externas
+# por mensaje, y guarda los resultados en JSON para comparar entre versiones.
+#
+# Uso: python benchmarks/bench_webhook_load.py --customers 40 --rate 50 \
+#          --graph-latency-ms 80 --firestore-latency-ms 15 --compare benchmarks/results/anterior.json
+# ==========================================================
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import subprocess
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'api'))
+from graph_api_stub import GraphAPIStub
+from fake_firestore import FakeFirestore, install
+from fake_sheets import FakeWorksheet
+
+ADMIN_NUMBER = '51999000000'
+PRODUCT_ID = 'collar-girasol-radiant-01'
+IMAGE = object()  # marcador: el cliente envía una imagen (comprobante)
+YES, OFFER = ("si", "Sí"), ("oferta", "Oferta")  # respuestas con botón (id, título)
+
+SCENARIOS = {
+    "embudo_lima": ["Hola, quiero el collar girasol", "Es para mí", YES, "continuar", "Lima", "Miraflores",
+                    "Ana Pérez, Av. Larco 123, Dpto 4, frente al parque", YES, YES, IMAGE],
+    "embudo_provincia": ["collar girasol", "Es un regalo", "si", OFFER, "provincia", "Arequipa, Arequipa", "si",
+                         "si", "Luis Quispe, 45678912, Agencia Shalom Av. Ejército 500", "si", IMAGE],
+    "faq": ["¿Cuál es el precio?", "¿Hacen envío a provincia?", "¿De qué material es? tengo alergia"],
+    "cancelacion": ["Hola, me interesa el collar girasol", "Es un regalo", "ya no quiero, gracias"],
+    "comprobante_saldo": [IMAGE],
+}
+DEFAULT_MIX = "embudo_lima=3,embudo_provincia=3,faq=2,cancelacion=1,comprobante_saldo=1"
+
+BUSINESS_RULES = {
+    "adelanto_shalom": 20, "adelanto_lima_delivery": 10, "yape_numero": "999 888 777",
+    "distritos_cobertura_delivery": ["Miraflores", "San Isidro", "Surco", "La Victoria", "Lince"],
+    "distritos_lima_total": ["Miraflores", "San Isidro", "Surco", "La Victoria", "Lince", "Carabayllo", "Ancón"],
+    "abreviaturas_distritos": {"sjl": "San Juan de Lurigancho"},
+    "mensaje_dia_habil": "mañana", "mensaje_fin_semana": "el Lunes", "horario_entrega_lima": "10am y 6pm",
+}
+FAQ_RESPONSES = {
+    "precio": "El collar cuesta S/ 69.00 con envío gratis.", "envio": "Enviamos a todo el Perú.",
+    "pago": "Aceptamos Yape, Plin y contraentrega en Lima.", "material": "Acero quirúrgico hipoalergénico.",
+    "stock": "¡Sí tenemos stock!",
+}
+
+
+def seed(fake, receipt_customers):
+    fake.data["configuracion/reglas_envio"] = dict(BUSINESS_RULES)
+    fake.data["configuracion/respuestas_faq"] = dict(FAQ_RESPONSES)
+    fake.data[f"productos/{PRODUCT_ID}"] = {
+        "activo": True, "nombre": "Collar Mágico Girasol Radiant", "precio_base": 69.0,
+        "descripcion_corta": "cambia de color con tu energía.",
+        "imagenes": {"principal": "https://example.com/girasol.jpg", "empaque": "https://example.com/caja.jpg",
+                     "upsell": "https://example.com/oferta.jpg"},
+        "detalles": {"material": "Acero quirúrgico", "empaque": "Caja de regalo"},
+    }
+    # Clientes con un pedido pendiente de saldo: su imagen es el comprobante final.
+    for wa_id in receipt_customers:
+        sale_id = f"venta-{wa_id}"
+        fake.data[f"ventas/{sale_id}"] = {"id_venta": sale_id, "cliente_id": wa_id, "estado_pedido": "Adelanto Pagado"}
+        fake.data[f"clientes/{wa_id}"] = {"nombre_perfil_wa": f"Cliente {wa_id}", "pedido_abierto": sale_id}
+
+
+def webhook_payload(wa_id, body):
+    message = {"from": wa_id, "id": f"wamid.{uuid.uuid4().hex}", "timestamp": str(int(time.time()))}
+    if body is IMAGE:
+        message.update(type="image", image={"id": f"media-{uuid.uuid4().hex[:12]}", "mime_type": "image/jpeg"})
+    elif isinstance(body, tuple):
+        message.update(type="interactive", interactive={"type": "button_reply",
+                                                        "button_reply": {"id": body[0], "title": body[1]}})
+    else:
+        message.update(type="text", text={"body": body})
+    return {"object": "whatsapp_business_account", "entry": [{"id": "WABA", "changes": [{"field": "messages", "value": {
+        "messaging_product": "whatsapp", "metadata": {"phone_number_id": "1000"},
+        "contacts": [{"wa_id": wa_id, "profile": {"name": f"Cliente {wa_id[-4:]}"}}], "messages": [message]}}]}]}
+
+
+class Pacer:
+    # Ritmo de llegada abierto: el mensaje i sale en start + i / rate (rate=0: sin límite).
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_at = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            slot, self.next_at = self.next_at, max(self.next_at, time.perf_counter()) + self.interval
+        if (pause := slot - time.perf_counter()) > 0:
+            time.sleep(pause)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in SCENARIOS:
+            raise SystemExit(f"Escenario desconocido: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    customers = [(f"5198{i:07d}", rng.choices(names, weights)[0]) for i in range(args.customers)]
+
+    stub = GraphAPIStub(latency_s=args.graph_latency_ms / 1000).start()
+    os.environ.update({'WHATSAPP_ACCESS_TOKEN': 'bench', 'WHATSAPP_PHONE_NUMBER_ID': '1000',
+                       'WHATSAPP_GRAPH_API_URL': stub.base_url, 'ADMIN_WHATSAPP_NUMBER': ADMIN_NUMBER,
+                       'MAKE_SECRET_TOKEN': 'bench-token'})
+    fake = install(FakeFirestore(latency_s=args.firestore_latency_ms / 1000))
+    seed(fake, [wa_id for wa_id, scenario in customers if scenario == "comprobante_saldo"])
+    worksheet = FakeWorksheet(latency_s=args.sheets_latency_ms / 1000)
+
+    import bot_sheets
+    bot_sheets._worksheet = worksheet
+    import index
+    from bot_outbox import get_outbound_scheduler
+    from bot_utils import send_whatsapp_message
+    from bot_coalesce import coalescer
+
+    fake.reset_stats()
+    pacer = Pacer(args.rate)
+    work = list(customers)
+    work_lock = threading.Lock()
+    latencies, errors = {}, []
+
+    def client():
+        http = index.app.test_client()
+        while True:
+            with work_lock:
+                if not work:
+                    return
+                wa_id, scenario = work.pop(0)
+            # Cada cliente conversa en orden: el siguiente mensaje sale tras la respuesta al anterior.
+            for body in SCENARIOS[scenario]:
+                pacer.wait()
+                t0 = time.perf_counter()
+                response = http.post('/api/webhook', json=webhook_payload(wa_id, body))
+                elapsed = time.perf_counter() - t0
+                with work_lock:
+                    latencies.setdefault(scenario, []).append(elapsed)
+                    if response.status_code != 200:
+                        errors.append((wa_id, response.status_code))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, name=f"cliente-{i}") for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    webhook_s = time.perf_counter() - started
+    # Lo que quedó en segundo plano (envíos a la Graph API y exportación a Sheets) también cuenta.
+    get_outbound_scheduler(send_whatsapp_message).flush(timeout=600)
+    bot_sheets.order_exporter.flush()
+    drained_s = time.perf_counter() - started
+    stub.stop()
+
+    all_latencies = sorted(v for values in latencies.values() for v in values)
+    messages = len(all_latencies)
+    funnels = [wa_id for wa_id, scenario in customers if scenario.startswith("embudo")]
+    sold = {d.get('cliente_id') for path, d in fake.data.items() if path.startswith('ventas/')}
+    sheets_calls = sum(worksheet.calls.values())
+
+    def summary(values):
+        values = sorted(values)
+        return {"mensajes": len(values), "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2), "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2) if values else 0.0}
+
+    return {
+        "fecha": datetime.now().isoformat(timespec='seconds'),
+        "revision": git_revision(),
+        "parametros": {k: getattr(args, k) for k in ('customers', 'concurrency', 'rate', 'mix', 'seed',
+                                                     'graph_latency_ms', 'firestore_latency_ms', 'sheets_latency_ms')},
+        "mensajes": messages,
+        "errores_http": len(errors),
+        "throughput_msg_s": round(messages / webhook_s, 2) if webhook_s else 0.0,
+        "duracion_webhook_s": round(webhook_s, 3),
+        "duracion_con_envios_s": round(drained_s, 3),
+        "latencia": summary(all_latencies),
+        "latencia_por_escenario": {name: summary(values) for name, values in sorted(latencies.items())},
+        "llamadas_externas": {
+            "graph_api": stub.count(), "firestore_round_trips": fake.stats["round_trips"],
+            "firestore_por_operacion": dict(fake.ops), "sheets": sheets_calls,
+        },
+        "llamadas_por_mensaje": {
+            "graph_api": round(stub.count() / messages, 3) if messages else 0.0,
+            "firestore": round(fake.stats["round_trips"] / messages, 3) if messages else 0.0,
+            "sheets": round(sheets_calls / messages, 3) if messages else 0.0,
+        },
+        "embudos_completados": f"{len(sold & set(funnels))}/{len(funnels)}",
+        "agrupacion": dict(coalescer.stats, ahorrados_por_venta=round(
+            coalescer.stats["ahorrados_en_ventas"] / coalescer.stats["ventas"], 2) if coalescer.stats["ventas"] else 0.0),
+    }
+
+
+def print_report(result, previous=None):
+    lat = result["latencia"]
+    print(f"Mensajes: {result['mensajes']}  errores HTTP: {result['errores_http']}  "
+          f"embudos con venta: {result['embudos_completados']}")
+    print(f"Throughput: {result['throughput_msg_s']} msg/s  "
+          f"(webhook {result['duracion_webhook_s']} s, con envíos pendientes {result['duracion_con_envios_s']} s)")
+    print(f"Latencia webhook: p50 {lat['p50_ms']} ms  p95 {lat['p95_ms']} ms  p99 {lat['p99_ms']} ms  máx {lat['max_ms']} ms")
+    for name, s in result["latencia_por_escenario"].items():
+        print(f"  {name:<18} n={s['mensajes']:<5} p50 {s['p50_ms']:>8} ms  p95 {s['p95_ms']:>8} ms")
+    print(f"Llamadas externas por mensaje: {result['llamadas_por_mensaje']}")
+    print(f"Firestore por operación: {result['llamadas_externas']['firestore_por_operacion']}")
+    grouping = result["agrupacion"]
+    print(f"Agrupación: {grouping['mensajes']} mensajes -> {grouping['envios']} envíos "
+          f"({grouping['ahorrados']} ahorrados; {grouping['ahorrados_por_venta']} por venta completada)")
+    if previous:
+        print(f"\nComparación con {previous.get('revision') or '?'} ({previous.get('fecha')}):")
+        pairs = [("throughput_msg_s", result["throughput_msg_s"], previous.get("throughput_msg_s"))]
+        pairs += [(k, result["latencia"][k], previous.get("latencia", {}).get(k)) for k in ("p50_ms", "p95_ms", "p99_ms")]
+        pairs += [(f"{k}/msg", v, previous.get("llamadas_por_mensaje", {}).get(k)) for k, v in result["llamadas_por_mensaje"].items()]
+        for label, now, before in pairs:
+            if before:
+                print(f"  {label:<18} {before:>10} -> {now:>10}  ({(now - before) / before * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--customers', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=8, help="Conversaciones simultáneas")
+    parser.add_argument('--rate', type=float, default=0.0, help="Mensajes por segundo (0 = sin límite)")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Pesos por escenario ({', '.join(SCENARIOS)})")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--graph-latency-ms', type=float, default=80.0)
+    parser.add_argument('--firestore-latency-ms', type=float, default=15.0)
+    parser.add_argument('--sheets-latency-ms', type=float, default=300.0)
+    parser.add_argument('--output', default=None, help="Archivo JSON de resultados (por defecto benchmarks/results/)")
+    parser.add_argument('--compare', default=None, help="Resultado anterior (JSON) para comparar")
+    args = parser.parse_args()
+
+    result = run(args)
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+    print_report(result, previous)
+
+    output = args.output or os.path.join(BENCH_DIR, 'results',
+                                         f"webhook_load_{datetime.now():%Y%m%d-%H%M%S}_{result['revision'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {output}")
+    sys.exit(1 if result["errores_http"] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - FIRESTORE FALSO EN MEMORIA
+# Imita el subconjunto del cliente de Firestore que usa el bot: documentos
+# (get/set/update/delete/create), consultas simples, get_all y WriteBatch
+# atómico. Cuenta los round-trips y permite inyectar latencia y fallos.
+#
+# Uso: install(fake) hace que bot_db.get_db() devuelva el falso.
+# ==========================================================
+import copy
+import time
+import uuid
+import threading
+from datetime import datetime, timezone
+
+try:
+    from google.api_core.exceptions import AlreadyExists
+except ImportError:  # sin google-api-core instalado
+    class AlreadyExists(Exception):
+        pass
+
+
+def _apply_transforms(current, data):
+    # Resuelve los sentinelas de Firestore (SERVER_TIMESTAMP, Increment, DELETE_FIELD).
+    result = dict(current or {})
+    for key, value in data.items():
+        kind = type(value).__name__
+        if kind == 'Sentinel' and 'DELETE' in repr(value).upper():
+            result.pop(key, None)
+        elif kind == 'Sentinel':
+            result[key] = datetime.now(timezone.utc)
+        elif kind == 'Increment':
+            result[key] = (result.get(key) or 0) + value.value
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class FakeDocumentReference:
+    def __init__(self, db, collection, doc_id):
+        self._db, self.collection_name, self.id = db, collection, doc_id
+
+    @property
+    def path(self):
+        return f"{self.collection_name}/{self.id}"
+
+    def get(self):
+        self._db._round_trip('get')
+        with self._db.lock:
+            return FakeSnapshot(self, copy.deepcopy(self._db.data.get(self.path)))
+
+    def set(self, data, merge=False):
+        self._db._round_trip('set')
+        with self._db.lock:
+            self._db._write(self.path, data, merge)
+
+    def update(self, data):
+        self._db._round_trip('update')
+        with self._db.lock:
+            if self.path not in self._db.data:
+                raise KeyError(f"No document to update: {self.path}")
+            self._db._write(self.path, data, True)
+
+    def create(self, data):
+        self._db._round_trip('create')
+        with self._db.lock:
+            if self.path in self._db.data:
+                raise AlreadyExists(f"Document already exists: {self.path}")
+            self._db._write(self.path, data, False)
+
+    def delete(self, option=None):
+        self._db._round_trip('delete')
+        with self._db.lock:
+            self._db.data.pop(self.path, None)
+
+
+class FakeQuery:
+    OPS = {'==': lambda a, b: a == b, '!=': lambda a, b: a != b, '<': lambda a, b: a is not None and a < b,
+           '<=': lambda a, b: a is not None and a <= b, '>': lambda a, b: a is not None and a > b,
+           '>=': lambda a, b: a is not None and a >= b, 'in': lambda a, b: a in b}
+
+    def __init__(self, db, collection, filters=(), order=(), limit_n=None, start_after_values=None):
+        self._db, self.collection_name = db, collection
+        self.filters, self.order, self.limit_n, self.start_after_values = list(filters), list(order), limit_n, start_after_values
+
+    def _clone(self, **changes):
+        params = dict(filters=self.filters, order=self.order, limit_n=self.limit_n, start_after_values=self.start_after_values)
+        params.update(changes)
+        return FakeQuery(self._db, self.collection_name, **params)
+
+    def where(self, field, op, value):
+        return self._clone(filters=self.filters + [(field, op, value)])
+
+    def order_by(self, field, direction='ASCENDING'):
+        return self._clone(order=self.order + [(field, str(direction).upper().endswith('DESCENDING'))])
+
+    def limit(self, n):
+        return self._clone(limit_n=n)
+
+    def select(self, field_paths):
+        # Proyección: el falso devuelve el documento completo.
+        return self._clone()
+
+    def count(self):
+        return FakeCountQuery(self)
+
+    def start_after(self, snapshot_or_values):
+        return self._clone(start_after_values=snapshot_or_values)
+
+    def _after_cursor(self, data, values):
+        for field, descending in self.order:
+            current, cursor = data.get(field), values.get(field)
+            if current != cursor:
+                return current < cursor if descending else current > cursor
+        return False
+
+    def _matching(self):
+        prefix = self.collection_name + '/'
+        with self._db.lock:
+            docs = [(path[len(prefix):], copy.deepcopy(d)) for path, d in self._db.data.items()
+                    if path.startswith(prefix) and '/' not in path[len(prefix):]]
+        docs = [(i, d) for i, d in docs if all(self.OPS[op](d.get(f), v) for f, op, v in self.filters)]
+        for field, descending in reversed(self.order):
+            docs.sort(key=lambda item: (item[1].get(field) is None, item[1].get(field) if field != '__name__' else item[0]),
+                      reverse=descending)
+        if isinstance(self.start_after_values, dict):
+            # Cursor por valores de los campos de order_by.
+            docs = [(i, d) for i, d in docs if self._after_cursor(d, self.start_after_values)]
+        elif self.start_after_values is not None:
+            cursor_id = getattr(self.start_after_values, 'id', None)
+            ids = [i for i, _ in docs]
+            if cursor_id in ids:
+                docs = docs[ids.index(cursor_id) + 1:]
+        if self.limit_n is not None:
+            docs = docs[:self.limit_n]
+        return [FakeSnapshot(FakeDocumentReference(self._db, self.collection_name, i), d) for i, d in docs]
+
+    def get(self):
+        self._db._round_trip('query')
+        return self._matching()
+
+    def stream(self):
+        return iter(self.get())
+
+
+class FakeCountQuery:
+    class _Result:
+        def __init__(self, value):
+            self.value = value
+
+    def __init__(self, query):
+        self._query = query
+
+    def get(self):
+        self._query._db._round_trip('count')
+        return [[self._Result(len(self._query._matching()))]]
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db, name):
+        super().__init__(db, name)
+
+    def document(self, doc_id=None):
+        return FakeDocumentReference(self._db, self.collection_name, doc_id or uuid.uuid4().hex)
+
+
+class FakeWriteBatch:
+    def __init__(self, db):
+        self._db = db
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(('set', ref, data, merge))
+
+    def update(self, ref, data, option=None):
+        self._ops.append(('update', ref, data, True))
+
+    def delete(self, ref, option=None):
+        self._ops.append(('delete', ref, None, False))
+
+    def create(self, ref, data):
+        self._ops.append(('create', ref, data, False))
+
+    def commit(self):
+        self._db._round_trip('commit')
+        with self._db.lock:
+            # Se valida todo antes de escribir nada: semántica todo-o-nada.
+            for op, ref, _, _ in self._ops:
+                if op == 'create' and ref.path in self._db.data:
+                    raise AlreadyExists(f"Document already exists: {ref.path}")
+                if op == 'update' and ref.path not in self._db.data:
+                    raise KeyError(f"No document to update: {ref.path}")
+            for op, ref, data, merge in self._ops:
+                if op == 'delete':
+                    self._db.data.pop(ref.path, None)
+                else:
+                    self._db._write(ref.path, data, merge)
+        self._db.stats['escrituras_en_lote'] += len(self._ops)
+        return [None] * len(self._ops)
+
+
+class FakeFirestore:
+    def __init__(self, latency_s=0.0):
+        self.data = {}
+        self.latency_s = latency_s
+        self.fail_next = 0  # los próximos N round-trips lanzan error
+        self.lock = threading.RLock()
+        self.stats = {'round_trips': 0, 'escrituras_en_lote': 0}
+        self.ops = {}
+
+    def _round_trip(self, op):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        with self.lock:
+            self.stats['round_trips'] += 1
+            self.ops[op] = self.ops.get(op, 0) + 1
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                raise RuntimeError(f"Fallo simulado de Firestore en '{op}'")
+
+    def _write(self, path, data, merge):
+        self.data[path] = _apply_transforms(self.data.get(path) if merge else None, data)
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def document(self, path):
+        collection, doc_id = path.split('/', 1)
+        return FakeDocumentReference(self, collection, doc_id)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def write_option(self, **kwargs):
+        return None
+
+    def get_all(self, references):
+        self._round_trip('get_all')
+        with self.lock:
+            return [FakeSnapshot(ref, copy.deepcopy(self.data.get(ref.path))) for ref in references]
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {'round_trips': 0, 'escrituras_en_lote': 0}
+            self.ops = {}
+
+
+def install(fake):
+    # Todos los módulos del bot obtienen la base con bot_db.get_db().
+    from bot_db import override_db
+    override_db(fake)
+    return fake
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - HOJA DE CÁLCULO FALSA PARA PRUEBAS LOCALES
+# Imita la parte de gspread.Worksheet que usa el bot (append_row(s),
+# get_values) con latencia configurable y fallos inyectables.
+# ==========================================================
+import time
+import threading
+
+
+class FakeWorksheet:
+    def __init__(self, latency_s=0.0, fail_next=0):
+        self.rows = []
+        self.latency_s = latency_s
+        self.fail_next = fail_next  # cuántas llamadas de escritura fallarán a continuación
+        self.calls = {"append_row": 0, "append_rows": 0, "get_values": 0}
+        self.lock = threading.Lock()
+
+    def _write(self, method, rows):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        with self.lock:
+            self.calls[method] += 1
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                raise RuntimeError("APIError: [429] Quota exceeded (simulado)")
+            self.rows.extend(list(r) for r in rows)
+
+    def append_row(self, values, **kwargs):
+        self._write("append_row", [values])
+
+    def append_rows(self, values, **kwargs):
+        self._write("append_rows", values)
+
+    def get_values(self, range_name=None, **kwargs):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        with self.lock:
+            self.calls["get_values"] += 1
+            if range_name == 'L:O':
+                return [row[11:15] for row in self.rows if len(row) > 11]
+            return [list(r) for r in self.rows]
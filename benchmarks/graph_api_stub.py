@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# ==========================================================
+# BOT DAAQUI - SIMULADOR LOCAL DE LA GRAPH API DE WHATSAPP
+# Responde POST /<version>/<phone_id>/messages con una latencia configurable
+# y cuenta las llamadas recibidas. Sirve para medir sin tocar graph.facebook.com.
+# También simula los medios: GET /<version>/<media_id> devuelve la URL y
+# GET /media/<media_id> el archivo por bloques (chunked).
+#
+# Uso independiente:  python benchmarks/graph_api_stub.py --port 8089 --latency-ms 120
+# Luego: WHATSAPP_GRAPH_API_URL=http://127.0.0.1:8089/v20.0
+# ==========================================================
+import json
+import time
+import hashlib
+import uuid
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class GraphAPIStub:
+    def __init__(self, host='127.0.0.1', port=0, latency_s=0.0):
+        self.latency_s = latency_s
+        self.lock = threading.Lock()
+        self.messages = []  # (monotonic, to, payload) en orden de llegada
+        self.media = {}     # media_id -> (bytes, mime_type)
+        self.media_downloads = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                if stub.latency_s:
+                    time.sleep(stub.latency_s)
+                with stub.lock:
+                    stub.messages.append((time.monotonic(), payload.get('to'), payload))
+                body = json.dumps({"messaging_product": "whatsapp",
+                                   "contacts": [{"input": payload.get('to'), "wa_id": payload.get('to')}],
+                                   "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}]}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, status, data):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parts = self.path.split('?')[0].strip('/').split('/')
+                with stub.lock:
+                    media = stub.media.get(parts[-1])
+                if media is None or len(parts) != 2:
+                    return self._send_json(404, {"error": {"message": "Unknown media", "code": 100}})
+                content, mime_type = media
+                if parts[0] != 'media':
+                    host, port = stub.server.server_address[:2]
+                    return self._send_json(200, {"messaging_product": "whatsapp", "id": parts[1],
+                                                 "url": f"http://{host}:{port}/media/{parts[1]}",
+                                                 "mime_type": mime_type, "file_size": len(content),
+                                                 "sha256": hashlib.sha256(content).hexdigest()})
+                if stub.latency_s:
+                    time.sleep(stub.latency_s)
+                with stub.lock:
+                    stub.media_downloads += 1
+                self.send_response(200)
+                self.send_header('Content-Type', mime_type)
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for i in range(0, len(content), 32 * 1024):
+                    chunk = content[i:i + 32 * 1024]
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v20.0"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_media(self, content, mime_type='image/jpeg', media_id=None):
+        media_id = media_id or uuid.uuid4().hex
+        with self.lock:
+            self.media[media_id] = (content, mime_type)
+        return media_id
+
+    def count(self):
+        with self.lock:
+            return len(self.messages)
+
+    def messages_for(self, to_number):
+        with self.lock:
+            return [m for m in self.messages if m[1] == to_number]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-ms', type=float, default=100.0)
+    args = parser.parse_args()
+    stub = GraphAPIStub(port=args.port, latency_s=args.latency_ms / 1000)
+    print(f"Graph API simulada en {stub.base_url} (latencia {args.latency_ms} ms)")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()